@@ -0,0 +1,114 @@
+import codecs, json, os
+from typing import AsyncIterable, AsyncIterator
+import aiosqlite
+import httpx
+
+CRTSH_URL = "https://crt.sh/"
+CT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "..", "ct_cache.db")
+BATCH = 500
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS ct_certs(
+  domain TEXT NOT NULL,
+  cert_id INTEGER NOT NULL,
+  name_value TEXT NOT NULL,
+  PRIMARY KEY (domain, cert_id)
+);
+-- Highest cert id of the last fetch that streamed to the end. Rows cached
+-- from a cut-off fetch do not count: older certificates may still be missing.
+CREATE TABLE IF NOT EXISTS ct_sync(
+  domain TEXT PRIMARY KEY,
+  complete_id INTEGER NOT NULL
+);
+"""
+
+async def iter_json_array(chunks:AsyncIterable[bytes])->AsyncIterator:
+    """Yield the elements of a top-level JSON array as its bytes arrive."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, started = "", 0, False
+    async for chunk in chunks:
+        buf += utf8.decode(chunk)
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element still incomplete; wait for more bytes
+            yield obj
+        buf, pos = buf[pos:], 0
+    # Only the closing "]" ends the array; running out of bytes first means a cut-off body.
+    raise ValueError("truncated JSON array")
+
+class CTCache:
+    """Local certificate-transparency cache keyed by (domain, crt.sh cert id)."""
+
+    def __init__(self, path:str=CT_CACHE_PATH):
+        self.path = path
+        self.ready = False
+
+    async def _ensure_schema(self, db):
+        if not self.ready:
+            await db.executescript(SCHEMA)
+            self.ready = True
+
+    async def last_id(self, domain:str)->int:
+        """Cert id up to which every certificate of ``domain`` is cached (0 if none)."""
+        async with aiosqlite.connect(self.path) as db:
+            await self._ensure_schema(db)
+            cur = await db.execute("SELECT complete_id FROM ct_sync WHERE domain=?", (domain,))
+            row = await cur.fetchone()
+        return row[0] if row else 0
+
+    async def mark_complete(self, domain:str, cert_id:int):
+        async with aiosqlite.connect(self.path) as db:
+            await self._ensure_schema(db)
+            await db.execute(
+                "INSERT INTO ct_sync(domain,complete_id) VALUES(?,?) "
+                "ON CONFLICT(domain) DO UPDATE SET complete_id=max(complete_id, excluded.complete_id)",
+                (domain, cert_id))
+            await db.commit()
+
+    async def name_values(self, domain:str)->list[str]:
+        async with aiosqlite.connect(self.path) as db:
+            await self._ensure_schema(db)
+            cur = await db.execute("SELECT name_value FROM ct_certs WHERE domain=?", (domain,))
+            return [r[0] for r in await cur.fetchall()]
+
+    async def add(self, domain:str, rows:list[tuple[int,str]]):
+        if not rows:
+            return
+        async with aiosqlite.connect(self.path) as db:
+            await self._ensure_schema(db)
+            await db.executemany(
+                "INSERT OR IGNORE INTO ct_certs(domain,cert_id,name_value) VALUES(?,?,?)",
+                [(domain, cert_id, nv) for cert_id, nv in rows])
+            await db.commit()
+
+async def stream_crtsh(domain:str, after_id:int=0, url:str|None=None)->AsyncIterator[tuple[int|None,str]]:
+    """Stream (cert_id, name_value) rows for ``%.domain`` newer than ``after_id``.
+
+    crt.sh has no server-side id cursor, so older rows are still transferred
+    but are dropped as they stream past rather than accumulated. Raises on an
+    error status or a cut-off response, so callers can tell a partial fetch.
+    """
+    timeout = httpx.Timeout(20, read=60)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async with client.stream("GET", url or CRTSH_URL, params={"q": f"%.{domain}", "output": "json"},
+                                 headers={"User-Agent": "smbsec-mvp/1.0"}) as r:
+            r.raise_for_status()
+            async for row in iter_json_array(r.aiter_bytes()):
+                cert_id = row.get("id")
+                if cert_id is None or cert_id > after_id:
+                    yield cert_id, row.get("name_value", "")
@@ -1,11 +1,26 @@
-import aiosqlite, asyncio, json, os, time
+import aiosqlite, asyncio, hashlib, json, os, sqlite3, time
+from contextlib import asynccontextmanager
 from . import fix_queue
+from .events import BUS
 
-from .state_transition import state_transition as _state_transition
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data.db")
+DB_READERS = int(os.environ.get("SMBSEC_DB_READERS", 4))
+MAX_ATTEMPTS = int(os.environ.get("SMBSEC_SCAN_MAX_ATTEMPTS", 3))
+FLUSH_ROWS = int(os.environ.get("SMBSEC_DB_FLUSH_ROWS", 500))
+FLUSH_DELAY = float(os.environ.get("SMBSEC_DB_FLUSH_MS", 250)) / 1000
+EVENTS_RETAIN = int(os.environ.get("SMBSEC_EVENTS_RETAIN", 1000))
+BUSY_TIMEOUT_MS = int(os.environ.get("SMBSEC_DB_BUSY_MS", 30000))  # wait for other processes' write transactions
 
-SCHEMA = """
+PRAGMAS = """
 PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout={busy};
+PRAGMA cache_size=-20000;
+PRAGMA mmap_size=268435456;
+PRAGMA temp_store=MEMORY;
+"""
+
+SCHEMA = """
 CREATE TABLE IF NOT EXISTS scans(
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   domain TEXT NOT NULL,
@@ -63,49 +78,424 @@ CREATE TABLE IF NOT EXISTS scope(
 );
 """
 
+# Append-only; the schema version lives in PRAGMA user_version. Version 1 is the
+# original schema, applied with IF NOT EXISTS so pre-migration databases adopt it.
+MIGRATIONS = [
+    SCHEMA,
+    """
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_key ON findings(scan_id, host, ip, port, proto, title);
+    CREATE INDEX IF NOT EXISTS idx_assets_owner ON assets(scan_id, host, ifnull(ip,''));
+    CREATE INDEX IF NOT EXISTS idx_scans_domain ON scans(domain, id);
+    CREATE INDEX IF NOT EXISTS idx_finding_states_scan ON finding_states(scan_id, state, dedupe_key);
+    CREATE TABLE IF NOT EXISTS finding_latest(
+      dedupe_key TEXT PRIMARY KEY,
+      scan_id INTEGER NOT NULL,
+      state TEXT NOT NULL CHECK(state IN ('open','resolved'))
+    ) WITHOUT ROWID;
+    INSERT OR REPLACE INTO finding_latest(dedupe_key, scan_id, state)
+      SELECT dedupe_key, max(scan_id), state FROM finding_states GROUP BY dedupe_key;
+    """,
+    # Stored dedupe keys and their 64-bit fingerprints; backfilled through the
+    # SQL functions every pool connection registers.
+    """
+    ALTER TABLE findings ADD COLUMN dedupe_key TEXT;
+    ALTER TABLE findings ADD COLUMN fingerprint INTEGER;
+    UPDATE findings SET dedupe_key=dedupe_key(host, ip, port, proto, title);
+    UPDATE findings SET fingerprint=fingerprint(dedupe_key);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_fp ON findings(scan_id, fingerprint);
+    ALTER TABLE finding_states ADD COLUMN fingerprint INTEGER;
+    UPDATE finding_states SET fingerprint=fingerprint(dedupe_key);
+    DROP INDEX IF EXISTS idx_finding_states_scan;
+    CREATE INDEX IF NOT EXISTS idx_finding_states_scan_fp ON finding_states(scan_id, state, fingerprint);
+    CREATE INDEX IF NOT EXISTS idx_finding_states_fp ON finding_states(fingerprint, scan_id);
+    CREATE TABLE finding_latest_fp(
+      fingerprint INTEGER PRIMARY KEY,
+      dedupe_key TEXT NOT NULL,
+      scan_id INTEGER NOT NULL,
+      state TEXT NOT NULL CHECK(state IN ('open','resolved'))
+    );
+    INSERT OR REPLACE INTO finding_latest_fp(fingerprint, dedupe_key, scan_id, state)
+      SELECT fingerprint(dedupe_key), dedupe_key, scan_id, state FROM finding_latest ORDER BY scan_id;
+    DROP TABLE finding_latest;
+    ALTER TABLE finding_latest_fp RENAME TO finding_latest;
+    """,
+    # Durable job queue on scans. Scans left 'running' by a dead process get an
+    # expired lease so a worker picks them up again.
+    """
+    ALTER TABLE scans ADD COLUMN profile TEXT NOT NULL DEFAULT 'default';
+    ALTER TABLE scans ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE scans ADD COLUMN lease_owner TEXT;
+    ALTER TABLE scans ADD COLUMN lease_expires REAL;
+    UPDATE scans SET lease_expires=0 WHERE status='running';
+    CREATE INDEX IF NOT EXISTS idx_scans_queue ON scans(status, lease_expires, id);
+    """,
+    # Cancellation, per-scan time limits and live progress. SQLite cannot alter a
+    # CHECK constraint, so scans is rebuilt to allow 'cancelled'.
+    """
+    CREATE TABLE scans_v5(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      domain TEXT NOT NULL,
+      started_at INTEGER NOT NULL,
+      finished_at INTEGER,
+      status TEXT NOT NULL CHECK(status IN ('queued','running','done','error','cancelled')) DEFAULT 'queued',
+      stats_json TEXT NOT NULL DEFAULT '{}',
+      profile TEXT NOT NULL DEFAULT 'default',
+      attempts INTEGER NOT NULL DEFAULT 0,
+      lease_owner TEXT,
+      lease_expires REAL,
+      time_limit REAL,
+      cancel_requested INTEGER NOT NULL DEFAULT 0,
+      progress_json TEXT NOT NULL DEFAULT '{}'
+    );
+    INSERT INTO scans_v5(id, domain, started_at, finished_at, status, stats_json, profile, attempts,
+                         lease_owner, lease_expires)
+      SELECT id, domain, started_at, finished_at, status, stats_json, profile, attempts,
+             lease_owner, lease_expires FROM scans;
+    DROP TABLE scans;
+    ALTER TABLE scans_v5 RENAME TO scans;
+    CREATE INDEX IF NOT EXISTS idx_scans_domain ON scans(domain, id);
+    CREATE INDEX IF NOT EXISTS idx_scans_queue ON scans(status, lease_expires, id);
+    """,
+    # Telemetry batches from workers, relayed to /ws by the API processes.
+    """
+    CREATE TABLE IF NOT EXISTS events(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      created_at REAL NOT NULL,
+      payload TEXT NOT NULL
+    );
+    """,
+    # Bumped by every write to a scan's assets or findings; part of the report ETag.
+    """
+    ALTER TABLE scans ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    """,
+    # Keyset pagination of findings; one (scan_id, sort key, id) index per FINDING_SORTS entry.
+    """
+    ALTER TABLE findings ADD COLUMN severity_rank INTEGER GENERATED ALWAYS AS
+      (CASE severity WHEN 'critical' THEN 4 WHEN 'high' THEN 3 WHEN 'medium' THEN 2 WHEN 'low' THEN 1 ELSE 0 END)
+      VIRTUAL;
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_risk ON findings(scan_id, risk_score, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_sev ON findings(scan_id, severity_rank, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_host ON findings(scan_id, host, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_port ON findings(scan_id, coalesce(port,-1), id);
+    """,
+]
+
+def dedupe_key(host:str, ip:str|None, port:int|None, proto:str|None, title:str)->str:
+    return f"{host}|{ip or ''}|{port or ''}|{proto or ''}|{title}"
+
+def fingerprint(key:str)->int:
+    """Signed 64-bit hash of a dedupe key, so it fits an SQLite INTEGER."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+async def _connect(path:str, readonly:bool=False)->aiosqlite.Connection:
+    conn = aiosqlite.connect(path)
+    conn.daemon = True  # a pool that is never closed must not block interpreter exit
+    await conn
+    conn.row_factory = aiosqlite.Row
+    await conn.create_function("dedupe_key", 5, dedupe_key, deterministic=True)
+    await conn.create_function("fingerprint", 1, fingerprint, deterministic=True)
+    await conn.executescript(PRAGMAS.format(busy=BUSY_TIMEOUT_MS) + ("PRAGMA query_only=1;" if readonly else ""))
+    return conn
+
+class Pool:
+    """One writer and ``readers`` reader connections to a WAL database.
+
+    SQLite admits a single writer at a time, so all writes share one
+    connection behind a lock and each ``writer()`` block is one transaction.
+    The lock covers this process only: transactions start with BEGIN
+    IMMEDIATE, so a block that reads before it writes takes the database
+    write lock up front (waiting up to busy_timeout for other processes)
+    instead of failing with "database is locked" when it upgrades.
+    Readers run concurrently on WAL snapshots. The pool serves one event loop
+    at a time and rebinds its lock and queue if used from a new one.
+    """
+
+    def __init__(self, path:str, readers:int=DB_READERS):
+        self.path = str(path)
+        self.size = max(1, readers)
+        self.write_conn:aiosqlite.Connection|None = None
+        self.readers:list[aiosqlite.Connection] = []
+        self.loop = None
+
+    async def open(self):
+        self.write_conn = await _connect(self.path)
+        self.readers = [await _connect(self.path, readonly=True) for _ in range(self.size)]
+
+    async def close(self):
+        for conn in [self.write_conn, *self.readers]:
+            if conn is not None:
+                await conn.close()
+        self.write_conn, self.readers = None, []
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.write_lock = asyncio.Lock()
+            self.idle:asyncio.Queue = asyncio.Queue()
+            for conn in self.readers:
+                self.idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self, mode:str="IMMEDIATE"):
+        self._bind()
+        async with self.write_lock:
+            await self.write_conn.execute(f"BEGIN {mode}")
+            try:
+                yield self.write_conn
+            except BaseException:
+                await self.write_conn.rollback()
+                raise
+            await self.write_conn.commit()
+
+    @asynccontextmanager
+    async def reader(self):
+        self._bind()
+        idle = self.idle
+        conn = await idle.get()
+        try:
+            yield conn
+        finally:
+            idle.put_nowait(conn)
+
+POOL:Pool|None = None
+
+async def open_pool(path=None)->Pool:
+    """(Re)open the module pool on ``path`` (default ``DB_PATH``)."""
+    global POOL
+    await close_pool()
+    pool = Pool(path or DB_PATH)
+    await pool.open()
+    POOL = pool
+    return pool
+
+async def close_pool():
+    global POOL
+    pool, POOL = POOL, None
+    if pool is not None:
+        await pool.close()
+
+async def _pool()->Pool:
+    # Opened lazily too, so scripts and tests that swap DB_PATH keep working.
+    if POOL is None or POOL.path != str(DB_PATH):
+        return await open_pool()
+    return POOL
+
+@asynccontextmanager
+async def writer():
+    async with (await _pool()).writer() as conn:
+        yield conn
+
+@asynccontextmanager
+async def reader():
+    async with (await _pool()).reader() as conn:
+        yield conn
+
+def _statements(script:str):
+    """Split a migration script into statements (trigger bodies stay whole)."""
+    buf = ""
+    for part in script.split(";"):
+        buf += part + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \t\n;"):
+                yield buf.strip()
+            buf = ""
+
+async def migrate(db:aiosqlite.Connection)->int:
+    """Apply pending ``MIGRATIONS`` in the caller's transaction; return the version.
+
+    Statements run one by one rather than through ``executescript``, which
+    would commit the transaction and let another process migrate alongside.
+    """
+    cur = await db.execute("PRAGMA user_version")
+    version = (await cur.fetchone())[0]
+    for v in range(version, len(MIGRATIONS)):
+        for stmt in _statements(MIGRATIONS[v]):
+            await db.execute(stmt)
+        await db.execute(f"PRAGMA user_version={v + 1}")
+    return len(MIGRATIONS)
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript(SCHEMA)
-        await db.commit()
+    pool = await open_pool()
+    # Exclusive: processes starting together migrate one at a time, each
+    # reading user_version after the previous one committed.
+    async with pool.writer("EXCLUSIVE") as db:
+        await migrate(db)
+
+ASSET_INSERT = "INSERT OR IGNORE INTO assets(scan_id,host,ip,owner_email,criticality,data_class,first_seen,last_seen) VALUES(?,?,?,?,?,?,?,?)"
+ASSET_UPDATE = """
+UPDATE assets SET last_seen=?,
+    owner_email=COALESCE(?,owner_email),
+    criticality=COALESCE(?,criticality),
+    data_class=COALESCE(?,data_class)
+WHERE scan_id=? AND host=? AND ifnull(ip,'')=ifnull(?, '')
+"""
+BUMP_REVISION = "UPDATE scans SET revision=revision+1 WHERE id=?"
+# After a scan's states are deleted: point its finding_latest rows back at the
+# newest state left; rows with no history left are deleted separately.
+REBUILD_LATEST = """
+INSERT OR REPLACE INTO finding_latest(fingerprint, dedupe_key, scan_id, state)
+  SELECT s.fingerprint, s.dedupe_key, s.scan_id, s.state FROM finding_latest l
+  JOIN finding_states s ON s.fingerprint=l.fingerprint AND s.scan_id=(
+    SELECT max(scan_id) FROM finding_states WHERE fingerprint=l.fingerprint)
+  WHERE l.scan_id=?
+"""
+
+# Sort name -> key expression, each matching an index; the same SQL runs on Postgres.
+FINDING_SORTS = {"risk_score": "risk_score", "severity": "severity_rank", "host": "host", "port": "coalesce(port,-1)"}
+
+def findings_page_query(scan_id:int, sort:str='risk_score', desc:bool=True, after:tuple|None=None,
+                        limit:int=100, severity:list[str]|None=None, host:str|None=None,
+                        port:int|None=None, mark=lambda i: "?")->tuple[str,list]:
+    """One keyset page of a scan's findings ordered by (sort key, id).
+
+    ``after`` is the (sort_key, id) of the previous page's last row; rows
+    carry their key as ``sort_key``. ``mark(n)`` renders the n-th placeholder.
+    """
+    expr = FINDING_SORTS[sort]
+    params:list = []
+
+    def arg(v)->str:
+        params.append(v)
+        return mark(len(params))
+
+    where = [f"scan_id={arg(scan_id)}"]
+    if severity:
+        where.append(f"severity IN ({','.join(arg(v) for v in severity)})")
+    if host is not None:
+        where.append(f"host={arg(host)}")
+    if port is not None:
+        where.append(f"port={arg(port)}")
+    if after is not None:
+        where.append(f"({expr}, id) {'<' if desc else '>'} ({arg(after[0])}, {arg(after[1])})")
+    d = "DESC" if desc else "ASC"
+    return (f"SELECT *, {expr} AS sort_key FROM findings WHERE {' AND '.join(where)}"
+            f" ORDER BY {expr} {d}, id {d} LIMIT {arg(limit)}", params)
+FINDING_INSERT = """INSERT INTO findings
+    (scan_id,host,ip,port,proto,severity,title,description,evidence_json,risk_score,controls_json,created_at,
+     dedupe_key,fingerprint)
+    VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
 
 async def create_scan(domain:str)->int:
     now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         cur = await db.execute("INSERT INTO scans(domain,started_at,status) VALUES(?,?,?)",
                                (domain, now, 'running'))
-        await db.commit()
         return cur.lastrowid
 
-async def finish_scan(scan_id:int, status:str, stats:dict):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE scans SET finished_at=?, status=?, stats_json=? WHERE id=?",
-                         (int(time.time()), status, json.dumps(stats), scan_id))
-        await db.commit()
+async def finish_scan(scan_id:int, status:str, stats:dict, progress:dict|None=None):
+    """Record the outcome of a scan; a scan cancelled meanwhile stays cancelled."""
+    async with writer() as db:
+        await db.execute("UPDATE scans SET finished_at=?, status=?, stats_json=?, lease_owner=NULL,"
+                         " lease_expires=NULL, progress_json=coalesce(?, progress_json)"
+                         " WHERE id=? AND status<>'cancelled'",
+                         (int(time.time()), status, json.dumps(stats),
+                          json.dumps(progress) if progress is not None else None, scan_id))
+
+async def enqueue_scan(domain:str, profile:str='default', time_limit:float|None=None)->int:
+    async with writer() as db:
+        cur = await db.execute(
+            "INSERT INTO scans(domain,started_at,status,profile,time_limit) VALUES(?,?,'queued',?,?)",
+            (domain, int(time.time()), profile, time_limit))
+        return cur.lastrowid
+
+async def lease_scan(worker:str, lease:float)->dict|None:
+    """Claim the oldest queued scan, or a running one whose lease expired.
+
+    The claim is one UPDATE on the single writer, so concurrent workers in
+    other processes never get the same scan. Expired scans that have used up
+    ``MAX_ATTEMPTS`` are failed, and expired scans with a pending cancel are
+    cancelled, instead of retried.
+    """
+    now = time.time()
+    async with writer() as db:
+        await db.execute(
+            "UPDATE scans SET status='cancelled', finished_at=?, lease_owner=NULL, lease_expires=NULL"
+            " WHERE status='running' AND lease_expires<? AND cancel_requested=1", (int(now), now))
+        await db.execute(
+            "UPDATE scans SET status='error', finished_at=?, stats_json=?, lease_owner=NULL, lease_expires=NULL"
+            " WHERE status='running' AND lease_expires<? AND attempts>=?",
+            (int(now), json.dumps({"error": "worker lost"}), now, MAX_ATTEMPTS))
+        cur = await db.execute(
+            """UPDATE scans SET status='running', attempts=attempts+1, lease_owner=?, lease_expires=?
+               WHERE id=(SELECT id FROM scans WHERE status='queued' OR (status='running' AND lease_expires<?)
+                         ORDER BY id LIMIT 1)
+               RETURNING *""", (worker, now + lease, now))
+        rows = await cur.fetchall()
+    return dict(rows[0]) if rows else None
+
+async def heartbeat_scan(scan_id:int, worker:str, lease:float, progress:dict|None=None)->bool:
+    """Extend ``worker``'s lease and store ``progress``; False once the scan is
+    no longer its to run or a cancel was requested."""
+    async with writer() as db:
+        cur = await db.execute(
+            "UPDATE scans SET lease_expires=?, progress_json=coalesce(?, progress_json)"
+            " WHERE id=? AND lease_owner=? AND status='running' AND cancel_requested=0",
+            (time.time() + lease, json.dumps(progress) if progress is not None else None, scan_id, worker))
+        return cur.rowcount == 1
+
+async def cancel_scan(scan_id:int)->dict|None:
+    """Cancel a queued scan at once; flag a running one for its worker to stop.
+
+    A running scan without a lease (run in the request, e.g. CSPM) has no
+    worker to stop it and is cancelled at once. Returns the updated scan,
+    or None if there is no such scan.
+    """
+    async with writer() as db:
+        await db.execute("UPDATE scans SET status='cancelled', finished_at=? WHERE id=?"
+                         " AND (status='queued' OR (status='running' AND lease_owner IS NULL))",
+                         (int(time.time()), scan_id))
+        await db.execute("UPDATE scans SET cancel_requested=1 WHERE id=? AND status='running'", (scan_id,))
+        cur = await db.execute("SELECT * FROM scans WHERE id=?", (scan_id,))
+        row = await cur.fetchone()
+    return dict(row) if row else None
+
+async def list_active_scans()->list[dict]:
+    async with reader() as db:
+        cur = await db.execute("SELECT id, domain, status, cancel_requested, progress_json FROM scans"
+                               " WHERE status IN ('queued','running') ORDER BY id")
+        return [dict(r) for r in await cur.fetchall()]
+
+async def clear_scan_results(scan_id:int):
+    """Drop what an earlier, interrupted attempt of a scan wrote."""
+    async with writer() as db:
+        for table in ("findings", "assets", "finding_states"):
+            await db.execute(f"DELETE FROM {table} WHERE scan_id=?", (scan_id,))
+        await db.execute(REBUILD_LATEST, (scan_id,))
+        await db.execute("DELETE FROM finding_latest WHERE scan_id=?", (scan_id,))
+        await db.execute(BUMP_REVISION, (scan_id,))
+
+async def add_events(events:list[dict]):
+    """Store one tick's events as a single row, keeping the last ``EVENTS_RETAIN`` rows."""
+    async with writer() as db:
+        cur = await db.execute("INSERT INTO events(created_at,payload) VALUES(?,?)",
+                               (time.time(), json.dumps(events)))
+        await db.execute("DELETE FROM events WHERE id<=?", (cur.lastrowid - EVENTS_RETAIN,))
+
+async def list_events(after_id:int, limit:int=100)->list[tuple[int,list[dict]]]:
+    async with reader() as db:
+        cur = await db.execute("SELECT id, payload FROM events WHERE id>? ORDER BY id LIMIT ?", (after_id, limit))
+        return [(r[0], json.loads(r[1])) for r in await cur.fetchall()]
+
+async def last_event_id()->int:
+    async with reader() as db:
+        cur = await db.execute("SELECT coalesce(max(id),0) FROM events")
+        return (await cur.fetchone())[0]
 
 async def upsert_asset(scan_id:int, host:str, ip:str|None, *, owner_email:str|None=None,
                        criticality:int|None=None, data_class:str|None=None):
     now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO assets(scan_id,host,ip,owner_email,criticality,data_class,first_seen,last_seen) VALUES(?,?,?,?,?,?,?,?)",
-            (scan_id, host, ip, owner_email, criticality, data_class, now, now))
-        await db.execute(
-            """
-            UPDATE assets SET last_seen=?,
-                owner_email=COALESCE(?,owner_email),
-                criticality=COALESCE(?,criticality),
-                data_class=COALESCE(?,data_class)
-            WHERE scan_id=? AND host=? AND ifnull(ip,'')=ifnull(?, '')
-            """,
-            (now, owner_email, criticality, data_class, scan_id, host, ip))
-        await db.commit()
+    async with writer() as db:
+        await db.execute(ASSET_INSERT, (scan_id, host, ip, owner_email, criticality, data_class, now, now))
+        await db.execute(ASSET_UPDATE, (now, owner_email, criticality, data_class, scan_id, host, ip))
+        await db.execute(BUMP_REVISION, (scan_id,))
 
 async def add_finding(scan_id:int, host:str, ip:str|None, port:int|None, proto:str|None,
                       severity:str, title:str, description:str, evidence:dict,
                       risk_score:float=0, controls:dict|None=None):
     if controls is None:
         controls = {}
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         owner_email = None
         cur = await db.execute(
             "SELECT owner_email FROM assets WHERE scan_id=? AND host=? AND ifnull(ip,'')=ifnull(?, '')",
@@ -113,135 +503,215 @@ async def add_finding(scan_id:int, host:str, ip:str|None, port:int|None, proto:s
         row = await cur.fetchone()
         if row:
             owner_email = row[0]
-        cur = await db.execute("""INSERT INTO findings
-            (scan_id,host,ip,port,proto,severity,title,description,evidence_json,risk_score,controls_json,created_at)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""",
-            (scan_id,host,ip,port,proto,severity,title,description,json.dumps(evidence),risk_score,json.dumps(controls),int(time.time())))
+        key = dedupe_key(host, ip, port, proto, title)
+        cur = await db.execute(FINDING_INSERT,
+            (scan_id,host,ip,port,proto,severity,title,description,json.dumps(evidence),risk_score,json.dumps(controls),int(time.time()),
+             key,fingerprint(key)))
         finding_id = cur.lastrowid
-        await db.commit()
+        await db.execute(BUMP_REVISION, (scan_id,))
     if severity in ("high", "critical"):
         fix_queue.add(finding_id, owner_email, severity, title, description)
         fix_queue.open_jira_ticket(finding_id, title, description, owner_email)
 
+class ScanWriter:
+    """Per-scan write buffer for assets and findings.
+
+    Rows are flushed with ``executemany`` in one transaction once
+    ``max_rows`` are pending or ``max_delay`` seconds after the first
+    buffered row, and on exit. Owners for high/critical findings are resolved
+    with one join per flush, and fix-queue/Jira side effects and ``BUS``
+    events run only after the flush has committed.
+    """
+
+    def __init__(self, scan_id:int, max_rows:int=FLUSH_ROWS, max_delay:float=FLUSH_DELAY):
+        self.scan_id = scan_id
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.assets:list[tuple] = []
+        self.findings:list[tuple] = []
+        self.lock = asyncio.Lock()
+        self.timer:asyncio.TimerHandle|None = None
+        self.task:asyncio.Task|None = None
+        self.flushes = 0
+        self.severities:dict[str,int] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.task is not None:
+            await self.task  # surface errors from a timed flush
+        await self.flush()
+
+    async def upsert_asset(self, host:str, ip:str|None, *, owner_email:str|None=None,
+                           criticality:int|None=None, data_class:str|None=None):
+        self.assets.append((host, ip, owner_email, criticality, data_class, int(time.time())))
+        await self._added()
+
+    async def add_finding(self, host:str, ip:str|None, port:int|None, proto:str|None,
+                          severity:str, title:str, description:str, evidence:dict,
+                          risk_score:float=0, controls:dict|None=None):
+        key = dedupe_key(host, ip, port, proto, title)
+        self.findings.append((self.scan_id, host, ip, port, proto, severity, title, description,
+                              json.dumps(evidence), risk_score, json.dumps(controls or {}),
+                              int(time.time()), key, fingerprint(key)))
+        await self._added()
+
+    async def _added(self):
+        if len(self.assets) + len(self.findings) >= self.max_rows:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self._timed_flush)
+
+    def _timed_flush(self):
+        self.timer = None
+        self.task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        async with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            assets, self.assets = self.assets, []
+            findings, self.findings = self.findings, []
+            if not assets and not findings:
+                return
+            urgent = await self._write(assets, findings)
+            self.flushes += 1
+            for f in findings:
+                self.severities[f[5]] = self.severities.get(f[5], 0) + 1
+        if findings:
+            BUS.publish("findings", self.scan_id, total=sum(self.severities.values()),
+                        by_severity=dict(self.severities))
+        for finding_id, owner_email, severity, title, description in urgent:
+            fix_queue.add(finding_id, owner_email, severity, title, description)
+            fix_queue.open_jira_ticket(finding_id, title, description, owner_email)
+            BUS.publish("finding", self.scan_id, id=finding_id, severity=severity, title=title)
+
+    async def _write(self, assets:list[tuple], findings:list[tuple])->list[tuple]:
+        """Write one batch in a transaction; return (id, owner, severity, title, description) of urgent findings."""
+        sid = self.scan_id
+        async with writer() as db:
+            await db.executemany(ASSET_INSERT, [(sid, h, ip, o, c, d, now, now)
+                                                for h, ip, o, c, d, now in assets])
+            await db.executemany(ASSET_UPDATE, [(now, o, c, d, sid, h, ip)
+                                                for h, ip, o, c, d, now in assets])
+            # writer() opened this transaction with BEGIN IMMEDIATE, so no other connection or
+            # process can insert findings until commit: this batch gets the ids above the max.
+            cur = await db.execute("SELECT coalesce(max(id),0) FROM findings")
+            first = (await cur.fetchone())[0]
+            await db.executemany(FINDING_INSERT, findings)
+            await db.execute(BUMP_REVISION, (sid,))
+            cur = await db.execute("""
+                SELECT f.id, max(a.owner_email), f.severity, f.title, f.description
+                FROM findings f LEFT JOIN assets a
+                  ON a.scan_id=f.scan_id AND a.host=f.host AND ifnull(a.ip,'')=ifnull(f.ip,'')
+                WHERE f.scan_id=? AND f.id>? AND f.severity IN ('high','critical')
+                GROUP BY f.id ORDER BY f.id""", (sid, first))
+            return [tuple(r) for r in await cur.fetchall()]
+
 async def get_scan(scan_id:int)->dict|None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT * FROM scans WHERE id=?", (scan_id,))
         row = await cur.fetchone()
         return dict(row) if row else None
 
 async def list_scans()->list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT * FROM scans ORDER BY id DESC")
         return [dict(r) for r in await cur.fetchall()]
 
+async def list_findings_page(scan_id:int, sort:str='risk_score', desc:bool=True, after:tuple|None=None,
+                             limit:int=100, severity:list[str]|None=None, host:str|None=None,
+                             port:int|None=None)->list[dict]:
+    sql, params = findings_page_query(scan_id, sort, desc, after, limit, severity, host, port)
+    async with reader() as db:
+        cur = await db.execute(sql, params)
+        return [dict(r) for r in await cur.fetchall()]
+
 async def list_findings(scan_id:int)->list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT * FROM findings WHERE scan_id=?", (scan_id,))
         return [dict(r) for r in await cur.fetchall()]
 
+async def list_assets(scan_id:int)->list[dict]:
+    async with reader() as db:
+        cur = await db.execute("SELECT * FROM assets WHERE scan_id=?", (scan_id,))
+        return [dict(r) for r in await cur.fetchall()]
+
 async def add_connector_aws(role_arn:str, external_id:str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         await db.execute("INSERT INTO connectors(org,kind,role_arn,external_id,created_at) VALUES(?,?,?,?,?)",
                          ('default','aws',role_arn,external_id,int(time.time())))
-        await db.commit()
 
 async def get_connectors(kind:str='aws')->list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT * FROM connectors WHERE kind=?", (kind,))
         return [dict(r) for r in await cur.fetchall()]
 
 
-async def _list_dedupe_keys(scan_id:int)->set[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT host, ip, port, proto, title FROM findings WHERE scan_id=?",
-            (scan_id,),
-        )
-        rows = await cur.fetchall()
-    return {
-        f"{r['host']}|{r['ip'] or ''}|{r['port'] or ''}|{r['proto'] or ''}|{r['title']}"
-        for r in rows
-    }
-
-
-async def _prev_open_keys(scan_id:int)->set[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT domain FROM scans WHERE id=?", (scan_id,))
-        row = await cur.fetchone()
-        if not row:
-            return set()
-        domain = row["domain"]
-        cur = await db.execute(
-            "SELECT id FROM scans WHERE domain=? AND id<? ORDER BY id DESC LIMIT 1",
-            (domain, scan_id),
-        )
-        prev = await cur.fetchone()
-        if not prev:
-            return set()
-        prev_id = prev["id"]
-        cur = await db.execute(
-            "SELECT dedupe_key FROM finding_states WHERE scan_id=? AND state='open'",
-            (prev_id,),
-        )
-        return {r["dedupe_key"] for r in await cur.fetchall()}
+async def _prev_scan_id(db:aiosqlite.Connection, scan_id:int)->int|None:
+    cur = await db.execute(
+        "SELECT p.id FROM scans s JOIN scans p ON p.domain=s.domain AND p.id<s.id"
+        " WHERE s.id=? ORDER BY p.id DESC LIMIT 1", (scan_id,))
+    row = await cur.fetchone()
+    return row[0] if row else None
 
+# Set operations over fingerprints: this scan's findings (:scan) against the
+# previous scan's open states (:prev) and the last state recorded before :scan.
+# finding_latest answers that unless a later scan finished first or this scan
+# is a retry; then the (fingerprint, scan_id) history index does.
+_NEW_SQL = """
+SELECT f.dedupe_key, CASE WHEN l.scan_id IS NULL THEN NULL WHEN l.scan_id<:scan THEN l.state ELSE (
+  SELECT s.state FROM finding_states s WHERE s.fingerprint=f.fingerprint AND s.scan_id<:scan
+  ORDER BY s.scan_id DESC LIMIT 1) END
+FROM findings f
+LEFT JOIN finding_latest l ON l.fingerprint=f.fingerprint
+WHERE f.scan_id=:scan AND f.fingerprint NOT IN (
+  SELECT fingerprint FROM finding_states WHERE scan_id=:prev AND state='open')
+GROUP BY f.fingerprint
+"""
+_RESOLVED_WHERE = """
+WHERE s.scan_id=:prev AND s.state='open' AND NOT EXISTS (
+  SELECT 1 FROM findings f WHERE f.scan_id=:scan AND f.fingerprint=s.fingerprint)
+"""
 
-async def _last_states(scan_id:int)->dict[str,str]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT dedupe_key, state FROM finding_states WHERE scan_id < ? ORDER BY scan_id DESC",
-            (scan_id,),
-        )
+async def compute_state_transitions(scan_id:int)->dict[str,set[str]]:
+    async with writer() as db:
+        args = {"scan": scan_id, "prev": await _prev_scan_id(db, scan_id)}
+        cur = await db.execute(_NEW_SQL, args)
         rows = await cur.fetchall()
-    last:dict[str,str] = {}
-    for r in rows:
-        key = r["dedupe_key"]
-        if key not in last:
-            last[key] = r["state"]
-    return last
-
-
-async def _record_states(scan_id:int, open_keys:set[str], resolved_keys:set[str]):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executemany(
-            "INSERT INTO finding_states(scan_id,dedupe_key,state) VALUES(?,?,?)",
-            [(scan_id, k, 'open') for k in open_keys]
-            + [(scan_id, k, 'resolved') for k in resolved_keys],
-        )
-        await db.commit()
-
+        cur = await db.execute("SELECT s.dedupe_key FROM finding_states s" + _RESOLVED_WHERE, args)
+        resolved = {r[0] for r in await cur.fetchall()}
+        await db.execute(
+            """INSERT INTO finding_states(scan_id,dedupe_key,fingerprint,state)
+               SELECT :scan, dedupe_key, fingerprint, 'open' FROM findings
+               WHERE scan_id=:scan GROUP BY fingerprint""", args)
+        await db.execute(
+            """INSERT INTO finding_states(scan_id,dedupe_key,fingerprint,state)
+               SELECT :scan, s.dedupe_key, s.fingerprint, 'resolved' FROM finding_states s""" + _RESOLVED_WHERE, args)
+        await db.execute(
+            """INSERT INTO finding_latest(fingerprint,dedupe_key,scan_id,state)
+               SELECT fingerprint, dedupe_key, scan_id, state FROM finding_states WHERE scan_id=:scan
+               ON CONFLICT(fingerprint) DO UPDATE SET dedupe_key=excluded.dedupe_key,
+                 scan_id=excluded.scan_id, state=excluded.state
+               WHERE excluded.scan_id >= finding_latest.scan_id""", args)
+    regressed = {key for key, state in rows if state == 'resolved'}
+    new = {key for key, _ in rows} - regressed
+    return {'new': new, 'resolved': resolved, 'regressed': regressed}
 
-async def compute_state_transitions(scan_id:int)->dict[str,set[str]]:
-    curr = await _list_dedupe_keys(scan_id)
-    prev = await _prev_open_keys(scan_id)
-    diff = _state_transition(prev, curr)
-    last = await _last_states(scan_id)
-    regressed = {k for k in diff['new'] if last.get(k) == 'resolved'}
-    new = diff['new'] - regressed
-    await _record_states(scan_id, curr, diff['resolved'])
-    return {'new': new, 'resolved': diff['resolved'], 'regressed': regressed}
 async def add_scope(org:str, kind:str, value:str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer() as db:
         await db.execute("INSERT INTO scope(org,kind,value) VALUES(?,?,?)",
                          (org, kind, value))
-        await db.commit()
 
 async def list_scope(org:str='default')->list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT * FROM scope WHERE org=?", (org,))
         return [dict(r) for r in await cur.fetchall()]
 
 async def domain_in_scope(domain:str, org:str='default')->bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with reader() as db:
         cur = await db.execute("SELECT kind,value FROM scope WHERE org=?", (org,))
         rows = await cur.fetchall()
         domain = domain.lower()
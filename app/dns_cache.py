@@ -0,0 +1,99 @@
+import os, time
+from collections import OrderedDict
+import aiosqlite
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "..", "dns_cache.db")
+DEFAULT_NEG_TTL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dns_cache(
+  name TEXT NOT NULL,
+  rdtype TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  expires_at REAL NOT NULL,
+  PRIMARY KEY (name, rdtype)
+);
+"""
+
+class DNSCache:
+    """Process-wide LRU cache of DNS answers keyed by (name, rdtype).
+
+    Entries expire after the record TTL; negative answers (NXDOMAIN / NODATA)
+    are stored as an empty list for the SOA minimum.
+    """
+
+    def __init__(self, maxsize:int=50000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.entries:OrderedDict[tuple[str,str], tuple[float, tuple[str,...]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(name:str, rdtype:str)->tuple[str,str]:
+        return name.lower().rstrip("."), rdtype.upper()
+
+    def get(self, name:str, rdtype:str)->list[str]|None:
+        key = self._key(name, rdtype)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return list(entry[1])
+
+    def put(self, name:str, rdtype:str, values:list[str], ttl:float):
+        if ttl <= 0:
+            return
+        key = self._key(name, rdtype)
+        self.entries[key] = (self.clock() + ttl, tuple(values))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self)->dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def load(self, path:str=CACHE_PATH):
+        """Warm the cache from SQLite, skipping entries that already expired."""
+        now = self.clock()
+        async with aiosqlite.connect(path) as db:
+            await db.executescript(SCHEMA)
+            cur = await db.execute(
+                "SELECT name, rdtype, answer, expires_at FROM dns_cache WHERE expires_at > ? ORDER BY expires_at",
+                (now,))
+            for name, rdtype, answer, expires_at in await cur.fetchall():
+                values = answer.split("\n") if answer else []
+                self.put(name, rdtype, values, expires_at - now)
+
+    async def save(self, path:str=CACHE_PATH):
+        now = self.clock()
+        rows = [(n, t, "\n".join(v), exp) for (n, t), (exp, v) in self.entries.items() if exp > now]
+        async with aiosqlite.connect(path) as db:
+            await db.executescript(SCHEMA)
+            await db.execute("DELETE FROM dns_cache")
+            await db.executemany(
+                "INSERT INTO dns_cache(name,rdtype,answer,expires_at) VALUES(?,?,?,?)", rows)
+            await db.commit()
+
+def persist_enabled()->bool:
+    return os.environ.get("SMBSEC_DNS_CACHE_PERSIST", "") == "1"
+
+DNS_CACHE = DNSCache(maxsize=int(os.environ.get("SMBSEC_DNS_CACHE_SIZE", 50000)))
@@ -0,0 +1,128 @@
+import asyncio, json, os, time
+from collections import deque
+from typing import Awaitable, Callable
+
+TICK = float(os.environ.get("SMBSEC_WS_TICK_MS", 500)) / 1000
+CLIENT_BUFFER = int(os.environ.get("SMBSEC_WS_BUFFER", 32))
+MAX_EVENTS = int(os.environ.get("SMBSEC_EVENTS_PER_TICK", 500))
+
+# Event types that describe current state rather than something that happened:
+# within a tick only the latest per scan is kept.
+COALESCED = {"scan", "progress", "findings"}
+
+class Subscription:
+    """Bounded per-client frame buffer; a slow client loses its oldest frames."""
+
+    def __init__(self, maxlen:int=CLIENT_BUFFER):
+        self.frames:deque[str] = deque(maxlen=maxlen)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, frame:str):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.ready.set()
+
+    async def get(self)->list[str]:
+        await self.ready.wait()
+        self.ready.clear()
+        frames = list(self.frames)
+        self.frames.clear()
+        return frames
+
+class EventBus:
+    """In-process pub/sub for scan telemetry.
+
+    ``publish`` only appends to the pending tick, so it is safe to call from
+    scanner hot loops. Every ``tick`` seconds the pending events are coalesced,
+    serialized once and the same frame is handed to every subscriber, so
+    each extra dashboard costs one deque append per tick. ``sinks`` get the
+    raw batch too (workers use one to forward events to the API through
+    storage).
+    """
+
+    def __init__(self, tick:float=TICK, max_events:int=MAX_EVENTS):
+        self.tick = tick
+        self.max_events = max_events
+        self.pending:deque[dict] = deque(maxlen=max_events)
+        self.latest:dict[tuple,dict] = {}
+        self.dropped = 0
+        self.ticks = 0
+        self.subscribers:set[Subscription] = set()
+        self.sinks:list[Callable[[list[dict]], Awaitable]] = []
+        self.task:asyncio.Task|None = None
+
+    def publish(self, type:str, scan_id:int|None=None, **data):
+        self.emit({"type": type, "scan_id": scan_id, "ts": round(time.time(), 3), **data})
+
+    def emit(self, event:dict):
+        if event["type"] in COALESCED:
+            self.latest[(event["type"], event["scan_id"])] = event
+            return
+        if len(self.pending) == self.max_events:
+            self.dropped += 1
+        self.pending.append(event)
+
+    def subscribe(self, maxlen:int=CLIENT_BUFFER)->Subscription:
+        sub = Subscription(maxlen)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub:Subscription):
+        self.subscribers.discard(sub)
+
+    def drain(self)->list[dict]:
+        events = [*self.latest.values(), *self.pending]
+        self.latest = {}
+        self.pending.clear()
+        return events
+
+    async def flush(self):
+        """Run one tick: fan the pending batch out to subscribers and sinks."""
+        events = self.drain()
+        if not events:
+            return
+        self.ticks += 1
+        if self.subscribers:
+            frame = json.dumps({"tick": self.ticks, "events": events, "dropped": self.dropped})
+            for sub in list(self.subscribers):
+                sub.put(frame)
+        for sink in self.sinks:
+            try:
+                await sink(events)
+            except Exception:
+                pass  # telemetry must never take a scan down
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.tick)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        task, self.task = self.task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+BUS = EventBus()
+
+async def relay(store, bus:EventBus=BUS, poll:float=TICK):
+    """Republish events other processes stored (``store.add_events``) on ``bus``."""
+    after = await store.last_event_id()
+    while True:
+        await asyncio.sleep(poll)
+        try:
+            for event_id, events in await store.list_events(after):
+                after = event_id
+                for event in events:
+                    bus.emit(event)
+        except Exception:
+            pass
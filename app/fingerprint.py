@@ -0,0 +1,162 @@
+import contextlib, hashlib, importlib.util, re
+import httpcore, httpx
+
+HTTP2 = importlib.util.find_spec("h2") is not None  # optional, enables HTTP/2 on the verifying client
+
+MAX_BODY = 64 * 1024
+USER_AGENT = "smbsec-mvp/1.0"
+TITLE_RE = re.compile(r"<title>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+def pin_name(host:str, ip:str)->str:
+    """Synthetic hostname standing for one (host, ip) pair.
+
+    Connection pools key on the URL origin, so pinning through a per-pair
+    name keeps hosts sharing an IP, and IPs sharing a host, on separate
+    connections with the right SNI.
+    """
+    return hashlib.sha1(f"{host}|{ip}".encode()).hexdigest()[:24] + ".pin.invalid"
+
+class _PinnedBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that connects pinned names straight to their IP."""
+
+    def __init__(self, backend:httpcore.AsyncNetworkBackend):
+        self.backend = backend
+        self.pins:dict[str,str] = {}
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        return await self.backend.connect_tcp(self.pins.get(host, host), port, timeout=timeout,
+                                              local_address=local_address, socket_options=socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
+
+# httpcore errors surfaced as their httpx counterparts, as httpx's own transport does; most specific first.
+_ERRORS = [(getattr(httpcore, name), getattr(httpx, name)) for name in (
+    "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout", "ConnectError", "ReadError",
+    "WriteError", "RemoteProtocolError", "LocalProtocolError", "ProxyError", "UnsupportedProtocol",
+    "TimeoutException", "NetworkError", "ProtocolError")]
+
+@contextlib.contextmanager
+def _httpx_errors(request:httpx.Request):
+    try:
+        yield
+    except Exception as e:
+        for c, h in _ERRORS:
+            if isinstance(e, c):
+                raise h(str(e), request=request) from e
+        raise
+
+class _Stream(httpx.AsyncByteStream):
+    def __init__(self, response:httpcore.Response, request:httpx.Request):
+        self.response = response
+        self.request = request
+
+    async def __aiter__(self):
+        with _httpx_errors(self.request):
+            async for chunk in self.response.aiter_stream():
+                yield chunk
+
+    async def aclose(self):
+        await self.response.aclose()
+
+class _PinnedTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore pool that connects through a _PinnedBackend.
+
+    httpx.AsyncHTTPTransport has no way to pass a network backend, so the
+    pool is built here with httpcore's public ``network_backend`` argument.
+    """
+
+    def __init__(self, backend:_PinnedBackend, verify, http2:bool, limits:httpx.Limits):
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(verify=verify), max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry, http1=True, http2=http2, network_backend=backend)
+
+    async def handle_async_request(self, request:httpx.Request)->httpx.Response:
+        req = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host,
+                             port=request.url.port, target=request.url.raw_path),
+            headers=request.headers.raw, content=request.stream, extensions=request.extensions)
+        with _httpx_errors(request):
+            resp = await self.pool.handle_async_request(req)
+        return httpx.Response(status_code=resp.status, headers=resp.headers,
+                              stream=_Stream(resp, request), extensions=resp.extensions)
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+def _pinned_client(backend:_PinnedBackend, timeout:float, verify, http2:bool, limits:httpx.Limits)->httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=timeout, transport=_PinnedTransport(backend, verify, http2, limits))
+
+class Fingerprinter:
+    """Per-scan HTTP fingerprinting with two long-lived pooled clients.
+
+    HTTPS goes through the verifying client and plain HTTP through the
+    non-verifying one; connections are kept alive between requests so each
+    endpoint is handshaken once per scan. Only the first ``max_body`` bytes of
+    a response are read when looking for ``<title>``.
+
+    Requests are pinned to the probed IP: the TCP connection goes to ``ip``
+    while the Host header and SNI carry ``host``, so no DNS lookup happens and
+    results stay attributed to the IP whose port was found open.
+    """
+
+    def __init__(self, timeout:float=5, max_connections:int=200, max_keepalive:int=100,
+                 keepalive_expiry:float=30, max_body:int=MAX_BODY, verify:bool|str=True):
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        self.max_body = max_body
+        self.backend = _PinnedBackend(httpcore.AnyIOBackend())
+        self.verified = _pinned_client(self.backend, timeout, verify, HTTP2, limits)
+        self.unverified = _pinned_client(self.backend, timeout, False, False, limits)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.verified.aclose()
+        await self.unverified.aclose()
+
+    async def _read_head(self, r:httpx.Response)->str:
+        buf = b""
+        async for chunk in r.aiter_bytes():
+            buf += chunk
+            # Stopping early discards the connection, so small pages are read to
+            # the end and stay reusable; only oversized bodies are cut off.
+            if len(buf) >= self.max_body:
+                break
+        return buf[:self.max_body].decode(r.encoding or "utf-8", errors="replace")
+
+    async def fingerprint(self, host:str, ip:str, scheme:str, port:int|None=None)->dict:
+        default_port = 80 if scheme == "http" else 443
+        netloc = host if port in (None, default_port) else f"{host}:{port}"
+        client = self.verified if scheme == "https" else self.unverified
+        target = host
+        if ip:
+            target = pin_name(host, ip)
+            self.backend.pins[target] = ip
+        try:
+            async with client.stream("GET", f"{scheme}://{target}:{port or default_port}/",
+                                     headers={"Host": netloc, "User-Agent": USER_AGENT},
+                                     extensions={"sni_hostname": host}) as r:
+                text = await self._read_head(r)
+                m = TITLE_RE.search(text)
+                return {
+                    "status": r.status_code,
+                    "server": r.headers.get("server", ""),
+                    "hsts": bool(r.headers.get("strict-transport-security")),
+                    "location": r.headers.get("location", ""),
+                    "headers_sample": dict(list(r.headers.items())[:10]),
+                    "title": m.group(1)[:200] if m else "",
+                    "http_version": r.http_version,
+                }
+        except Exception as e:
+            return {"error": str(e)[:200]}
@@ -1,19 +1,25 @@
-import asyncio, json, os, time, random
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+import asyncio, base64, json, time
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from . import db, scanner
-from .report import render_report
+from . import scanner
+from .dns_cache import DNS_CACHE, persist_enabled as dns_cache_persist_enabled
+from .events import BUS, relay
+from .report import render_report, stream_report
+from .report_cache import CachedReport, ReportCache, report_etag
+from .pdf import PdfQueueFull, PdfRenderer
 from .panel import render_panel
 from .cspm_aws import run_checks
 from .risk_model import AssetContext, RiskModel
-from .notifications import send_digest
-import pdfkit
+from .db import FINDING_SORTS
+from .storage import storage_from_env
 
 app = FastAPI(title="SMBSEC MVP", version="0.1.0")
 
 class ScanRequest(BaseModel):
     domain: str
+    profile: str = scanner.DEFAULT_PROFILE
+    time_limit: float | None = None  # seconds; defaults to the worker's SMBSEC_SCAN_TIME_LIMIT
 
 class ScopeItem(BaseModel):
     kind: str
@@ -31,158 +37,51 @@ class ScopeAsset(BaseModel):
     owner_email: str | None = None
     criticality: int | None = None
     data_class: str | None = None
-RISKY = {3389, 5432, 6379, 3306, 9200, 27017}
-
-def has_https(open_ports, host, ip):
-    return any(h == host and i == ip and p in (443, 8443) for (h, i, p) in open_ports)
+store = storage_from_env()
+relay_task:asyncio.Task|None = None
+reports = ReportCache()
+pdfs = PdfRenderer()
 
 @app.on_event("startup")
 async def startup():
-    await db.init_db()
+    global relay_task
+    await store.init()
+    if dns_cache_persist_enabled():
+        await DNS_CACHE.load()
+    BUS.start()
+    relay_task = asyncio.create_task(relay(store))
+
+@app.on_event("shutdown")
+async def shutdown():
+    global relay_task
+    task, relay_task = relay_task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    await BUS.stop()
+    await pdfs.close()
+    await store.close()
 
 @app.post("/scan")
 async def start_scan(req: ScanRequest):
     domain = req.domain.strip().lower()
     if not domain or " " in domain or "." not in domain:
         raise HTTPException(400, "Invalid domain")
-    if not await db.domain_in_scope(domain):
+    if req.profile not in scanner.PORT_PROFILES:
+        raise HTTPException(400, f"Unknown port profile; choose one of {sorted(scanner.PORT_PROFILES)}")
+    if req.time_limit is not None and req.time_limit <= 0:
+        raise HTTPException(400, "time_limit must be positive")
+    if not await store.domain_in_scope(domain):
         raise HTTPException(400, "Domain not in scope")
-    scan_id = await db.create_scan(domain)
-    async def run():
-        stats = {"hosts":0,"open":0,"score":100,"penalties":[],"bonuses":[]}
-        try:
-            out = await scanner.scan_domain(domain)
-            asset_ctxs: dict[str, AssetContext] = {}
-            for host, ips in out["host_ips"].items():
-                asset_ctxs[host] = AssetContext()
-                if not ips:
-                    await db.upsert_asset(scan_id, host, None)
-                for ip in ips:
-                    await db.upsert_asset(scan_id, host, ip)
-                    stats["hosts"] += 1
-            for (host, ip, port) in out["open_ports"]:
-                if port in RISKY:
-                    await db.add_finding(
-                        scan_id,
-                        host,
-                        ip,
-                        port,
-                        "tcp",
-                        "high",
-                        f"Internet-exposed service on {port}",
-                        "Restrict exposure or require VPN; verify auth; move behind WAF/bastion.",
-                        {},
-                    )
-                    stats["score"] -= 10
-                    stats["penalties"].append(f"Risky port {port} exposed")
-            fp_map = out.get("fingerprints", {})
-            for (host, ip, port) in out["open_ports"]:
-                if port not in (80, 8080, 443, 8443):
-                    continue
-                key = f"{host}|{ip}|{port}"
-                fp = fp_map.get(key, {})
-                https_ok = has_https(out["open_ports"], host, ip)
-                if port in (80, 8080) and (not https_ok or not fp.get("hsts")):
-                    sev = "medium" if https_ok else "high"
-                    reason = "No HSTS" if https_ok else "No HTTPS available"
-                    await db.add_finding(
-                        scan_id,
-                        host,
-                        ip,
-                        port,
-                        "http",
-                        sev,
-                        f"Plain HTTP exposed ({reason})",
-                        "Enable HTTPS and Strict-Transport-Security or redirect all HTTP to HTTPS.",
-                        fp,
-                    )
-                    if not https_ok:
-                        stats["score"] -= 5
-                        stats["penalties"].append("HTTP without HTTPS")
-                title = f"Open TCP {port}"
-                desc = "Service reachable from Internet"
-                sev = "medium"
-                finding = {"type": "tcp", "host": host, "ip": ip, "port": port,
-                           "severity": sev, "title": title, "description": desc,
-                           "evidence_json": {}}
-                score, details = RiskModel.score(finding, asset_ctxs.get(host, AssetContext()))
-                await db.add_finding(scan_id, host, ip, port, "tcp", sev, title, desc, {}, score, details["controls"])
-                stats["open"] += 1
-                if port in (3389, 5432, 6379, 3306):
-                    stats["score"] -= 10
-                    stats["penalties"].append(f"Risky port {port} exposed")
-            for key, fp in out["fingerprints"].items():
-                h, ip, p = key.split("|")
-                p = int(p)
-                has_https = True
-                if p in (80, 8080):
-                    has_https = any(x for x in out["open_ports"] if x[0]==h and x[1]==ip and x[2] in (443,8443))
-                    if not has_https:
-                        stats["score"] -= 5
-                        stats["penalties"].append("HTTP exposed without HTTPS")
-                if "status" in fp:
-                    title = f"HTTP {fp['status']} on port {p}"
-                    server = fp.get("server","")
-                    detail = f"Server: {server} Title: {fp.get('title','')}"
-                    finding = {"type": "http", "host": h, "ip": ip, "port": p,
-                               "severity": "low", "title": title, "description": detail,
-                               "evidence_json": fp}
-                    score, details = RiskModel.score(finding, asset_ctxs.get(h, AssetContext()), sibling_https_open=has_https)
-                    await db.add_finding(scan_id, h, ip, p, "http", "low", title, detail, fp, score, details["controls"])
-            for key, info in out.get("tls", {}).items():
-                h, ip, p = key.split("|"); p = int(p)
-                if info:
-                    days = info.get("days_to_expiry")
-                    proto = info.get("protocol","")
-                    if isinstance(days, int):
-                        if days < 0:
-                            title = "Expired TLS certificate"
-                            desc = "Certificate notAfter date is in the past"
-                            finding = {"type": "tls", "host": h, "ip": ip, "port": p,
-                                       "severity": "high", "title": title, "description": desc,
-                                       "evidence_json": info}
-                            score, details = RiskModel.score(finding, asset_ctxs.get(h, AssetContext()))
-                            await db.add_finding(scan_id, h, ip, p, "tls", "high",
-                                title, desc, info, score, details["controls"])
-                            stats["score"] -= 15
-                            stats["penalties"].append("Expired TLS cert")
-                        elif days < 14:
-                            title = "TLS certificate expiring soon"
-                            desc = f"Cert expires in {days} days"
-                            finding = {"type": "tls", "host": h, "ip": ip, "port": p,
-                                       "severity": "medium", "title": title, "description": desc,
-                                       "evidence_json": info}
-                            score, details = RiskModel.score(finding, asset_ctxs.get(h, AssetContext()))
-                            await db.add_finding(scan_id, h, ip, p, "tls", "medium",
-                                title, desc, info, score, details["controls"])
-                    if proto and proto.startswith("TLSv1.3"):
-                        stats["score"] += 2
-                        stats["bonuses"].append("TLS 1.3 detected")
-            for key, banner in out.get("ssh", {}).items():
-                if banner:
-                    h, ip, p = key.split("|"); p = int(p)
-                    title = "SSH service banner"
-                    finding = {"type": "ssh", "host": h, "ip": ip, "port": p,
-                               "severity": "info", "title": title, "description": banner,
-                               "evidence_json": {"banner": banner}}
-                    score, details = RiskModel.score(finding, asset_ctxs.get(h, AssetContext()))
-                    await db.add_finding(scan_id, h, ip, p, "ssh", "info",
-                        title, banner, {"banner": banner}, score, details["controls"])
-            trans = await db.compute_state_transitions(scan_id)
-            await send_digest(scan_id, trans)
-        except Exception as e:
-            await db.finish_scan(scan_id, "error", {"error": str(e)})
-            return
-        await db.finish_scan(scan_id, "done", stats)
-    asyncio.create_task(run())
-    return {"scan_id": scan_id, "status": "running"}
+    scan_id = await store.enqueue_scan(domain, req.profile, req.time_limit)
+    return {"scan_id": scan_id, "status": "queued"}
 
 @app.post("/org/scope")
 async def add_scope(item: ScopeItem | ScopeAsset):
     if isinstance(item, ScopeItem):
-        await db.add_scope(item.org or "default", item.kind, item.value)
+        await store.add_scope(item.org or "default", item.kind, item.value)
     else:
-        await db.upsert_asset(
+        await store.upsert_asset(
             item.scan_id,
             item.host,
             item.ip,
@@ -197,113 +96,224 @@ async def panel():
     html = render_panel([])
     return HTMLResponse(html)
 
-async def _build_report(scan_id:int, s:dict):
-    import aiosqlite
-    async with aiosqlite.connect(os.path.join(os.path.dirname(__file__), "..", "data.db")) as conn:
-        conn.row_factory = aiosqlite.Row
-        a = await conn.execute("SELECT host, ip, last_seen FROM assets WHERE scan_id=?", (scan_id,))
-        assets = [dict(r) for r in await a.fetchall()]
-    f = await db.list_findings(scan_id)
-    stats = json.loads(s.get("stats_json", "{}"))
-    html = render_report(scan_id, s["domain"], s["finished_at"] or int(time.time()), assets, f, stats)
-    out_dir = os.path.join(os.path.dirname(__file__), "..", "reports")
-    os.makedirs(out_dir, exist_ok=True)
-    out_path = os.path.join(out_dir, f"scan_{scan_id}.html")
-    with open(out_path, "w", encoding="utf-8") as fp:
-        fp.write(html)
-    return html, out_dir
+async def _build_report(scan_id:int, s:dict)->CachedReport:
+    async def render():
+        assets = await store.list_assets(scan_id)
+        f = await store.list_findings(scan_id)
+        stats = json.loads(s.get("stats_json", "{}"))
+        return render_report(scan_id, s["domain"], s["finished_at"] or int(time.time()), assets, f, stats)
+    return await reports.get(s, render)
+
+def _report_response(r:CachedReport, request:Request)->Response:
+    headers = {"ETag": f'"{r.etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    tags = {t.strip().removeprefix("W/").strip('"') for t in request.headers.get("if-none-match", "").split(",")}
+    if r.etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(r.gz, media_type="text/html; charset=utf-8", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(r.html(), media_type="text/html; charset=utf-8", headers=headers)
+
+def _encode_cursor(sort:str, order:str, row:dict)->str:
+    return base64.urlsafe_b64encode(json.dumps([sort, order, row["sort_key"], row["id"]]).encode()).decode()
+
+def _decode_cursor(cursor:str, sort:str, order:str)->tuple:
+    try:
+        c_sort, c_order, key, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    if (c_sort, c_order) != (sort, order):
+        raise HTTPException(400, "Cursor belongs to a different sort order")
+    return key, last_id
+
+async def _findings_page(scan_id:int, limit:int=100, sort:str="risk_score", order:str="desc",
+                         severity:str|None=None, host:str|None=None, port:int|None=None,
+                         cursor:str|None=None)->dict:
+    if sort not in FINDING_SORTS:
+        raise HTTPException(400, f"Unknown sort; choose one of {sorted(FINDING_SORTS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(400, "order must be asc or desc")
+    after = _decode_cursor(cursor, sort, order) if cursor else None
+    rows = await store.list_findings_page(scan_id, sort, order == "desc", after, limit + 1,
+                                          severity.split(",") if severity else None, host, port)
+    page = rows[:limit]
+    next_cursor = _encode_cursor(sort, order, page[-1]) if len(rows) > limit else None
+    for r in page:
+        del r["sort_key"]
+    return {"findings": page, "next_cursor": next_cursor}
 
 @app.get("/scans/{scan_id}")
-async def get_scan(scan_id:int):
-    s = await db.get_scan(scan_id)
+async def get_scan(scan_id:int, limit:int=Query(100, ge=1, le=1000)):
+    s = await store.get_scan(scan_id)
     if not s: raise HTTPException(404, "Not found")
-    f = await db.list_findings(scan_id)
-    return {"scan": s, "findings": f}
+    # First page only; follow next_cursor on /scans/{id}/findings for the rest.
+    return {"scan": s, **await _findings_page(scan_id, limit)}
+
+@app.get("/scans/{scan_id}/findings")
+async def list_scan_findings(scan_id:int, limit:int=Query(100, ge=1, le=1000), sort:str="risk_score",
+                             order:str="desc", severity:str|None=None, host:str|None=None,
+                             port:int|None=None, cursor:str|None=None):
+    """Keyset-paginated findings; ``severity`` takes a comma-separated list."""
+    if not await store.get_scan(scan_id): raise HTTPException(404, "Not found")
+    return await _findings_page(scan_id, limit, sort, order, severity, host, port, cursor)
+
+def _progress(s:dict)->dict:
+    return {"scan_id": s["id"], "domain": s["domain"], "status": s["status"],
+            "cancel_requested": bool(s["cancel_requested"]), "progress": json.loads(s["progress_json"] or "{}")}
+
+@app.get("/scans/{scan_id}/progress")
+async def get_scan_progress(scan_id:int):
+    s = await store.get_scan(scan_id)
+    if not s: raise HTTPException(404, "Not found")
+    return _progress(s)
+
+@app.delete("/scans/{scan_id}")
+async def cancel_scan(scan_id:int):
+    s = await store.cancel_scan(scan_id)
+    if not s: raise HTTPException(404, "Not found")
+    if s["status"] in ("done","error"):
+        raise HTTPException(409, f"Scan already finished ({s['status']})")
+    # A running scan stops at its worker's next heartbeat.
+    return {"scan_id": scan_id, "status": "cancelling" if s["status"] == "running" else s["status"]}
+
+async def _iter_findings(scan_id:int, page:int=1000):
+    after = None
+    while True:
+        rows = await store.list_findings_page(scan_id, after=after, limit=page)
+        for r in rows:
+            yield r
+        if len(rows) < page:
+            return
+        after = (rows[-1]["sort_key"], rows[-1]["id"])
 
 @app.get("/report/{scan_id}", response_class=HTMLResponse)
-async def get_report(scan_id:int):
-    s = await db.get_scan(scan_id)
+async def get_report(scan_id:int, request:Request, stream:bool=False):
+    s = await store.get_scan(scan_id)
     if not s: raise HTTPException(404, "Not found")
-    if s["status"] not in ("done","error"):
+    if s["status"] not in ("done","error","cancelled"):
         return HTMLResponse("<h3>Scan still running...</h3>")
-    html,_ = await _build_report(scan_id, s)
-    return HTMLResponse(html)
+    if stream:
+        # Rendered while findings are paged in, so memory stays flat; not cached.
+        assets = await store.list_assets(scan_id)
+        fix_queue = await store.list_findings_page(scan_id, limit=5)
+        stats = json.loads(s.get("stats_json", "{}"))
+        return StreamingResponse(stream_report(scan_id, s["domain"], s["finished_at"] or int(time.time()), assets,
+                                               _iter_findings(scan_id), stats, fix_queue),
+                                 media_type="text/html; charset=utf-8")
+    return _report_response(await _build_report(scan_id, s), request)
 
-@app.get("/report/{scan_id}/pdf")
-async def get_report_pdf(scan_id:int):
-    s = await db.get_scan(scan_id)
+async def _finished_scan(scan_id:int)->dict:
+    s = await store.get_scan(scan_id)
     if not s: raise HTTPException(404, "Not found")
-    if s["status"] not in ("done","error"):
+    if s["status"] not in ("done","error","cancelled"):
         raise HTTPException(400, "Scan still running")
-    html,out_dir = await _build_report(scan_id, s)
-    pdf_path = os.path.join(out_dir, f"scan_{scan_id}.pdf")
-    pdfkit.from_string(html, pdf_path)
-    return FileResponse(pdf_path, media_type="application/pdf", filename=f"scan_{scan_id}.pdf")
+    return s
+
+def _report_html(scan_id:int, s:dict):
+    async def html()->bytes:
+        return (await _build_report(scan_id, s)).html()
+    return html
+
+@app.get("/report/{scan_id}/pdf")
+async def get_report_pdf(scan_id:int):
+    s = await _finished_scan(scan_id)
+    try:
+        path = await pdfs.get(scan_id, report_etag(s), _report_html(scan_id, s))
+    except PdfQueueFull as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "5"})
+    except (OSError, RuntimeError) as e:  # RuntimeError covers BrokenProcessPool
+        raise HTTPException(502, f"PDF rendering failed: {str(e) or type(e).__name__}")
+    return FileResponse(path, media_type="application/pdf", filename=f"scan_{scan_id}.pdf")
+
+@app.post("/report/{scan_id}/pdf/jobs", status_code=202)
+async def start_report_pdf_job(scan_id:int):
+    """Render a PDF in the background; poll the job, then GET /report/{scan_id}/pdf."""
+    s = await _finished_scan(scan_id)
+    etag = report_etag(s)
+    status = pdfs.status(scan_id, etag)
+    if not status or status["status"] == "error":
+        try:
+            pdfs.submit(scan_id, etag, _report_html(scan_id, s))
+        except PdfQueueFull as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": "5"})
+        status = {"status": "pending"}
+    return {"job_id": etag, **status, "url": f"/report/{scan_id}/pdf"}
+
+@app.get("/report/{scan_id}/pdf/jobs/{job_id}")
+async def get_report_pdf_job(scan_id:int, job_id:str):
+    status = pdfs.status(scan_id, job_id)
+    if not status: raise HTTPException(404, "Not found")
+    return {"job_id": job_id, **status, "url": f"/report/{scan_id}/pdf"}
+
+@app.get("/scan/profiles")
+async def scan_profiles():
+    return {name: len(ports) for name, ports in scanner.PORT_PROFILES.items()}
+
+@app.get("/dns/cache")
+async def dns_cache_stats():
+    return DNS_CACHE.stats()
 
 @app.post("/connect/aws")
 async def connect_aws(conn: AWSConnector):
-    await db.add_connector_aws(conn.role_arn.strip(), conn.external_id.strip())
+    await store.add_connector_aws(conn.role_arn.strip(), conn.external_id.strip())
     return {"status": "ok"}
 
 @app.post("/cspm/aws/run")
 async def cspm_run():
-    conns = await db.get_connectors('aws')
+    conns = await store.get_connectors('aws')
     if not conns:
         raise HTTPException(400, "No AWS connector configured")
     role_arn = conns[0]["role_arn"]
     external_id = conns[0]["external_id"]
-    scan_id = await db.create_scan("aws")
+    scan_id = await store.create_scan("aws")
     try:
         results = run_checks(role_arn, external_id)
-        for it in results:
-            title = it["issue"]
-            res = it["resource"]
-            sev = "high" if "AdministratorAccess" in title or "Public" in title else "medium"
-            finding = {"type": "aws", "host": res, "ip": None, "port": None,
-                       "severity": sev, "title": title,
-                       "description": f"AWS check flagged: {res}", "evidence_json": it}
-            score, details = RiskModel.score(finding, AssetContext())
-            await db.add_finding(scan_id, host=res, ip=None, port=None, proto="aws", severity=sev,
-                                 title=title, description=f"AWS check flagged: {res}", evidence=it,
-                                 risk_score=score, controls=details["controls"])
-        await db.finish_scan(scan_id, "done", {"count": len(results)})
+        titles = [it["issue"] for it in results]
+        sevs = ["high" if "AdministratorAccess" in t or "Public" in t else "medium" for t in titles]
+        descs = [f"AWS check flagged: {it['resource']}" for it in results]
+        scores, _, controls = RiskModel.score_batch(["aws"] * len(results), [None] * len(results), sevs, titles,
+                                                    [AssetContext()], [0] * len(results), descriptions=descs,
+                                                    evidence=results)
+        async with store.scan_writer(scan_id) as w:
+            for it, title, sev, desc, score, ctl in zip(results, titles, sevs, descs, scores, controls):
+                await w.add_finding(host=it["resource"], ip=None, port=None, proto="aws", severity=sev,
+                                    title=title, description=desc, evidence=it,
+                                    risk_score=float(score), controls=ctl)
+        await store.finish_scan(scan_id, "done", {"count": len(results)})
     except Exception as e:
-        await db.finish_scan(scan_id, "error", {"error": str(e)})
+        await store.finish_scan(scan_id, "error", {"error": str(e)})
     return {"scan_id": scan_id}
 
 @app.websocket("/ws")
 async def ws_dashboard(ws: WebSocket):
+    """Scan telemetry from ``events.BUS``: one frame per tick with that tick's coalesced events."""
     await ws.accept()
-    try:
+    sub = BUS.subscribe()
+
+    async def send():
+        # Queued and running scans first, so a new dashboard does not wait for their next update.
+        snapshot = []
+        for s in await store.list_active_scans():
+            p = _progress(s)
+            snapshot.append({"type": "scan", "scan_id": p["scan_id"], "status": p["status"], "domain": p["domain"]})
+            snapshot.append({"type": "progress", "scan_id": p["scan_id"], **p["progress"]})
+        await ws.send_text(json.dumps({"tick": BUS.ticks, "events": snapshot, "dropped": BUS.dropped}))
+        dropped = 0
         while True:
-            score = random.randint(60, 100)
-            node_count = 5
-            nodes = [{"id": f"host{i}"} for i in range(1, node_count + 1)]
-            links = [{"source": f"host{i}", "target": f"host{(i % node_count) + 1}"} for i in range(1, node_count + 1)]
-            incident = {
-                "id": int(time.time()),
-                "severity": random.choice(["low", "medium", "high"]),
-                "message": random.choice([
-                    "Suspicious login detected",
-                    "Malware signature found",
-                    "Port scan activity",
-                    "Unauthorized access attempt",
-                    "Policy violation reported",
-                ]),
-            }
-            kpis = {
-                "cpu": random.randint(0, 100),
-                "scan": random.randint(0, 100),
-                "findings": random.randint(0, 50),
-                "compliance": random.randint(0, 100),
-            }
-            await ws.send_text(json.dumps({
-                "score": score,
-                "nodes": nodes,
-                "links": links,
-                "incident": incident,
-                "kpis": kpis,
-            }))
-            await asyncio.sleep(1)
-    except WebSocketDisconnect:
-        return
+            for frame in await sub.get():
+                await ws.send_text(frame)
+            if sub.dropped != dropped:
+                dropped = sub.dropped
+                await ws.send_text(json.dumps({"client_dropped": dropped}))
+
+    async def receive():
+        while (await ws.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        BUS.unsubscribe(sub)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
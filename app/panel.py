@@ -67,10 +67,10 @@ setInterval(updateClock,1000);updateClock();
 const statusCtx=document.getElementById('status-wheel').getContext('2d');
 const statusChart=new Chart(statusCtx,{type:'doughnut',data:{labels:['Score',''],datasets:[{data:[100,0],backgroundColor:['#00ffff','#1a1a1a'],borderWidth:0}]},options:{cutout:'80%',plugins:{legend:{display:false}},rotation:-90}});
 
-const cpuChart=new Chart(document.getElementById('cpu-chart'),{type:'line',data:{labels:[],datasets:[{label:'CPU %',data:[],borderColor:'#00ffff',tension:0.4}]},options:{scales:{x:{display:false},y:{display:false}},plugins:{legend:{display:false}},animation:false}});
+const cpuChart=new Chart(document.getElementById('cpu-chart'),{type:'line',data:{labels:[],datasets:[{label:'Open ports',data:[],borderColor:'#00ffff',tension:0.4}]},options:{scales:{x:{display:false},y:{display:false}},plugins:{legend:{display:false}},animation:false}});
 const scanChart=new Chart(document.getElementById('scan-chart'),{type:'doughnut',data:{labels:['Progress',''],datasets:[{data:[0,100],backgroundColor:['#00ff99','#1a1a1a'],borderWidth:0}]},options:{cutout:'70%',plugins:{legend:{display:false}},rotation:-90}});
 const findingsChart=new Chart(document.getElementById('findings-chart'),{type:'line',data:{labels:[],datasets:[{label:'Findings',data:[],borderColor:'#ff0066',tension:0.4}]},options:{scales:{x:{display:false},y:{display:false}},plugins:{legend:{display:false}},animation:false}});
-const complianceChart=new Chart(document.getElementById('compliance-chart'),{type:'doughnut',data:{labels:['Compliance',''],datasets:[{data:[0,100],backgroundColor:['#ffff00','#1a1a1a'],borderWidth:0}]},options:{cutout:'70%',plugins:{legend:{display:false}},rotation:-90}});
+const complianceChart=new Chart(document.getElementById('compliance-chart'),{type:'doughnut',data:{labels:['Fingerprints',''],datasets:[{data:[0,100],backgroundColor:['#ffff00','#1a1a1a'],borderWidth:0}]},options:{cutout:'70%',plugins:{legend:{display:false}},rotation:-90}});
 
 const mapWidth=document.getElementById('asset-map').clientWidth;
 const mapHeight=document.getElementById('asset-map').clientHeight;
@@ -102,26 +102,56 @@ function renderIncidents(){
 }
 document.getElementById('status-wheel').addEventListener('click',()=>{filterHigh=!filterHigh;renderIncidents();});
 
+const scans={};
+const hosts=new Map();
+let score=100,openTick=0,findingsTick=0,mapDirty=false;
+function pct(a,b){return b?Math.round(100*a/b):0;}
+function onEvent(e){
+ const s=scans[e.scan_id]=scans[e.scan_id]||{findings:0};
+ if(e.type==='scan'){
+  s.status=e.status;if(e.domain){s.domain=e.domain;}
+  if(typeof e.score==='number'){score=Math.max(0,Math.min(100,e.score));}
+  if(e.status==='error'||e.status==='cancelled'){incidents.push({severity:'medium',message:`Scan #${e.scan_id} ${e.status}${e.error?': '+e.error:''}`});}
+ }else if(e.type==='progress'){s.progress=e;}
+ else if(e.type==='findings'){findingsTick+=Math.max(0,e.total-s.findings);s.findings=e.total;}
+ else if(e.type==='finding'){incidents.push({severity:'high',message:`#${e.scan_id} ${e.title}`});}
+ else if(e.type==='transitions'){incidents.push({severity:e.regressed?'high':'low',message:`Scan #${e.scan_id}: ${e.new} new, ${e.resolved} resolved, ${e.regressed} regressed`});}
+ else if(e.type==='port_open'){
+  openTick++;
+  if(!hosts.has(e.ip)&&hosts.size<100){hosts.set(e.ip,new Set());}
+  if(hosts.has(e.ip)){hosts.get(e.ip).add(e.port);mapDirty=true;}
+ }
+}
+function redrawMap(){
+ const nodes=[],links=[];
+ hosts.forEach((ports,ip)=>{nodes.push({id:ip});ports.forEach(p=>{nodes.push({id:`${ip}:${p}`});links.push({source:ip,target:`${ip}:${p}`});});});
+ renderMap(nodes,links);
+}
+function pushPoint(chart,v){
+ chart.data.labels.push('');
+ chart.data.datasets[0].data.push(v);
+ if(chart.data.datasets[0].data.length>20){chart.data.labels.shift();chart.data.datasets[0].data.shift();}
+ chart.update();
+}
 const ws=new WebSocket(`ws://${location.host}/ws`);
 ws.onmessage=(ev)=>{
  const data=JSON.parse(ev.data);
- statusChart.data.datasets[0].data=[data.score,100-data.score];
+ if(!data.events){return;}
+ openTick=0;findingsTick=0;
+ data.events.forEach(onEvent);
+ statusChart.data.datasets[0].data=[score,100-score];
  statusChart.update();
- cpuChart.data.labels.push('');
- cpuChart.data.datasets[0].data.push(data.kpis.cpu);
- if(cpuChart.data.datasets[0].data.length>20){cpuChart.data.datasets[0].data.shift();}
- cpuChart.update();
- scanChart.data.datasets[0].data=[data.kpis.scan,100-data.kpis.scan];
+ pushPoint(cpuChart,openTick);
+ pushPoint(findingsChart,findingsTick);
+ const running=Object.values(scans).filter(s=>s.status==='running'&&s.progress);
+ const p=running.length?running[running.length-1].progress:{};
+ const probed=pct(p.ports_probed,p.ports_total),fps=pct(p.fingerprints_done,p.fingerprints_total);
+ scanChart.data.datasets[0].data=[probed,100-probed];
  scanChart.update();
- findingsChart.data.labels.push('');
- findingsChart.data.datasets[0].data.push(data.kpis.findings);
- if(findingsChart.data.datasets[0].data.length>20){findingsChart.data.datasets[0].data.shift();}
- findingsChart.update();
- complianceChart.data.datasets[0].data=[data.kpis.compliance,100-data.kpis.compliance];
+ complianceChart.data.datasets[0].data=[fps,100-fps];
  complianceChart.update();
- renderMap(data.nodes,data.links);
- incidents.push(data.incident);
- if(incidents.length>50){incidents.shift();}
+ if(mapDirty){mapDirty=false;redrawMap();}
+ while(incidents.length>50){incidents.shift();}
  renderIncidents();
 };
 </script>
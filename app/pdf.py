@@ -0,0 +1,136 @@
+import asyncio, contextlib, glob, multiprocessing, os, time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable
+import pdfkit
+from .report_cache import REPORTS_DIR
+
+PDF_WORKERS = int(os.environ.get("SMBSEC_PDF_WORKERS", 2))
+PDF_QUEUE = int(os.environ.get("SMBSEC_PDF_QUEUE", 16))  # renders running or waiting for a worker
+WKHTMLTOPDF = os.environ.get("SMBSEC_WKHTMLTOPDF")  # default: wkhtmltopdf on PATH
+PDF_ERROR_TTL = float(os.environ.get("SMBSEC_PDF_ERROR_TTL", 600))  # seconds a failed render stays reported
+PDF_ERRORS = 256  # failed renders remembered at most
+
+class PdfQueueFull(Exception):
+    pass
+
+def _render(binary:str|None, html_path:str, pdf_path:str)->None:
+    # Runs in a pool process: wkhtmltopdf is waited on there, not on the event loop.
+    config = pdfkit.configuration(wkhtmltopdf=binary) if binary else None
+    pdfkit.from_file(html_path, pdf_path, configuration=config, options={"quiet": ""})
+
+class PdfRenderer:
+    """Renders report PDFs in a bounded process pool.
+
+    PDFs are cached on disk per scan and report ETag, so a PDF is rendered
+    once per report revision; concurrent requests for the same PDF share
+    one job. Failed renders are reported for ``error_ttl`` seconds, and at
+    most ``max_errors`` of them are kept. A pool broken by a dying worker
+    is replaced on the next render.
+    """
+
+    def __init__(self, directory:str=REPORTS_DIR, workers:int=PDF_WORKERS, max_pending:int=PDF_QUEUE,
+                 binary:str|None=WKHTMLTOPDF, error_ttl:float=PDF_ERROR_TTL, max_errors:int=PDF_ERRORS):
+        self.dir = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.binary = binary
+        self.pool:ProcessPoolExecutor|None = None
+        self.jobs:dict[tuple[int,str],asyncio.Task] = {}
+        self.error_ttl = error_ttl
+        self.max_errors = max_errors
+        self.errors:OrderedDict[tuple[int,str],tuple[float,str]] = OrderedDict()  # key -> (expires, message)
+        self.stats = {"cached": 0, "joined": 0, "render": 0}
+
+    def path(self, scan_id:int, etag:str)->str:
+        return os.path.join(self.dir, f"scan_{scan_id}.{etag}.pdf")
+
+    def status(self, scan_id:int, etag:str)->dict|None:
+        key = (scan_id, etag)
+        if key in self.jobs:
+            return {"status": "pending"}
+        self._expire()
+        if key in self.errors:
+            return {"status": "error", "error": self.errors[key][1]}
+        if os.path.exists(self.path(scan_id, etag)):
+            return {"status": "done"}
+        return None
+
+    def submit(self, scan_id:int, etag:str, html:Callable[[], Awaitable[bytes]])->asyncio.Task:
+        """Start rendering, or join the render already running for this PDF."""
+        key = (scan_id, etag)
+        if (task := self.jobs.get(key)) is not None:
+            self.stats["joined"] += 1
+            return task
+        if len(self.jobs) >= self.max_pending:
+            raise PdfQueueFull(f"{len(self.jobs)} PDF renders pending")
+        self.errors.pop(key, None)
+        self.jobs[key] = task = asyncio.create_task(self._run(scan_id, etag, html))
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key:tuple[int,str], task:asyncio.Task)->None:
+        self.jobs.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors.pop(key, None)
+            self.errors[key] = (time.monotonic() + self.error_ttl,
+                                str(task.exception()) or type(task.exception()).__name__)
+            self._expire()
+
+    def _expire(self)->None:
+        # Oldest first: entries are appended with a fixed TTL, so expiry order is insertion order.
+        now = time.monotonic()
+        while self.errors and (len(self.errors) > self.max_errors or next(iter(self.errors.values()))[0] <= now):
+            self.errors.popitem(last=False)
+
+    async def get(self, scan_id:int, etag:str, html:Callable[[], Awaitable[bytes]])->str:
+        path = self.path(scan_id, etag)
+        if (scan_id, etag) not in self.jobs and os.path.exists(path):
+            self.stats["cached"] += 1
+            return path
+        # shield: a client going away must not cancel a render others are waiting on.
+        return await asyncio.shield(self.submit(scan_id, etag, html))
+
+    async def _run(self, scan_id:int, etag:str, html:Callable[[], Awaitable[bytes]])->str:
+        body = await html()
+        path = self.path(scan_id, etag)
+        src = await asyncio.to_thread(self._prepare, scan_id, path, body)
+        try:
+            if self.pool is None:
+                # spawn, not fork: the parent holds sqlite and resolver threads.
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            pool = self.pool
+            try:
+                await asyncio.get_running_loop().run_in_executor(pool, _render, self.binary, src, path + ".tmp")
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool for the next render.
+                if self.pool is pool:
+                    self.pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            os.replace(path + ".tmp", path)
+        finally:
+            for p in (src, path + ".tmp"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(p)
+        self.stats["render"] += 1
+        return path
+
+    def _prepare(self, scan_id:int, path:str, body:bytes)->str:
+        os.makedirs(self.dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(self.dir), f"scan_{scan_id}.*.pdf")):
+            if stale != path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(stale)
+        with open(path + ".html", "wb") as f:
+            f.write(body)
+        return path + ".html"
+
+    async def close(self)->None:
+        for task in list(self.jobs.values()):
+            task.cancel()
+        await asyncio.gather(*self.jobs.values(), return_exceptions=True)
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
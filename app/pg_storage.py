@@ -0,0 +1,402 @@
+import json, os, time
+from . import db, fix_queue
+from .storage import Storage
+try:
+    import asyncpg  # optional, only needed for SMBSEC_DATABASE_URL=postgresql://...
+except ImportError:
+    asyncpg = None
+
+PG_POOL_SIZE = int(os.environ.get("SMBSEC_PG_POOL_SIZE", 10))
+MIGRATION_LOCK = 0x534d4253  # advisory lock id; one node migrates at a time
+
+# Same layout as db.MIGRATIONS after its latest version; versions are tracked in schema_version.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS scans(
+      id BIGSERIAL PRIMARY KEY,
+      domain TEXT NOT NULL,
+      started_at BIGINT NOT NULL,
+      finished_at BIGINT,
+      status TEXT NOT NULL CHECK(status IN ('queued','running','done','error')) DEFAULT 'queued',
+      stats_json TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE INDEX IF NOT EXISTS idx_scans_domain ON scans(domain, id);
+    CREATE TABLE IF NOT EXISTS assets(
+      id BIGSERIAL PRIMARY KEY,
+      scan_id BIGINT NOT NULL,
+      host TEXT NOT NULL,
+      ip TEXT,
+      owner_email TEXT,
+      criticality INTEGER,
+      data_class TEXT,
+      first_seen BIGINT NOT NULL,
+      last_seen BIGINT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_assets_key ON assets(scan_id, host, (coalesce(ip,'')));
+    CREATE TABLE IF NOT EXISTS findings(
+      id BIGSERIAL PRIMARY KEY,
+      scan_id BIGINT NOT NULL,
+      host TEXT NOT NULL,
+      ip TEXT,
+      port INTEGER,
+      proto TEXT,
+      severity TEXT NOT NULL CHECK(severity IN ('info','low','medium','high','critical')),
+      title TEXT NOT NULL,
+      description TEXT NOT NULL,
+      evidence_json TEXT NOT NULL DEFAULT '{}',
+      risk_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+      controls_json TEXT NOT NULL DEFAULT '{}',
+      created_at BIGINT NOT NULL,
+      dedupe_key TEXT NOT NULL,
+      fingerprint BIGINT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_key ON findings(scan_id, host, ip, port, proto, title);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_fp ON findings(scan_id, fingerprint);
+    CREATE TABLE IF NOT EXISTS connectors(
+      id BIGSERIAL PRIMARY KEY,
+      org TEXT NOT NULL DEFAULT 'default',
+      kind TEXT NOT NULL CHECK(kind IN ('aws')),
+      role_arn TEXT NOT NULL,
+      external_id TEXT NOT NULL,
+      created_at BIGINT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS finding_states(
+      scan_id BIGINT NOT NULL,
+      dedupe_key TEXT NOT NULL,
+      fingerprint BIGINT NOT NULL,
+      state TEXT NOT NULL CHECK(state IN ('open','resolved')),
+      PRIMARY KEY (scan_id, dedupe_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_finding_states_scan_fp ON finding_states(scan_id, state, fingerprint);
+    CREATE INDEX IF NOT EXISTS idx_finding_states_fp ON finding_states(fingerprint, scan_id);
+    CREATE TABLE IF NOT EXISTS finding_latest(
+      fingerprint BIGINT PRIMARY KEY,
+      dedupe_key TEXT NOT NULL,
+      scan_id BIGINT NOT NULL,
+      state TEXT NOT NULL CHECK(state IN ('open','resolved'))
+    );
+    CREATE TABLE IF NOT EXISTS scope(
+      id BIGSERIAL PRIMARY KEY,
+      org TEXT NOT NULL DEFAULT 'default',
+      kind TEXT NOT NULL CHECK(kind IN ('domain','cidr')),
+      value TEXT NOT NULL
+    );
+    """,
+    """
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS profile TEXT NOT NULL DEFAULT 'default';
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS lease_expires DOUBLE PRECISION;
+    UPDATE scans SET lease_expires=0 WHERE status='running';
+    CREATE INDEX IF NOT EXISTS idx_scans_queue ON scans(status, lease_expires, id);
+    """,
+    """
+    ALTER TABLE scans DROP CONSTRAINT IF EXISTS scans_status_check;
+    ALTER TABLE scans ADD CONSTRAINT scans_status_check
+      CHECK(status IN ('queued','running','done','error','cancelled'));
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS time_limit DOUBLE PRECISION;
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS cancel_requested INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS progress_json TEXT NOT NULL DEFAULT '{}';
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS events(
+      id BIGSERIAL PRIMARY KEY,
+      created_at DOUBLE PRECISION NOT NULL,
+      payload TEXT NOT NULL
+    );
+    """,
+    """
+    ALTER TABLE scans ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    ALTER TABLE findings ADD COLUMN IF NOT EXISTS severity_rank INTEGER GENERATED ALWAYS AS
+      (CASE severity WHEN 'critical' THEN 4 WHEN 'high' THEN 3 WHEN 'medium' THEN 2 WHEN 'low' THEN 1 ELSE 0 END)
+      STORED;
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_risk ON findings(scan_id, risk_score, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_sev ON findings(scan_id, severity_rank, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_host ON findings(scan_id, host, id);
+    CREATE INDEX IF NOT EXISTS idx_findings_scan_port ON findings(scan_id, coalesce(port,-1), id);
+    """,
+]
+
+FINDING_COLUMNS = ["scan_id", "host", "ip", "port", "proto", "severity", "title", "description",
+                   "evidence_json", "risk_score", "controls_json", "created_at", "dedupe_key", "fingerprint"]
+
+ASSET_UPSERT = """
+INSERT INTO assets(scan_id,host,ip,owner_email,criticality,data_class,first_seen,last_seen)
+VALUES($1,$2,$3,$4,$5,$6,$7,$7)
+ON CONFLICT (scan_id, host, (coalesce(ip,''))) DO UPDATE SET last_seen=EXCLUDED.last_seen,
+    owner_email=COALESCE(EXCLUDED.owner_email, assets.owner_email),
+    criticality=COALESCE(EXCLUDED.criticality, assets.criticality),
+    data_class=COALESCE(EXCLUDED.data_class, assets.data_class)
+"""
+
+BUMP_REVISION = "UPDATE scans SET revision=revision+1 WHERE id=$1"
+
+OWNER_SQL = "SELECT owner_email FROM assets WHERE scan_id=$1 AND host=$2 AND coalesce(ip,'')=coalesce($3,'')"
+
+URGENT_SQL = """
+SELECT f.id, a.owner_email, f.severity, f.title, f.description
+FROM findings f LEFT JOIN assets a
+  ON a.scan_id=f.scan_id AND a.host=f.host AND coalesce(a.ip,'')=coalesce(f.ip,'')
+WHERE f.scan_id=$1 AND f.id>$2 AND f.severity IN ('high','critical')
+ORDER BY f.id
+"""
+
+# finding_latest gives the last state before $1 unless a later scan finished
+# first or this scan is a retry; then the (fingerprint, scan_id) index does.
+NEW_SQL = """
+SELECT DISTINCT ON (f.fingerprint) f.dedupe_key,
+  CASE WHEN l.scan_id IS NULL THEN NULL WHEN l.scan_id<$1 THEN l.state ELSE (
+    SELECT s.state FROM finding_states s WHERE s.fingerprint=f.fingerprint AND s.scan_id<$1
+    ORDER BY s.scan_id DESC LIMIT 1) END
+FROM findings f
+LEFT JOIN finding_latest l ON l.fingerprint=f.fingerprint
+WHERE f.scan_id=$1 AND NOT EXISTS (
+  SELECT 1 FROM finding_states s WHERE s.scan_id=$2 AND s.state='open' AND s.fingerprint=f.fingerprint)
+"""
+
+# After a scan's states are deleted, point its finding_latest rows back at the newest state left.
+REBUILD_LATEST = """
+UPDATE finding_latest l SET dedupe_key=s.dedupe_key, scan_id=s.scan_id, state=s.state
+FROM finding_states s
+WHERE l.scan_id=$1 AND s.fingerprint=l.fingerprint
+  AND s.scan_id=(SELECT max(scan_id) FROM finding_states WHERE fingerprint=l.fingerprint)
+"""
+
+RESOLVED_WHERE = """
+WHERE s.scan_id=$2 AND s.state='open' AND NOT EXISTS (
+  SELECT 1 FROM findings f WHERE f.scan_id=$1 AND f.fingerprint=s.fingerprint)
+"""
+
+async def migrate(conn)->int:
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK)
+        await conn.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER NOT NULL)")
+        version = await conn.fetchval("SELECT coalesce(max(version),0) FROM schema_version")
+        for v in range(version, len(MIGRATIONS)):
+            await conn.execute(MIGRATIONS[v])
+            await conn.execute("INSERT INTO schema_version(version) VALUES($1)", v + 1)
+    return len(MIGRATIONS)
+
+def _side_effects(urgent):
+    for finding_id, owner_email, severity, title, description in urgent:
+        fix_queue.add(finding_id, owner_email, severity, title, description)
+        fix_queue.open_jira_ticket(finding_id, title, description, owner_email)
+
+class PgScanWriter(db.ScanWriter):
+    """``db.ScanWriter`` buffering with findings written through ``COPY``."""
+
+    def __init__(self, store:"PostgresStorage", scan_id:int, **kwargs):
+        super().__init__(scan_id, **kwargs)
+        self.store = store
+
+    async def _write(self, assets:list[tuple], findings:list[tuple])->list[tuple]:
+        sid = self.scan_id
+        async with self.store.pool.acquire() as conn:
+            async with conn.transaction():
+                if assets:
+                    await conn.executemany(ASSET_UPSERT, [(sid, h, ip, o, c, d, now)
+                                                          for h, ip, o, c, d, now in assets])
+                # Only this writer adds findings to this scan, so the batch is every id above the max.
+                first = await conn.fetchval("SELECT coalesce(max(id),0) FROM findings WHERE scan_id=$1", sid)
+                if findings:
+                    await conn.copy_records_to_table("findings", records=findings, columns=FINDING_COLUMNS)
+                await conn.execute(BUMP_REVISION, sid)
+                return [tuple(r) for r in await conn.fetch(URGENT_SQL, sid, first)]
+
+class PostgresStorage(Storage):
+    """asyncpg-backed storage so several API/scanner nodes can share one database."""
+
+    def __init__(self, dsn:str, min_size:int=1, max_size:int=PG_POOL_SIZE):
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is required for PostgreSQL storage")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def init(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            await migrate(conn)
+
+    async def close(self):
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            await pool.close()
+
+    async def create_scan(self, domain:str)->int:
+        return await self.pool.fetchval(
+            "INSERT INTO scans(domain,started_at,status) VALUES($1,$2,'running') RETURNING id",
+            domain, int(time.time()))
+
+    async def finish_scan(self, scan_id:int, status:str, stats:dict, progress:dict|None=None):
+        await self.pool.execute("UPDATE scans SET finished_at=$1, status=$2, stats_json=$3, lease_owner=NULL,"
+                                " lease_expires=NULL, progress_json=coalesce($4, progress_json)"
+                                " WHERE id=$5 AND status<>'cancelled'",
+                                int(time.time()), status, json.dumps(stats),
+                                json.dumps(progress) if progress is not None else None, scan_id)
+
+    async def enqueue_scan(self, domain:str, profile:str='default', time_limit:float|None=None)->int:
+        return await self.pool.fetchval(
+            "INSERT INTO scans(domain,started_at,status,profile,time_limit) VALUES($1,$2,'queued',$3,$4)"
+            " RETURNING id", domain, int(time.time()), profile, time_limit)
+
+    async def lease_scan(self, worker:str, lease:float)->dict|None:
+        now = time.time()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE scans SET status='cancelled', finished_at=$1, lease_owner=NULL, lease_expires=NULL"
+                    " WHERE status='running' AND lease_expires<$2 AND cancel_requested=1", int(now), now)
+                await conn.execute(
+                    "UPDATE scans SET status='error', finished_at=$1, stats_json=$2, lease_owner=NULL,"
+                    " lease_expires=NULL WHERE status='running' AND lease_expires<$3 AND attempts>=$4",
+                    int(now), json.dumps({"error": "worker lost"}), now, db.MAX_ATTEMPTS)
+                # SKIP LOCKED lets workers on other nodes claim the next row instead of queueing up.
+                row = await conn.fetchrow(
+                    """UPDATE scans SET status='running', attempts=attempts+1, lease_owner=$1, lease_expires=$2
+                       WHERE id=(SELECT id FROM scans WHERE status='queued' OR (status='running' AND lease_expires<$3)
+                                 ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED)
+                       RETURNING *""", worker, now + lease, now)
+        return dict(row) if row else None
+
+    async def heartbeat_scan(self, scan_id:int, worker:str, lease:float, progress:dict|None=None)->bool:
+        status = await self.pool.execute(
+            "UPDATE scans SET lease_expires=$1, progress_json=coalesce($2, progress_json)"
+            " WHERE id=$3 AND lease_owner=$4 AND status='running' AND cancel_requested=0",
+            time.time() + lease, json.dumps(progress) if progress is not None else None, scan_id, worker)
+        return status == "UPDATE 1"
+
+    async def cancel_scan(self, scan_id:int)->dict|None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("UPDATE scans SET status='cancelled', finished_at=$1 WHERE id=$2"
+                                   " AND (status='queued' OR (status='running' AND lease_owner IS NULL))",
+                                   int(time.time()), scan_id)
+                await conn.execute("UPDATE scans SET cancel_requested=1 WHERE id=$1 AND status='running'", scan_id)
+                row = await conn.fetchrow("SELECT * FROM scans WHERE id=$1", scan_id)
+        return dict(row) if row else None
+
+    async def list_active_scans(self)->list[dict]:
+        return [dict(r) for r in await self.pool.fetch(
+            "SELECT id, domain, status, cancel_requested, progress_json FROM scans"
+            " WHERE status IN ('queued','running') ORDER BY id")]
+
+    async def clear_scan_results(self, scan_id:int):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for table in ("findings", "assets", "finding_states"):
+                    await conn.execute(f"DELETE FROM {table} WHERE scan_id=$1", scan_id)
+                await conn.execute(REBUILD_LATEST, scan_id)
+                await conn.execute("DELETE FROM finding_latest WHERE scan_id=$1", scan_id)
+                await conn.execute(BUMP_REVISION, scan_id)
+
+    async def get_scan(self, scan_id:int)->dict|None:
+        row = await self.pool.fetchrow("SELECT * FROM scans WHERE id=$1", scan_id)
+        return dict(row) if row else None
+
+    async def list_scans(self)->list[dict]:
+        return [dict(r) for r in await self.pool.fetch("SELECT * FROM scans ORDER BY id DESC")]
+
+    async def add_events(self, events:list[dict]):
+        async with self.pool.acquire() as conn:
+            event_id = await conn.fetchval("INSERT INTO events(created_at,payload) VALUES($1,$2) RETURNING id",
+                                           time.time(), json.dumps(events))
+            await conn.execute("DELETE FROM events WHERE id<=$1", event_id - db.EVENTS_RETAIN)
+
+    async def list_events(self, after_id:int, limit:int=100)->list[tuple[int,list[dict]]]:
+        # Sequence ids can commit out of order across nodes; telemetry tolerates a rare miss.
+        rows = await self.pool.fetch("SELECT id, payload FROM events WHERE id>$1 ORDER BY id LIMIT $2",
+                                     after_id, limit)
+        return [(r["id"], json.loads(r["payload"])) for r in rows]
+
+    async def last_event_id(self)->int:
+        return await self.pool.fetchval("SELECT coalesce(max(id),0) FROM events")
+
+    async def upsert_asset(self, scan_id:int, host:str, ip:str|None, *, owner_email:str|None=None,
+                           criticality:int|None=None, data_class:str|None=None):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(ASSET_UPSERT, scan_id, host, ip, owner_email, criticality, data_class,
+                                   int(time.time()))
+                await conn.execute(BUMP_REVISION, scan_id)
+
+    async def list_assets(self, scan_id:int)->list[dict]:
+        return [dict(r) for r in await self.pool.fetch("SELECT * FROM assets WHERE scan_id=$1 ORDER BY id", scan_id)]
+
+    async def add_finding(self, scan_id:int, host:str, ip:str|None, port:int|None, proto:str|None,
+                          severity:str, title:str, description:str, evidence:dict,
+                          risk_score:float=0, controls:dict|None=None):
+        key = db.dedupe_key(host, ip, port, proto, title)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                owner_email = await conn.fetchval(OWNER_SQL, scan_id, host, ip)
+                finding_id = await conn.fetchval(
+                    f"INSERT INTO findings({','.join(FINDING_COLUMNS)}) VALUES({','.join(f'${i}' for i in range(1, 15))}) RETURNING id",
+                    scan_id, host, ip, port, proto, severity, title, description, json.dumps(evidence),
+                    float(risk_score), json.dumps(controls or {}), int(time.time()), key, db.fingerprint(key))
+                await conn.execute(BUMP_REVISION, scan_id)
+        if severity in ("high", "critical"):
+            _side_effects([(finding_id, owner_email, severity, title, description)])
+
+    async def list_findings_page(self, scan_id:int, sort:str='risk_score', desc:bool=True, after:tuple|None=None,
+                                 limit:int=100, severity:list[str]|None=None, host:str|None=None,
+                                 port:int|None=None)->list[dict]:
+        sql, params = db.findings_page_query(scan_id, sort, desc, after, limit, severity, host, port,
+                                             mark=lambda i: f"${i}")
+        return [dict(r) for r in await self.pool.fetch(sql, *params)]
+
+    async def list_findings(self, scan_id:int)->list[dict]:
+        return [dict(r) for r in await self.pool.fetch("SELECT * FROM findings WHERE scan_id=$1 ORDER BY id", scan_id)]
+
+    def scan_writer(self, scan_id:int)->PgScanWriter:
+        return PgScanWriter(self, scan_id)
+
+    async def compute_state_transitions(self, scan_id:int)->dict[str,set[str]]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                prev = await conn.fetchval(
+                    "SELECT p.id FROM scans s JOIN scans p ON p.domain=s.domain AND p.id<s.id"
+                    " WHERE s.id=$1 ORDER BY p.id DESC LIMIT 1", scan_id)
+                rows = await conn.fetch(NEW_SQL, scan_id, prev)
+                resolved = {r[0] for r in await conn.fetch(
+                    "SELECT s.dedupe_key FROM finding_states s" + RESOLVED_WHERE, scan_id, prev)}
+                await conn.execute(
+                    """INSERT INTO finding_states(scan_id,dedupe_key,fingerprint,state)
+                       SELECT DISTINCT ON (fingerprint) scan_id, dedupe_key, fingerprint, 'open'
+                       FROM findings WHERE scan_id=$1""", scan_id)
+                await conn.execute(
+                    """INSERT INTO finding_states(scan_id,dedupe_key,fingerprint,state)
+                       SELECT $1, s.dedupe_key, s.fingerprint, 'resolved' FROM finding_states s""" + RESOLVED_WHERE,
+                    scan_id, prev)
+                await conn.execute(
+                    """INSERT INTO finding_latest(fingerprint,dedupe_key,scan_id,state)
+                       SELECT fingerprint, dedupe_key, scan_id, state FROM finding_states WHERE scan_id=$1
+                       ON CONFLICT (fingerprint) DO UPDATE SET dedupe_key=EXCLUDED.dedupe_key,
+                         scan_id=EXCLUDED.scan_id, state=EXCLUDED.state
+                       WHERE EXCLUDED.scan_id >= finding_latest.scan_id""", scan_id)
+        regressed = {key for key, state in rows if state == 'resolved'}
+        new = {key for key, _ in rows} - regressed
+        return {'new': new, 'resolved': resolved, 'regressed': regressed}
+
+    async def add_connector_aws(self, role_arn:str, external_id:str):
+        await self.pool.execute(
+            "INSERT INTO connectors(org,kind,role_arn,external_id,created_at) VALUES('default','aws',$1,$2,$3)",
+            role_arn, external_id, int(time.time()))
+
+    async def get_connectors(self, kind:str='aws')->list[dict]:
+        return [dict(r) for r in await self.pool.fetch("SELECT * FROM connectors WHERE kind=$1", kind)]
+
+    async def add_scope(self, org:str, kind:str, value:str):
+        await self.pool.execute("INSERT INTO scope(org,kind,value) VALUES($1,$2,$3)", org, kind, value)
+
+    async def list_scope(self, org:str='default')->list[dict]:
+        return [dict(r) for r in await self.pool.fetch("SELECT * FROM scope WHERE org=$1", org)]
+
+    async def domain_in_scope(self, domain:str, org:str='default')->bool:
+        return await self.pool.fetchval(
+            """SELECT EXISTS(SELECT 1 FROM scope WHERE org=$1 AND kind='domain'
+               AND ($2=lower(value) OR right($2, length(value)+1)='.' || lower(value)))""", org, domain.lower())
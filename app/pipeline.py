@@ -0,0 +1,310 @@
+import asyncio, time
+from collections import deque
+from typing import AsyncIterable, Callable
+from . import scanner
+from .fingerprint import Fingerprinter
+from .ratelimit import AdaptiveLimiter, limiter_from_env
+from .resolver import AsyncResolver, resolver_from_env
+
+HTTP_PORTS = (80, 8080)
+HTTPS_PORTS = (443, 8443)
+SSH_PORTS = (22,)
+
+_DONE = object()
+
+class PortScheduler:
+    """Round-robin connect-scan scheduler over (ip, port) targets.
+
+    Each unique IP contributes a lazy iterator over the port list and
+    targets are handed out one IP at a time in rotation, so memory is
+    O(active IPs) rather than O(IPs x ports) and a full 1-65535 sweep of one
+    IP neither starves the others nor piles up behind the per-IP cap.
+    """
+
+    def __init__(self, ports:list[int]):
+        self.ports = ports
+        self.active:deque = deque()
+        self.cond = asyncio.Condition()
+        self.closed = False
+        self.total = 0
+        self.handed_out = 0
+
+    async def add(self, ip:str, ports:list[int]|None=None):
+        """Schedule ``ip`` over ``ports`` (default: the scheduler's port list)."""
+        ports = self.ports if ports is None else ports
+        async with self.cond:
+            self.active.append((ip, iter(ports)))
+            self.total += len(ports)
+            self.cond.notify()
+
+    async def close(self):
+        async with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    async def get(self)->tuple[str,int]|None:
+        async with self.cond:
+            while True:
+                while self.active:
+                    ip, it = self.active[0]
+                    port = next(it, None)
+                    if port is None:
+                        self.active.popleft()
+                        continue
+                    self.active.rotate(-1)
+                    self.handed_out += 1
+                    return ip, port
+                if self.closed:
+                    return None
+                await self.cond.wait()
+
+async def _as_targets(targets):
+    if isinstance(targets, dict):
+        for ip, hosts in targets.items():
+            for host in hosts:
+                yield ip, host, None
+    else:
+        async for target in targets:
+            yield target
+
+class ScanPipeline:
+    """Streaming scan engine: crt.sh -> resolve -> port probe -> service probes.
+
+    Stages are worker pools joined by bounded queues, so each host moves on as
+    soon as its own upstream work is finished and queue sizes cap how much
+    pending work is held in memory at once.
+
+    TCP connects and SSH banners are IP-level and run once per unique
+    (ip, port), then fan out to every host resolving to that IP; HTTP and TLS
+    carry the hostname (Host/SNI) and still run per host.
+    """
+
+    def __init__(self, resolver:AsyncResolver|None=None, ports:list[int]|None=None,
+                 resolve_workers:int=100, probe_workers:int|None=None, service_workers:int=100,
+                 tls_concurrency:int=50, queue_size:int=1000, limiter:AdaptiveLimiter|None=None,
+                 on_progress:Callable[[dict], None]|None=None, progress_interval:float=0.5,
+                 on_open:Callable[[str,int], None]|None=None):
+        self.resolver = resolver or resolver_from_env()
+        self.limiter = limiter or limiter_from_env()
+        self.ports = list(ports or scanner.DEFAULT_PORTS)
+        self.resolve_workers = resolve_workers
+        # The adaptive limiter decides how many connects are really in flight;
+        # the worker count only has to cover its ceiling.
+        self.probe_workers = probe_workers or self.limiter.max_limit
+        self.service_workers = service_workers
+        self.tls_concurrency = tls_concurrency
+        self.queue_size = queue_size
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.on_open = on_open
+        self._last_progress = 0.0
+        self.ports_probed = 0
+        self.services_queued = 0
+        self.services_done = 0
+        self.subs:set[str] = set()
+        self.host_ips:dict[str,list[str]] = {}
+        self.cnames:dict[str,list[str]] = {}
+        self.ip_hosts:dict[str,list[str]] = {}
+        self.ip_open:dict[str,set[int]] = {}
+        self.fingerprints:dict[str,dict] = {}
+        self.tls:dict[str,dict] = {}
+        self.ssh_by_ip:dict[tuple[str,int],str] = {}
+
+    async def _stage(self, inq:asyncio.Queue, outq:asyncio.Queue|None, workers:int, handle):
+        async def worker():
+            while True:
+                item = await inq.get()
+                if item is _DONE:
+                    inq.put_nowait(_DONE)
+                    return
+                try:
+                    await handle(item)
+                except Exception:
+                    pass
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        if outq is not None:
+            await outq.put(_DONE)
+
+    async def _resolve(self, host:str):
+        ips, cnames = await self.resolver.resolve(host)
+        self.host_ips[host] = ips
+        if cnames:
+            self.cnames[host] = cnames
+        for ip in ips:
+            await self._add_host(ip, host)
+
+    async def _add_host(self, ip:str, host:str, ports:list[int]|None=None):
+        hosts = self.ip_hosts.setdefault(ip, [])
+        if host in hosts:
+            return
+        hosts.append(host)
+        if len(hosts) == 1:
+            await self.sched.add(ip, ports)
+            return
+        # IP already scheduled for another host: reuse its connect results
+        # and only queue the host-specific probes for ports already open.
+        for p in list(self.ip_open.get(ip, ())):
+            if p in HTTP_PORTS or p in HTTPS_PORTS:
+                await self._queue_service((host, ip, p))
+
+    async def _probe(self, target:tuple[str,int]):
+        ip, p = target
+        state = await self.limiter.probe(ip, lambda timeout: scanner.tcp_probe(ip, p, timeout))
+        self.ports_probed += 1
+        self._report_progress()
+        if state != "open":
+            return
+        self.ip_open.setdefault(ip, set()).add(p)
+        if self.on_open is not None:
+            self.on_open(ip, p)
+        if p in SSH_PORTS:
+            await self._queue_service((None, ip, p))
+        elif p in HTTP_PORTS or p in HTTPS_PORTS:
+            for host in list(self.ip_hosts[ip]):
+                await self._queue_service((host, ip, p))
+
+    async def _queue_service(self, target:tuple[str|None,str,int]):
+        self.services_queued += 1
+        await self.service_q.put(target)
+
+    async def _probe_stage(self):
+        async def worker():
+            while (target := await self.sched.get()) is not None:
+                try:
+                    await self._probe(target)
+                except Exception:
+                    pass
+        await asyncio.gather(*[worker() for _ in range(self.probe_workers)])
+        await self.service_q.put(_DONE)
+
+    def progress(self)->dict:
+        return {
+            "hosts_total": len(self.subs),
+            "hosts_resolved": len(self.host_ips),
+            "ips_total": len(self.ip_hosts),
+            "ports_total": self.sched.total,
+            "ports_probed": self.ports_probed,
+            "open_ports": sum(len(v) for v in self.ip_open.values()),
+            "fingerprints_total": self.services_queued,
+            "fingerprints_done": self.services_done,
+        }
+
+    def _report_progress(self, force:bool=False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.on_progress(self.progress())
+
+    async def _tls(self, host:str, ip:str, port:int)->dict:
+        # Only ports the probe stage found open reach here, and the handshake
+        # goes to that same IP instead of re-resolving the hostname.
+        async with self.tls_sem:
+            try:
+                return await scanner.get_tls_info(host, ip, port)
+            except Exception:
+                return {}
+
+    async def _service(self, target:tuple[str|None,str,int]):
+        try:
+            await self._probe_service(target)
+        finally:
+            self.services_done += 1
+            self._report_progress()
+
+    async def _probe_service(self, target:tuple[str|None,str,int]):
+        h, ip, p = target
+        key = f"{h}|{ip}|{p}"
+        if h is None:
+            self.ssh_by_ip[(ip, p)] = await scanner.get_ssh_banner(ip, p)
+        elif p in HTTP_PORTS:
+            self.fingerprints[key] = await scanner.http_fingerprint(
+                h, ip, "http", p, fingerprinter=self.fingerprinter)
+        elif p in HTTPS_PORTS:
+            self.fingerprints[key], self.tls[key] = await asyncio.gather(
+                scanner.http_fingerprint(h, ip, "https", p, fingerprinter=self.fingerprinter),
+                self._tls(h, ip, p))
+
+    def _setup(self):
+        self.resolve_q:asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.sched = PortScheduler(self.ports)
+        self.service_q:asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.tls_sem = asyncio.Semaphore(self.tls_concurrency)
+        self.subs = set()
+
+    async def run(self, domain:str)->dict:
+        self._setup()
+
+        async def resolve_stage():
+            await self._stage(self.resolve_q, None, self.resolve_workers, self._resolve)
+            await self.sched.close()
+
+        async def source():
+            # Names flow into resolution while the crt.sh response is still streaming.
+            try:
+                async for h in scanner.iter_crtsh_subdomains(domain):
+                    if h not in self.subs:
+                        self.subs.add(h)
+                        await self.resolve_q.put(h)
+            finally:
+                await self.resolve_q.put(_DONE)
+
+        async with Fingerprinter() as self.fingerprinter:
+            await asyncio.gather(
+                source(),
+                resolve_stage(),
+                self._probe_stage(),
+                self._stage(self.service_q, None, self.service_workers, self._service),
+            )
+        self._report_progress(force=True)
+        return self.result()
+
+    async def run_targets(self, targets:dict[str,list[str]]|AsyncIterable[tuple[str,str,list[int]|None]])->dict:
+        """Probe already-resolved targets, skipping discovery and DNS (one shard of a sharded scan).
+
+        ``targets`` maps IP -> hosts, or streams ``(ip, host, ports)`` as names
+        resolve; ``ports`` None means the pipeline's port list.
+        """
+        self._setup()
+
+        async def feed():
+            try:
+                async for ip, host, ports in _as_targets(targets):
+                    self.subs.add(host)
+                    ips = self.host_ips.setdefault(host, [])
+                    if ip not in ips:
+                        ips.append(ip)
+                    await self._add_host(ip, host, ports)
+            finally:
+                await self.sched.close()
+
+        async with Fingerprinter() as self.fingerprinter:
+            await asyncio.gather(
+                feed(),
+                self._probe_stage(),
+                self._stage(self.service_q, None, self.service_workers, self._service),
+            )
+        self._report_progress(force=True)
+        return self.result()
+
+    def result(self)->dict:
+        pairs = sum(len(hosts) for hosts in self.ip_hosts.values())
+        return {
+            "host_ips": {h: self.host_ips.get(h, []) for h in sorted(self.subs)},
+            "cnames": self.cnames,
+            "open_ports": [(h, ip, p) for ip, ports in self.ip_open.items()
+                           for p in ports for h in self.ip_hosts[ip]],
+            "fingerprints": self.fingerprints,
+            "tls": self.tls,
+            "ssh": {f"{h}|{ip}|{p}": banner for (ip, p), banner in self.ssh_by_ip.items()
+                    for h in self.ip_hosts[ip]},
+            "metrics": {
+                "tcp": self.limiter.metrics(),
+                "dedupe": {
+                    "host_ip_pairs": pairs,
+                    "unique_ips": len(self.ip_hosts),
+                    "connects_saved": (pairs - len(self.ip_hosts)) * len(self.ports),
+                },
+            },
+        }
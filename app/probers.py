@@ -1,4 +1,12 @@
-import socket, ssl, datetime, asyncio
+import socket, ssl, datetime, asyncio, hashlib
+try:
+    from cryptography import x509  # optional
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.hazmat.primitives.asymmetric import dsa, ec, ed448, ed25519, rsa
+    # Raised by malformed certificates (common on embedded devices).
+    CERT_ERRORS = (ValueError, UnsupportedAlgorithm, x509.DuplicateExtension, x509.UnsupportedGeneralNameType)
+except ImportError:
+    x509 = None
 
 def get_tls_cert_info(host: str, port: int = 443, timeout: float = 3.0) -> dict:
     ctx = ssl.create_default_context()
@@ -21,6 +29,81 @@ def get_tls_cert_info(host: str, port: int = 443, timeout: float = 3.0) -> dict:
                 info["days_to_expiry"] = (dt - datetime.datetime.utcnow()).days
     return info
 
+def _name_text(name)->str:
+    return " ".join(f"{getattr(a.oid, '_name', a.oid.dotted_string)}={a.value}" for a in name)
+
+def decode_cert(der:bytes)->dict:
+    """Decode a DER certificate into the fields reported by the TLS prober.
+
+    A certificate that does not parse is reported as its hash and ``error``.
+    """
+    out = {"sha256": hashlib.sha256(der).hexdigest()}
+    if x509 is None:
+        return out
+    try:
+        return _decode_cert(der, out)
+    except CERT_ERRORS as e:
+        return {"sha256": out["sha256"], "error": str(e)[:200] or type(e).__name__}
+
+def _decode_cert(der:bytes, out:dict)->dict:
+    cert = x509.load_der_x509_certificate(der)
+    not_after = cert.not_valid_after_utc.replace(tzinfo=None)
+    out["subject"] = _name_text(cert.subject)
+    out["issuer"] = _name_text(cert.issuer)
+    out["not_after"] = not_after.isoformat() + "Z"
+    out["days_to_expiry"] = (not_after - datetime.datetime.utcnow()).days
+    try:
+        ext = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+        out["sans"] = [str(v) for v in ext.value.get_values_for_type(x509.DNSName)] + \
+                      [str(v) for v in ext.value.get_values_for_type(x509.IPAddress)]
+    except x509.ExtensionNotFound:
+        out["sans"] = []
+    key = cert.public_key()
+    if isinstance(key, rsa.RSAPublicKey):
+        out["key_type"], out["key_size"] = "RSA", key.key_size
+    elif isinstance(key, ec.EllipticCurvePublicKey):
+        out["key_type"], out["key_size"] = f"EC-{key.curve.name}", key.key_size
+    elif isinstance(key, dsa.DSAPublicKey):
+        out["key_type"], out["key_size"] = "DSA", key.key_size
+    elif isinstance(key, ed25519.Ed25519PublicKey):
+        out["key_type"], out["key_size"] = "Ed25519", 256
+    elif isinstance(key, ed448.Ed448PublicKey):
+        out["key_type"], out["key_size"] = "Ed448", 456
+    return out
+
+async def get_tls_info(host:str, ip:str, port:int=443, timeout:float=3.0) -> dict:
+    """Async TLS inspection of ``ip:port`` presenting ``host`` as SNI.
+
+    Callers pass the IP the port stage already found open, so no name
+    resolution or separate reachability check happens here.
+    """
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(ip, port, ssl=ctx, server_hostname=host, ssl_handshake_timeout=timeout),
+        timeout)
+    try:
+        sslobj = writer.get_extra_info("ssl_object")
+        leaf = sslobj.getpeercert(binary_form=True)
+        # get_unverified_chain() exists on Python 3.13+; older versions only expose the leaf.
+        chain_fn = getattr(sslobj, "get_unverified_chain", None)
+        chain = [c if isinstance(c, bytes) else ssl.PEM_cert_to_DER_cert(c.public_bytes()) for c in chain_fn()] \
+            if chain_fn else [leaf]
+        cipher = sslobj.cipher()
+        proto = sslobj.version()
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+    info = decode_cert(leaf) if leaf else {}
+    info["protocol"] = proto
+    info["cipher"] = cipher[0] if cipher else ""
+    info["chain"] = [decode_cert(der) for der in chain if der]
+    return info
+
 async def get_ssh_banner(ip: str, port: int = 22, timeout: float = 2.0) -> str:
     try:
         reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
@@ -0,0 +1,183 @@
+import asyncio, os, time
+from collections import defaultdict
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+
+FD_RESERVE = 128
+
+def fd_budget(default:int=1024)->int:
+    """Sockets a scan may hold open: the soft RLIMIT_NOFILE minus a reserve."""
+    if resource is None:
+        return default
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return default
+    return max(16, soft - FD_RESERVE)
+
+class TokenBucket:
+    """Global packets-per-second ceiling shared by all probes of a scan."""
+
+    def __init__(self, rate:float, burst:float|None=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate / 10)
+        self.tokens = self.burst
+        self.clock = clock
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RTTEstimator:
+    """Per-host smoothed RTT (RFC 6298) used to size connect timeouts."""
+
+    def __init__(self, initial:float=1.0, min_timeout:float=0.5, max_timeout:float=5.0):
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt:dict[str,float] = {}
+        self.rttvar:dict[str,float] = {}
+
+    def sample(self, key:str, rtt:float):
+        if key not in self.srtt:
+            self.srtt[key] = rtt
+            self.rttvar[key] = rtt / 2
+            return
+        self.rttvar[key] = 0.75 * self.rttvar[key] + 0.25 * abs(self.srtt[key] - rtt)
+        self.srtt[key] = 0.875 * self.srtt[key] + 0.125 * rtt
+
+    def responsive(self, key:str)->bool:
+        return key in self.srtt
+
+    def timeout(self, key:str)->float:
+        if key not in self.srtt:
+            return self.initial
+        rto = self.srtt[key] + 4 * self.rttvar[key]
+        return min(self.max_timeout, max(self.min_timeout, rto))
+
+class AdaptiveLimiter:
+    """AIMD concurrency control for TCP connect probes.
+
+    The in-flight window grows by roughly one per window of completed probes
+    and halves (at most once per ``cooldown``) on local connect errors or on
+    timeouts from hosts that have answered before, which is how upstream rate
+    limiting and ephemeral-port exhaustion show up. Timeouts from hosts that
+    never answered, unreachable targets and cancelled probes leave the window
+    alone. Each target
+    IP is capped at ``per_ip`` concurrent probes and all probes share a
+    packets-per-second ceiling.
+    """
+
+    def __init__(self, initial:int=100, min_limit:int=10, max_limit:int=500, pps:float=2000,
+                 per_ip:int=16, retries:int=1, cooldown:float=0.5,
+                 rtt:RTTEstimator|None=None, clock=time.monotonic):
+        self.limit = float(min(initial, max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.per_ip = per_ip
+        self.retries = retries
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rtt = rtt or RTTEstimator()
+        self.bucket = TokenBucket(pps, clock=clock) if pps else None
+        self.in_flight = 0
+        self.ip_in_flight:dict[str,int] = defaultdict(int)
+        self.ip_caps:dict[str,int] = {}
+        self.cond = asyncio.Condition()
+        self.last_decrease = 0.0
+        self.started = clock()
+        self.counters = {"attempts": 0, "open": 0, "closed": 0, "filtered": 0, "errors": 0,
+                         "retries": 0, "recovered": 0, "decreases": 0}
+        self.limit_low = self.limit_high = self.limit
+
+    async def acquire(self, ip:str):
+        async with self.cond:
+            await self.cond.wait_for(
+                lambda: self.in_flight < int(self.limit) and self.ip_in_flight[ip] < self.ip_caps.get(ip, self.per_ip))
+            self.in_flight += 1
+            self.ip_in_flight[ip] += 1
+        if self.bucket is not None:
+            await self.bucket.acquire()
+
+    def share_ip(self, ip:str, shares:int):
+        """Cap ``ip`` at 1/``shares`` of the per-IP budget, its ports being split over that many limiters."""
+        self.ip_caps[ip] = max(1, self.per_ip // shares)
+
+    async def release(self, ip:str, state:str, rtt:float):
+        if state in ("open", "closed"):
+            self.rtt.sample(ip, rtt)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif state == "error" or (state == "timeout" and self.rtt.responsive(ip)):
+            now = self.clock()
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.last_decrease = now
+                self.counters["decreases"] += 1
+        self.limit_low = min(self.limit_low, self.limit)
+        self.limit_high = max(self.limit_high, self.limit)
+        async with self.cond:
+            self.in_flight -= 1
+            self.ip_in_flight[ip] -= 1
+            if not self.ip_in_flight[ip]:
+                del self.ip_in_flight[ip]
+            self.cond.notify_all()
+
+    async def probe(self, ip:str, attempt)->str:
+        """Run ``attempt(timeout) -> (state, rtt)`` under the limiter with retries.
+
+        States are ``open``, ``closed`` (refused), ``timeout``, ``filtered``
+        (unreachable) and ``error`` (local congestion). Timeouts are only
+        retried for hosts known to be responsive; filtered targets are not.
+        """
+        state = "error"
+        for n in range(self.retries + 1):
+            if n:
+                self.counters["retries"] += 1
+            await self.acquire(ip)
+            state, rtt = "error", 0.0
+            try:
+                state, rtt = await attempt(self.rtt.timeout(ip) * (2 ** n))
+            except asyncio.CancelledError:
+                state = "cancelled"  # released without a congestion signal
+                raise
+            finally:
+                self.counters["attempts"] += 1
+                await self.release(ip, state, rtt)
+            if state in ("open", "closed"):
+                if n:
+                    self.counters["recovered"] += 1
+                break
+            if state == "filtered" or (state == "timeout" and not self.rtt.responsive(ip)):
+                break
+        key = {"timeout": "filtered", "error": "errors"}.get(state, state)
+        self.counters[key] += 1
+        return state
+
+    def metrics(self)->dict:
+        elapsed = max(self.clock() - self.started, 1e-9)
+        return {
+            **self.counters,
+            "limit": round(self.limit, 2),
+            "limit_low": round(self.limit_low, 2),
+            "limit_high": round(self.limit_high, 2),
+            "elapsed": round(elapsed, 3),
+            "pps": round(self.counters["attempts"] / elapsed, 2),
+        }
+
+def limiter_from_env(share:int=1)->AdaptiveLimiter:
+    """Limiter from the environment; ``share`` splits the global budgets across that many processes."""
+    return AdaptiveLimiter(
+        max_limit=max(1, min(int(os.environ.get("SMBSEC_TCP_MAX_CONCURRENCY", 500)), fd_budget()) // share),
+        pps=float(os.environ.get("SMBSEC_TCP_PPS", 2000)) / share,
+        per_ip=int(os.environ.get("SMBSEC_TCP_PER_IP", 16)),
+    )
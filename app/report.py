@@ -1,8 +1,11 @@
 from jinja2 import Template
 from datetime import datetime
+from typing import AsyncIterable, AsyncIterator
 import json
 
-TPL = Template("""
+CHUNK_SIZE = 64 * 1024
+
+SOURCE = """
 <!doctype html><html><head>
 <meta charset="utf-8">
 <title>SMBSEC Report – Scan {{ scan_id }}</title>
@@ -75,14 +78,44 @@ TPL = Template("""
 </table>
 
 </body></html>
-""")
+"""
+
+TPL = Template(SOURCE)
+ASYNC_TPL = Template(SOURCE, enable_async=True)  # loops accept async iterables
+
+def _finished(finished_ts:int)->str:
+    return datetime.utcfromtimestamp(finished_ts).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def _with_controls(f:dict)->dict:
+    f["controls"] = json.loads(f.get("controls_json") or "{}")
+    return f
 
 def render_report(scan_id:int, domain:str, finished_ts:int, assets:list[dict], findings:list[dict], stats:dict|None)->str:
-    fmt = datetime.utcfromtimestamp(finished_ts).strftime("%Y-%m-%d %H:%M:%S UTC")
     for f in findings:
-        cj = f.get("controls_json") or "{}"
-        f["controls"] = json.loads(cj)
-    sorted_findings = sorted(findings, key=lambda x: x.get("risk_score", 0), reverse=True)
+        _with_controls(f)
+    # Same order as the findings API's default keyset sort: risk_score, then id, descending.
+    sorted_findings = sorted(findings, key=lambda x: (x.get("risk_score", 0), x.get("id", 0)), reverse=True)
     fix_queue = sorted_findings[:5]
-    return TPL.render(scan_id=scan_id, domain=domain, finished=fmt, assets=assets,
+    return TPL.render(scan_id=scan_id, domain=domain, finished=_finished(finished_ts), assets=assets,
                       findings=sorted_findings, stats=stats or {}, fix_queue=fix_queue)
+
+async def stream_report(scan_id:int, domain:str, finished_ts:int, assets:list[dict],
+                        findings:AsyncIterable[dict], stats:dict|None, fix_queue:list[dict])->AsyncIterator[str]:
+    """``render_report`` as ~``CHUNK_SIZE`` pieces, pulling ``findings`` (already
+    sorted by risk) only as the template reaches them."""
+    async def rows():
+        async for f in findings:
+            yield _with_controls(f)
+
+    buf:list[str] = []
+    size = 0
+    async for piece in ASYNC_TPL.generate_async(scan_id=scan_id, domain=domain, finished=_finished(finished_ts),
+                                                assets=assets, findings=rows(), stats=stats or {},
+                                                fix_queue=[_with_controls(f) for f in fix_queue]):
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
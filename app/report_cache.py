@@ -0,0 +1,94 @@
+import asyncio, contextlib, glob, gzip, hashlib, os, weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable
+from . import report
+
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "..", "reports")
+REPORT_CACHE_SIZE = int(os.environ.get("SMBSEC_REPORT_CACHE_SIZE", 32))
+# Deploying a new template or renderer must not serve reports rendered by the old one.
+RENDER_VERSION = hashlib.blake2b(Path(report.__file__).read_bytes(), digest_size=8).hexdigest()
+
+def report_etag(scan:dict)->str:
+    """Content hash of everything a rendered report depends on.
+
+    ``revision`` changes with every write to the scan's assets or findings;
+    the rest of the report comes from the scan row itself.
+    """
+    key = "|".join(str(scan[k]) for k in ("id", "revision", "status", "domain", "finished_at", "stats_json"))
+    return hashlib.blake2b(f"{RENDER_VERSION}|{key}".encode(), digest_size=16).hexdigest()
+
+class CachedReport:
+    __slots__ = ("etag", "gz")
+
+    def __init__(self, etag:str, gz:bytes):
+        self.etag = etag
+        self.gz = gz
+
+    def html(self)->bytes:
+        return gzip.decompress(self.gz)
+
+class ReportCache:
+    """Rendered reports, gzip-compressed once, in an LRU and on disk.
+
+    A report is re-rendered only when its ETag changes; the disk copy lets
+    reports survive restarts and be shared by API processes on one host.
+    """
+
+    def __init__(self, directory:str=REPORTS_DIR, size:int=REPORT_CACHE_SIZE):
+        self.dir = directory
+        self.size = size
+        self.mem:OrderedDict[int,CachedReport] = OrderedDict()
+        # Held by whoever is rendering or waiting on a scan; dropped once nobody is.
+        self.locks:weakref.WeakValueDictionary[int,asyncio.Lock] = weakref.WeakValueDictionary()
+        self.stats = {"memory": 0, "disk": 0, "render": 0}
+
+    def _path(self, scan_id:int, etag:str)->str:
+        return os.path.join(self.dir, f"scan_{scan_id}.{etag}.html.gz")
+
+    async def get(self, scan:dict, render:Callable[[], Awaitable[str]])->CachedReport:
+        scan_id, etag = scan["id"], report_etag(scan)
+        # One render per scan at a time; concurrent first views wait for it.
+        lock = self.locks.get(scan_id)
+        if lock is None:
+            self.locks[scan_id] = lock = asyncio.Lock()
+        async with lock:
+            hit = self.mem.get(scan_id)
+            if hit is not None and hit.etag == etag:
+                self.mem.move_to_end(scan_id)
+                self.stats["memory"] += 1
+                return hit
+            gz = await asyncio.to_thread(self._load, scan_id, etag)
+            if gz is not None:
+                self.stats["disk"] += 1
+            else:
+                html = await render()
+                gz = await asyncio.to_thread(self._store, scan_id, etag, html)
+                self.stats["render"] += 1
+            self.mem[scan_id] = hit = CachedReport(etag, gz)
+            self.mem.move_to_end(scan_id)
+            while len(self.mem) > self.size:
+                self.mem.popitem(last=False)
+            return hit
+
+    def _load(self, scan_id:int, etag:str)->bytes|None:
+        try:
+            with open(self._path(scan_id, etag), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _store(self, scan_id:int, etag:str, html:str)->bytes:
+        body = html.encode("utf-8")
+        gz = gzip.compress(body, 6)
+        os.makedirs(self.dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(self.dir), f"scan_{scan_id}.*.html.gz")):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stale)
+        path = self._path(scan_id, etag)
+        with open(path + ".tmp", "wb") as f:
+            f.write(gz)
+        os.replace(path + ".tmp", path)
+        with open(os.path.join(self.dir, f"scan_{scan_id}.html"), "wb") as f:
+            f.write(body)
+        return gz
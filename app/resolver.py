@@ -0,0 +1,93 @@
+import asyncio, os, time
+import dns.asyncresolver, dns.exception, dns.nameserver, dns.rdatatype, dns.resolver
+from .dns_cache import DNS_CACHE, DEFAULT_NEG_TTL, DNSCache
+
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_CONCURRENCY = 200
+
+def parse_nameservers(spec:str|None)->list[tuple[str,int]]:
+    """Parse ``"1.1.1.1,8.8.8.8:5353,[::1]:53"`` into (address, port) pairs."""
+    out:list[tuple[str,int]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        port = 53
+        if item.startswith("["):
+            addr, _, rest = item[1:].partition("]")
+            if rest.startswith(":"):
+                port = int(rest[1:])
+        elif item.count(":") == 1:
+            addr, p = item.split(":")
+            port = int(p)
+        else:
+            addr = item
+        out.append((addr, port))
+    return out
+
+def _negative_ttl(responses)->float:
+    """SOA-minimum negative-caching TTL (RFC 2308) from NXDOMAIN/NODATA responses."""
+    ttls = [min(rrset.ttl, rrset[0].minimum)
+            for resp in responses if resp is not None
+            for rrset in resp.authority if rrset.rdtype == dns.rdatatype.SOA]
+    return min(ttls) if ttls else DEFAULT_NEG_TTL
+
+class AsyncResolver:
+    """asyncio-native resolver with bounded concurrency and per-query timeouts."""
+
+    def __init__(self, nameservers:list[tuple[str,int]]|None=None,
+                 timeout:float=DEFAULT_TIMEOUT, concurrency:int=DEFAULT_CONCURRENCY,
+                 cache:DNSCache|None=None):
+        if nameservers:
+            self.resolver = dns.asyncresolver.Resolver(configure=False)
+            self.resolver.nameservers = [dns.nameserver.Do53Nameserver(a, p) for a, p in nameservers]
+        else:
+            try:
+                self.resolver = dns.asyncresolver.Resolver()
+            except dns.resolver.NoResolverConfiguration:
+                self.resolver = dns.asyncresolver.Resolver(configure=False)
+                self.resolver.nameservers = ["1.1.1.1", "8.8.8.8"]
+        self.resolver.timeout = timeout
+        self.resolver.lifetime = timeout
+        self.timeout = timeout
+        self.sem = asyncio.Semaphore(concurrency)
+        self.cache = cache
+
+    async def query(self, name:str, rdtype:str)->list[str]:
+        if self.cache is not None:
+            cached = self.cache.get(name, rdtype)
+            if cached is not None:
+                return cached
+        async with self.sem:
+            try:
+                answer = await self.resolver.resolve(name, rdtype, lifetime=self.timeout, search=False)
+            except dns.resolver.NXDOMAIN as e:
+                self._put(name, rdtype, [], _negative_ttl(e.responses().values()))
+                return []
+            except dns.resolver.NoAnswer as e:
+                self._put(name, rdtype, [], _negative_ttl([e.response()]))
+                return []
+            except (dns.exception.DNSException, asyncio.TimeoutError, OSError):
+                return []
+        values = [r.to_text() for r in answer]
+        # Answer.expiration already reflects the lowest TTL along any CNAME chain.
+        self._put(name, rdtype, values, answer.expiration - time.time())
+        return values
+
+    def _put(self, name:str, rdtype:str, values:list[str], ttl:float):
+        if self.cache is not None:
+            self.cache.put(name, rdtype, values, ttl)
+
+    async def resolve(self, host:str)->tuple[list[str], list[str]]:
+        """Query A, AAAA and CNAME in parallel; return (ips, cnames)."""
+        a, aaaa, cname = await asyncio.gather(
+            self.query(host, "A"), self.query(host, "AAAA"), self.query(host, "CNAME"))
+        return a + aaaa, [c.rstrip(".").lower() for c in cname]
+
+def resolver_from_env()->AsyncResolver:
+    return AsyncResolver(
+        nameservers=parse_nameservers(os.environ.get("SMBSEC_NAMESERVERS")),
+        timeout=float(os.environ.get("SMBSEC_DNS_TIMEOUT", DEFAULT_TIMEOUT)),
+        concurrency=int(os.environ.get("SMBSEC_DNS_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        cache=DNS_CACHE,
+    )
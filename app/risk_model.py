@@ -1,23 +1,14 @@
 from __future__ import annotations
-import json
 from dataclasses import dataclass
-from typing import Dict, List, Tuple, Any, Optional
-from pathlib import Path
-
-# Simple loader for mappings
-def load_mappings() -> Dict[str, Any]:
-    # Prefer JSON for speed; fall back to YAML if present
-    json_path = Path(__file__).resolve().parent.parent / "rules" / "findings_map.json"
-    if json_path.exists():
-        return json.loads(json_path.read_text(encoding="utf-8"))
-    try:
-        import yaml  # optional
-        yml_path = Path(__file__).resolve().parent.parent / "rules" / "findings_map.yaml"
-        return yaml.safe_load(yml_path.read_text(encoding="utf-8"))
-    except Exception:
-        return {"mappings": {}}
-
-MAPPINGS = load_mappings().get("mappings", {})
+from typing import Dict, List, Tuple, Any, Optional, Sequence
+try:
+    import numpy as np  # optional: score_batch falls back to plain Python
+except ImportError:
+    np = None
+from .rules import RULES, Controls, RuleSet, RuleType, NO_CONTROLS
+
+SEVERITY_WEIGHTS = {"info": 0.1, "low": 1.0, "medium": 4.0, "high": 7.0, "critical": 10.0}
+DATA_CLASS_MULT = {"P0": 0.9, "P1": 1.0, "P2": 1.2, "P3": 1.4}
 
 # ---- Domain types -----------------------------------------------------------
 
@@ -43,71 +34,22 @@ class AssetContext:
 class RiskModel:
     @staticmethod
     def categorize(finding: Dict[str, Any]) -> str:
-        """Return canonical finding_type for mapping/controls."""
-        t = finding.get("type", "")
-        port = finding.get("port")
-        title = (finding.get("title") or "").lower()
-
-        # Open TCP ports -> specific classes
-        if t == "tcp" and port:
-            if port == 3389:
-                return "open_port_rdp"
-            if port in (3306,):
-                return "open_port_db_mysql"
-            if port in (5432,):
-                return "open_port_db_postgres"
-            # fallthrough: generic open port isn't mapped; keep scoring via severity
-
-        # HTTP without TLS sibling
-        if t == "http":
-            if (
-                "plain http exposed" in title
-                or "http 200" in title
-                or ("http " in title and " on port 80" in title)
-            ):
-                # We'll confirm HTTPS absence in score()
-                return "http_no_tls"
-
-        # TLS expired/expiring
-        if t == "tls":
-            ev = finding.get("evidence_json") or {}
-            days = ev.get("days_to_expiry")
-            if isinstance(days, int) and days < 0:
-                return "tls_expired"
-
-        # SSH banner
-        if t == "ssh":
-            return "ssh_banner_leak"
-
-        # AWS cloud issues
-        if t == "aws":
-            title = (finding.get("title") or "").lower()
-            if "public s3" in title or "public bucket" in title:
-                return "s3_public_bucket"
-            if "administratoraccess" in title:
-                return "iam_user_admin_access"
-            if "0.0.0.0/0" in finding.get("description",""):
-                return "sg_all_open_0_0_0_0"
-
-        return ""  # unmapped type
+        """Return canonical finding_type for mapping/controls, as matched by the rules file."""
+        rule = RULES.current().match(finding)
+        return rule.name if rule else ""  # "" = unmapped type
 
     @staticmethod
-    def map_controls(finding_type: str) -> Dict[str, List[str]]:
-        m = MAPPINGS.get(finding_type, {})
-        return {
-            "iso27001": m.get("iso27001", []),
-            "cis_controls": m.get("cis_controls", [])
-        }
+    def map_controls(finding_type: str) -> Controls:
+        return RULES.current().controls(finding_type)
 
     @staticmethod
     def _base_severity_weight(sev: str) -> float:
-        return {"info": 0.1, "low": 1.0, "medium": 4.0, "high": 7.0, "critical": 10.0}.get(sev, 1.0)
+        return SEVERITY_WEIGHTS.get(sev, 1.0)
 
     @staticmethod
-    def _mapped_default_severity_weight(finding_type: str) -> float:
-        default_sev = MAPPINGS.get(finding_type, {}).get("default_severity")
-        if default_sev:
-            return RiskModel._base_severity_weight(default_sev)
+    def _mapped_default_severity_weight(rule: Optional[RuleType]) -> float:
+        if rule is not None and rule.severity:
+            return RiskModel._base_severity_weight(rule.severity)
         return 0.0
 
     @staticmethod
@@ -122,12 +64,13 @@ class RiskModel:
           - mapped default severity, or explicit finding severity
           - exposure: internet_exposed
           - asset criticality & data class
-          - http_no_tls penalty if no HTTPS sibling exists
+          - rule penalties, e.g. http_no_tls when no HTTPS sibling exists
         """
-        finding_type = RiskModel.categorize(finding)
+        rule = RULES.current().match(finding)
+        finding_type = rule.name if rule else ""
         sev = (finding.get("severity") or "").lower()
         base = RiskModel._base_severity_weight(sev) if sev else 0.0
-        mapped = RiskModel._mapped_default_severity_weight(finding_type)
+        mapped = RiskModel._mapped_default_severity_weight(rule)
         baseline = max(base, mapped)
 
         # Exposure multiplier
@@ -137,12 +80,12 @@ class RiskModel:
         crit_mult = 0.6 + (asset_ctx.criticality * 0.2)
 
         # Data class multiplier
-        data_mult = {"P0": 0.9, "P1": 1.0, "P2": 1.2, "P3": 1.4}.get(asset_ctx.data_class, 1.0)
+        data_mult = DATA_CLASS_MULT.get(asset_ctx.data_class, 1.0)
 
-        # Special condition: http_no_tls without HTTPS
+        # Rule penalty, e.g. http_no_tls without HTTPS
         tls_penalty = 0.0
-        if finding_type == "http_no_tls" and not sibling_https_open:
-            tls_penalty = 2.0
+        if rule is not None and not sibling_https_open:
+            tls_penalty = rule.penalties.get("no_https_sibling", 0.0)
 
         # Cap & shape
         raw_score = (baseline * exposure * crit_mult * data_mult) + tls_penalty
@@ -155,6 +98,83 @@ class RiskModel:
             "criticality_mult": round(crit_mult, 2),
             "data_mult": data_mult,
             "tls_penalty": tls_penalty,
-            "controls": RiskModel.map_controls(finding_type)
+            "controls": rule.controls if rule else NO_CONTROLS
         }
         return score, details
+
+    @staticmethod
+    def score_batch(
+        types: Sequence[str],
+        ports: Sequence[Optional[int]],
+        severities: Sequence[Optional[str]],
+        titles: Sequence[Optional[str]],
+        contexts: Sequence[AssetContext],
+        ctx_index: Optional[Sequence[int]] = None,
+        sibling_https_open: Optional[Sequence[bool]] = None,
+        descriptions: Optional[Sequence[str]] = None,
+        evidence: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+    ) -> Tuple[Any, List[str], List[Controls]]:
+        """
+        Score findings given as columns; same results as score() per finding.
+        Finding i uses contexts[ctx_index[i]] (contexts[i] without ctx_index).
+        Returns (scores, finding_types, controls): a float64 array (a list
+        without numpy) and, per finding, its type and shared Controls.
+        The whole batch is scored with one version of the rules.
+        """
+        rules: RuleSet = RULES.current()
+        n = len(types)
+        descriptions = [""] * n if descriptions is None else descriptions
+        evidence = [None] * n if evidence is None else evidence
+        # Findings that agree on every field the rules for their type read get the
+        # same rule, so rules are matched once per distinct key.
+        fields = rules.fields
+        codes: Dict[tuple, int] = {}
+        cats: List[Optional[RuleType]] = []
+        cat_idx = []
+        for t, port, title, desc, ev in zip(types, ports, titles, descriptions, evidence):
+            spec = fields.get(t, t)
+            if spec is None:
+                key = (t, port)
+            elif spec is t:  # no rules for this type
+                key = t
+            else:
+                key = (t, port, title if spec[0] else None, desc if spec[1] else None,
+                       tuple(map((ev or {}).get, spec[2])))
+                try:
+                    hash(key)
+                except TypeError:  # list or dict evidence values: match this finding on its own
+                    key = None
+            code = None if key is None else codes.get(key)
+            if code is None:
+                code = len(cats)
+                if key is not None:
+                    codes[key] = code
+                cats.append(rules.lookup(t, port, title, desc, ev))
+            cat_idx.append(code)
+        sev_weight = {s: RiskModel._base_severity_weight(s.lower()) if s else 0.0 for s in set(severities)}
+        cat_weight = [RiskModel._mapped_default_severity_weight(r) for r in cats]
+        cat_penalty = [r.penalties.get("no_https_sibling", 0.0) if r else 0.0 for r in cats]
+        # Kept apart and multiplied in score()'s order so the rounded scores match it exactly.
+        exposure = [1.5 if c.internet_exposed else 1.0 for c in contexts]
+        crit_mult = [0.6 + c.criticality * 0.2 for c in contexts]
+        data_mult = [DATA_CLASS_MULT.get(c.data_class, 1.0) for c in contexts]
+        ctx_index = range(n) if ctx_index is None else ctx_index
+        cat_names = [r.name if r else "" for r in cats]
+        cat_controls = [r.controls if r else NO_CONTROLS for r in cats]
+        finding_types = [cat_names[i] for i in cat_idx]
+        controls = [cat_controls[i] for i in cat_idx]
+        if np is None:
+            scores = []
+            for i, sev, ci, sib in zip(cat_idx, severities, ctx_index, [True] * n if sibling_https_open is None else sibling_https_open):
+                raw = max(sev_weight[sev], cat_weight[i]) * exposure[ci] * crit_mult[ci] * data_mult[ci] \
+                    + (0.0 if sib else cat_penalty[i])
+                scores.append(min(10.0, round(raw, 2)))
+            return scores, finding_types, controls
+        cat_idx = np.asarray(cat_idx, dtype=np.intp)
+        baseline = np.maximum(np.fromiter(map(sev_weight.__getitem__, severities), float, n),
+                              np.asarray(cat_weight, float)[cat_idx])
+        ci = np.asarray(ctx_index, dtype=np.intp)
+        raw = baseline * np.asarray(exposure)[ci] * np.asarray(crit_mult)[ci] * np.asarray(data_mult)[ci]
+        if sibling_https_open is not None:
+            raw += np.where(np.asarray(sibling_https_open, bool), 0.0, np.asarray(cat_penalty, float)[cat_idx])
+        return np.minimum(10.0, np.round(raw, 2)), finding_types, controls
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import json, os, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+try:
+    import yaml  # optional
+except ImportError:
+    yaml = None
+
+RULES_DIR = Path(__file__).resolve().parent.parent / "rules"
+# Prefer JSON for speed; fall back to YAML if present
+RULES_PATH = os.environ.get("SMBSEC_RULES") or str(
+    RULES_DIR / "findings_map.json" if (RULES_DIR / "findings_map.json").exists() else RULES_DIR / "findings_map.yaml")
+RULES_RELOAD = float(os.environ.get("SMBSEC_RULES_RELOAD", 2.0))  # seconds between file checks; <0 never reloads
+PENALTY_CONDITIONS = ("no_https_sibling",)
+MATCH_KEYS = {"type", "port", "title_any", "title_all", "description_any", "evidence_lt", "evidence_gt"}
+
+class Controls(dict):
+    """Read-only control mapping, one instance per finding type shared by all its findings."""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Controls are shared between findings and read-only")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _readonly
+
+def _controls(m: Dict[str, Any]) -> Controls:
+    return Controls(iso27001=tuple(m.get("iso27001", [])), cis_controls=tuple(m.get("cis_controls", [])))
+
+NO_CONTROLS = _controls({})
+
+def _number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+class RuleType:
+    """A canonical finding type: what a finding gets once one of its rules matched."""
+    __slots__ = ("name", "severity", "controls", "penalties")
+
+    def __init__(self, name: str, m: Dict[str, Any]):
+        self.name = name
+        self.severity: Optional[str] = m.get("default_severity")
+        self.controls = _controls(m)
+        self.penalties: Dict[str, float] = {k: float(v) for k, v in (m.get("penalties") or {}).items()}
+        unknown = set(self.penalties) - set(PENALTY_CONDITIONS)
+        if unknown:
+            raise ValueError(f"{name}: unknown penalty condition {sorted(unknown)}")
+
+class _Matcher:
+    __slots__ = ("order", "rule", "title_any", "title_all", "description_any", "evidence_lt", "evidence_gt")
+
+    def __init__(self, order: int, rule: RuleType, block: Dict[str, Any]):
+        self.order = order
+        self.rule = rule
+        self.title_any = tuple(s.lower() for s in block.get("title_any", ()))
+        self.title_all = tuple(s.lower() for s in block.get("title_all", ()))
+        self.description_any = tuple(s.lower() for s in block.get("description_any", ()))
+        self.evidence_lt = tuple(block.get("evidence_lt", {}).items())
+        self.evidence_gt = tuple(block.get("evidence_gt", {}).items())
+
+    def matches(self, title: str, description: str, evidence: Dict[str, Any]) -> bool:
+        if self.title_any and not any(s in title for s in self.title_any):
+            return False
+        if self.title_all and not all(s in title for s in self.title_all):
+            return False
+        if self.description_any and not any(s in description for s in self.description_any):
+            return False
+        for k, bound in self.evidence_lt:
+            v = evidence.get(k)
+            if not _number(v) or not v < bound:
+                return False
+        for k, bound in self.evidence_gt:
+            v = evidence.get(k)
+            if not _number(v) or not v > bound:
+                return False
+        return True
+
+class RuleSet:
+    """Rules from a findings map, compiled into a dispatch index keyed by (type, port).
+
+    Each mapping's ``match`` (one block or a list of alternatives) names a
+    finding ``type`` and optionally ``port`` (int or list), plus substring and
+    evidence predicates. Only the rules indexed under a finding's type and
+    port are tried, first in file order wins, so matching cost does not grow
+    with the number of rules for other types and ports.
+    """
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.types: Dict[str, RuleType] = {}
+        by_port: Dict[Tuple[str, Optional[int]], List[_Matcher]] = {}
+        # Per type: whether any rule reads the title / description, and which evidence keys.
+        fields: Dict[str, Tuple[bool, bool, set]] = {}
+        order = 0
+        for name, m in (doc.get("mappings") or {}).items():
+            self.types[name] = rule = RuleType(name, m)
+            blocks = m.get("match") or []
+            for block in [blocks] if isinstance(blocks, dict) else blocks:
+                unknown = set(block) - MATCH_KEYS
+                if unknown or "type" not in block:
+                    raise ValueError(f"{name}: bad match block {block!r}")
+                t, ports = block["type"], block.get("port")
+                matcher = _Matcher(order, rule, block)
+                order += 1
+                for port in [None] if ports is None else [ports] if isinstance(ports, int) else ports:
+                    by_port.setdefault((t, port), []).append(matcher)
+                title, desc, ev = fields.get(t, (False, False, set()))
+                fields[t] = (title or bool(matcher.title_any or matcher.title_all),
+                             desc or bool(matcher.description_any),
+                             ev | {k for k, _ in matcher.evidence_lt + matcher.evidence_gt})
+        # Rules without a port apply to every port of their type.
+        self.index: Dict[Tuple[str, Optional[int]], Tuple[_Matcher, ...]] = {
+            (t, port): tuple(sorted(ms + (by_port.get((t, None), []) if port is not None else []), key=lambda m: m.order))
+            for (t, port), ms in by_port.items()}
+        # None: the type's rules read only type and port.
+        self.fields = {t: (title, desc, tuple(sorted(ev))) if title or desc or ev else None
+                       for t, (title, desc, ev) in fields.items()}
+
+    def candidates(self, t: str, port: Optional[int]) -> Tuple[_Matcher, ...]:
+        return self.index.get((t, port)) or self.index.get((t, None), ())
+
+    def lookup(self, t: str, port: Optional[int], title: Optional[str], description: Optional[str],
+               evidence: Optional[Dict[str, Any]]) -> Optional[RuleType]:
+        candidates = self.candidates(t, port)
+        if not candidates:
+            return None
+        title, description = (title or "").lower(), (description or "").lower()
+        for m in candidates:
+            if m.matches(title, description, evidence or {}):
+                return m.rule
+        return None
+
+    def match(self, finding: Dict[str, Any]) -> Optional[RuleType]:
+        return self.lookup(finding.get("type", ""), finding.get("port"), finding.get("title"),
+                           finding.get("description"), finding.get("evidence_json"))
+
+    def controls(self, finding_type: str) -> Controls:
+        rule = self.types.get(finding_type)
+        return rule.controls if rule else NO_CONTROLS
+
+def load_rules(path: str) -> Dict[str, Any]:
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise RuntimeError(f"PyYAML is required to read {path}")
+        return yaml.safe_load(text) or {}
+    return json.loads(text)
+
+class RuleEngine:
+    """The current RuleSet for a rules file, recompiled when the file changes.
+
+    ``current()`` stats the file at most every ``reload`` seconds. A reload
+    swaps in a whole new RuleSet, so a caller still holding the old one (a
+    batch being scored) finishes with it. A file that fails to load or
+    compile is reported in ``error`` and the previous rules stay in use.
+    """
+
+    def __init__(self, path: str = RULES_PATH, reload: float = RULES_RELOAD):
+        self.path = path
+        self.reload = reload
+        self.rules = RuleSet({})
+        self.version = 0
+        self.error: Optional[str] = None
+        self.stamp: Optional[Tuple[int, int]] = None
+        self.checked = time.monotonic()
+        self._check()
+
+    def current(self) -> RuleSet:
+        if self.reload >= 0 and time.monotonic() - self.checked >= self.reload:
+            self.checked = time.monotonic()
+            self._check()
+        return self.rules
+
+    def _check(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            self.error = str(e)
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+        try:
+            rules = RuleSet(load_rules(self.path))
+        except Exception as e:
+            self.error = f"{self.path}: {e}"
+            return
+        self.rules, self.error = rules, None
+        self.version += 1
+
+RULES = RuleEngine()
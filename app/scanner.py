@@ -1,131 +1,191 @@
-import asyncio, json, socket, re
-from typing import Iterable
-import httpx
-import dns.resolver
-from .probers import get_tls_cert_info, get_ssh_banner
+import asyncio, errno, json, time
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+from . import ctlog
+from .ctlog import CTCache
+from .probers import get_tls_info, get_ssh_banner  # looked up as scanner.* by the pipeline
+from .resolver import AsyncResolver
+from .fingerprint import Fingerprinter
 
-DEFAULT_PORTS = [80, 443, 22, 25, 110, 143, 465, 587, 993, 995, 3306, 3389, 5432, 6379, 8080, 8443]
+PORT_PROFILES_PATH = Path(__file__).resolve().parent.parent / "rules" / "port_profiles.json"
 
-async def fetch_crtsh_subdomains(domain:str)->set[str]:
-    q = f"https://crt.sh/?q=%25.{domain}&output=json"
-    subdomains:set[str] = set()
+def parse_ports(spec:str)->list[int]:
+    """Expand ``"22,80,8000-8010"`` into a de-duplicated, order-preserving port list."""
+    out:dict[int, None] = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        for p in range(int(lo), int(hi or lo) + 1):
+            if 1 <= p <= 65535:
+                out[p] = None
+    return list(out)
+
+def load_port_profiles(path:Path=PORT_PROFILES_PATH)->tuple[dict[str,list[int]], set[int]]:
+    doc = json.loads(path.read_text(encoding="utf-8"))
+    ranked = parse_ports(doc.get("ranked", ""))
+    profiles:dict[str,list[int]] = {}
+    for name, spec in doc.get("profiles", {}).items():
+        if isinstance(spec, dict):
+            n = int(spec["top"])
+            if len(ranked) < n:
+                raise ValueError(f"{path}: profile {name!r} wants the top {n} ports, ranking has {len(ranked)}")
+            profiles[name] = ranked[:n]
+        else:
+            profiles[name] = parse_ports(spec)
+    return profiles, set(parse_ports(doc.get("risky", "")))
+
+PORT_PROFILES, RISKY_PORTS = load_port_profiles()
+DEFAULT_PROFILE = "default"
+DEFAULT_PORTS = PORT_PROFILES[DEFAULT_PROFILE]
+
+def _names(name_value:str, domain:str)->list[str]:
+    out = []
+    for entry in name_value.split("\n"):
+        entry = entry.strip().lower().rstrip(".")
+        if entry.endswith(domain):
+            out.append(entry)
+    return out
+
+async def iter_crtsh_subdomains(domain:str, cache:CTCache|None=None)->AsyncIterator[str]:
+    """Yield unique subdomains of ``domain`` as they become known.
+
+    The apex and names already in the local CT cache come first, then names
+    from crt.sh certificates newer than the cache's completed watermark as
+    the response streams in. A crt.sh failure or timeout ends the stream but
+    keeps what was already yielded and cached; the watermark only advances
+    after a fetch that streamed to the end, so the next scan refetches
+    everything a cut-off response may have missed.
+    """
+    cache = cache or CTCache()
+    seen = {domain}
+    yield domain
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(q, headers={"User-Agent":"smbsec-mvp/1.0"})
-            if r.status_code == 200:
-                for row in r.json():
-                    name_value = row.get("name_value","")
-                    for entry in name_value.split("\n"):
-                        entry = entry.strip().lower().rstrip(".")
-                        if entry.endswith(domain):
-                            subdomains.add(entry)
+        last_id = await cache.last_id(domain)
+        for nv in await cache.name_values(domain):
+            for name in _names(nv, domain):
+                if name not in seen:
+                    seen.add(name)
+                    yield name
     except Exception:
-        pass
-    subdomains.add(domain)
-    return subdomains
-
-def resolve_host(host:str)->list[str]:
-    ips:list[str] = []
+        last_id = 0
+    batch:list[tuple[int,str]] = []
+    newest, complete = last_id, False
     try:
-        for rdata in dns.resolver.resolve(host, "A"):
-            ips.append(rdata.to_text())
+        async for cert_id, nv in ctlog.stream_crtsh(domain, after_id=last_id):
+            if cert_id is not None:
+                batch.append((cert_id, nv))
+                newest = max(newest, cert_id)
+            for name in _names(nv, domain):
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+            if len(batch) >= ctlog.BATCH:
+                await cache.add(domain, batch)
+                batch = []
+        complete = True
     except Exception:
         pass
     try:
-        for rdata in dns.resolver.resolve(host, "AAAA"):
-            ips.append(rdata.to_text())
+        await cache.add(domain, batch)
+        if complete:
+            await cache.mark_complete(domain, newest)
     except Exception:
         pass
-    return ips
 
-async def tcp_connect(ip:str, port:int, timeout:float=1.0)->bool:
+async def fetch_crtsh_subdomains(domain:str)->set[str]:
+    return {name async for name in iter_crtsh_subdomains(domain)}
+
+# Connect errors that mean this host is short of sockets or ports, not that the target is unreachable.
+LOCAL_CONGESTION = {errno.EADDRNOTAVAIL, errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EAGAIN}
+
+async def tcp_probe(ip:str, port:int, timeout:float=1.0)->tuple[str, float]:
+    """Connect probe returning (state, rtt); state is open, closed, timeout, filtered or error.
+
+    ``error`` is local congestion only; unreachable networks and hosts, or
+    a connect the local firewall refuses, are ``filtered``.
+    """
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=timeout)
+    except asyncio.TimeoutError:
+        return "timeout", timeout
+    except ConnectionRefusedError:
+        return "closed", time.monotonic() - start
+    except OSError as e:
+        return "error" if e.errno in LOCAL_CONGESTION else "filtered", time.monotonic() - start
+    rtt = time.monotonic() - start
+    writer.close()
     try:
-        fut = asyncio.open_connection(ip, port)
-        reader, writer = await asyncio.wait_for(fut, timeout=timeout)
-        writer.close()
-        try:
-            await writer.wait_closed()
-        except Exception:
-            pass
-        return True
+        await writer.wait_closed()
     except Exception:
-        return False
+        pass
+    return "open", rtt
+
+async def tcp_connect(ip:str, port:int, timeout:float=1.0)->bool:
+    return (await tcp_probe(ip, port, timeout))[0] == "open"
+
+async def http_fingerprint(host:str, ip:str, scheme:str, port:int|None=None,
+                           fingerprinter:Fingerprinter|None=None)->dict:
+    if fingerprinter is not None:
+        return await fingerprinter.fingerprint(host, ip, scheme, port)
+    async with Fingerprinter() as fp:
+        return await fp.fingerprint(host, ip, scheme, port)
+
+async def bounded_imap(fn:Callable[[Any], Awaitable], items:Iterable|AsyncIterable, limit:int=200):
+    """Run ``fn(item)`` over ``items`` with at most ``limit`` tasks alive.
+
+    Items are pulled lazily from the (async) iterable only when a slot frees
+    up, and ``(index, item, result)`` is yielded as each task completes so
+    callers can map results back to their targets.
+    """
+    aiter_ = items.__aiter__() if hasattr(items, "__aiter__") else None
+    it = None if aiter_ else iter(items)
+    pending:dict[asyncio.Future, tuple[int, Any]] = {}
+    index = 0
+    exhausted = False
+
+    async def fill():
+        nonlocal index, exhausted
+        while not exhausted and len(pending) < limit:
+            try:
+                item = await aiter_.__anext__() if aiter_ else next(it)
+            except (StopIteration, StopAsyncIteration):
+                exhausted = True
+                return
+            pending[asyncio.ensure_future(fn(item))] = (index, item)
+            index += 1
 
-async def http_fingerprint(host:str, ip:str, scheme:str)->dict:
-    url = f"{scheme}://{host}/"
     try:
-        async with httpx.AsyncClient(timeout=5, verify=(scheme == "https")) as c:
-            r = await c.get(url, headers={"Host": host, "User-Agent": "smbsec-mvp/1.0"})
-            m = re.search(r"<title>(.*?)</title>", r.text, re.IGNORECASE | re.DOTALL)
-            title = m.group(1)[:200] if m else ""
-            return {
-                "status": r.status_code,
-                "server": r.headers.get("server", ""),
-                "hsts": bool(r.headers.get("strict-transport-security")),
-                "location": r.headers.get("location", ""),
-                "headers_sample": dict(list(r.headers.items())[:10]),
-                "title": title,
-            }
-    except Exception as e:
-        return {"error": str(e)[:200]}
+        await fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i, item = pending.pop(task)
+                yield i, item, task.result()
+            await fill()
+    finally:
+        for task in pending:
+            task.cancel()
 
 async def bounded_gather(coros:Iterable, limit:int=200):
-    sem = asyncio.Semaphore(limit)
+    """Await ``coros`` with bounded concurrency, returning results in input order."""
     async def run(coro):
-        async with sem:
-            return await coro
-    return await asyncio.gather(*[run(c) for c in coros])
-
-async def scan_domain(domain:str):
-    subs = await fetch_crtsh_subdomains(domain)
-    host_ips:dict[str,list[str]] = {}
-    for h in sorted(subs):
-        host_ips[h] = resolve_host(h)
-
-    tcp_results = []
-    for h, ips in host_ips.items():
-        for ip in ips or [None]:
-            for p in DEFAULT_PORTS:
-                if ip:
-                    tcp_results.append((h, ip, p))
-    open_ports:set[tuple[str,str,int]] = set()
-    results = await bounded_gather([tcp_connect(ip, p) for (_, ip, p) in tcp_results], limit=500)
-    for (h, ip, p), ok in zip(tcp_results, results):
-        if ok:
-            open_ports.add((h, ip, p))
-
-    http_fp_tasks = []
-    for (h, ip, p) in open_ports:
-        if p in (80, 8080):
-            http_fp_tasks.append(http_fingerprint(h, ip, "http"))
-        elif p in (443, 8443):
-            http_fp_tasks.append(http_fingerprint(h, ip, "https"))
-    http_fps = await bounded_gather(http_fp_tasks, limit=100)
-
-    fp_iter = iter(http_fps)
-    fingerprints:dict[tuple[str,str,int], dict] = {}
-    for (h, ip, p) in open_ports:
-        if p in (80,8080,443,8443):
-            fingerprints[(h,ip,p)] = next(fp_iter, {})
-
-    tls_info = {}
-    for (h, ip, p) in open_ports:
-        if p in (443, 8443):
-            try:
-                tls_info[f"{h}|{ip}|{p}"] = get_tls_cert_info(h, p)
-            except Exception:
-                tls_info[f"{h}|{ip}|{p}"] = {}
-
-    ssh_targets = [(h, ip, p) for (h, ip, p) in open_ports if p == 22]
-    ssh_banners = await bounded_gather([get_ssh_banner(ip, 22) for (_, ip, _) in ssh_targets], limit=100)
-    ssh_map = {}
-    for (h, ip, p), banner in zip(ssh_targets, ssh_banners):
-        ssh_map[f"{h}|{ip}|{p}"] = banner
-
-    return {
-        "host_ips": host_ips,
-        "open_ports": list(open_ports),
-        "fingerprints": {f"{h}|{ip}|{p}": fp for (h,ip,p), fp in fingerprints.items()},
-        "tls": tls_info,
-        "ssh": ssh_map
-    }
+        return await coro
+    results:dict[int, Any] = {}
+    async for i, _, res in bounded_imap(run, coros, limit):
+        results[i] = res
+    return [results[i] for i in range(len(results))]
+
+async def scan_domain(domain:str, resolver:AsyncResolver|None=None, profile:str=DEFAULT_PROFILE,
+                      on_progress:Callable[[dict], None]|None=None, shards:int|None=None,
+                      on_open:Callable[[str,int], None]|None=None):
+    from .sharding import SCAN_SHARDS, sharded_scan
+    shards = shards or SCAN_SHARDS
+    if shards > 1:
+        return await sharded_scan(domain, PORT_PROFILES[profile], shards, resolver=resolver,
+                                  on_progress=on_progress, on_open=on_open)
+    from .pipeline import ScanPipeline
+    return await ScanPipeline(resolver=resolver, ports=PORT_PROFILES[profile],
+                              on_progress=on_progress, on_open=on_open).run(domain)
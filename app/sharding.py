@@ -0,0 +1,238 @@
+import asyncio, multiprocessing, os, zlib
+from typing import AsyncIterable, Callable
+from . import scanner
+from .ratelimit import AdaptiveLimiter, limiter_from_env
+from .resolver import AsyncResolver, resolver_from_env
+
+SCAN_SHARDS = int(os.environ.get("SMBSEC_SCAN_SHARDS", 1))
+SHARD_CHUNK = int(os.environ.get("SMBSEC_SHARD_CHUNK", 4096))  # ports per IP before it is split across shards
+
+def shard_slices(ip:str, nports:int, shards:int)->list[tuple[int,int,int]]:
+    """``(shard, j, spans)`` for each slice ``ports[j::spans]`` of ``ip``'s port list.
+
+    An IP with up to ``SHARD_CHUNK`` ports stays whole on one shard, chosen
+    by CRC32 of the IP, so its fairness cap and (ip, port) dedupe stay local
+    to a process. Longer lists (a full 1-65535 sweep) are dealt out over up
+    to ``shards`` shards, so a sweep of a few IPs still uses every core.
+    """
+    spans = max(1, min(shards, -(-nports // SHARD_CHUNK)))
+    base = zlib.crc32(ip.encode()) % shards
+    return [((base + j) % shards, j, spans) for j in range(spans)]
+
+def _run_shard(ports:list[int], share:int, limiter_kwargs:dict|None, inbox, conn=None)->dict:
+    # Runs in a shard process: its own event loop, its own slice of the connect budget.
+    # Targets arrive on ``inbox`` as the parent resolves them; live progress and
+    # open ports go back over ``conn``.
+    from .pipeline import ScanPipeline
+    limiter = AdaptiveLimiter(**limiter_kwargs) if limiter_kwargs else limiter_from_env(share)
+    pipeline = ScanPipeline(ports=ports, limiter=limiter,
+                            on_progress=None if conn is None else lambda p: conn.send(("progress", p)),
+                            on_open=None if conn is None else lambda ip, port: conn.send(("open", ip, port)))
+
+    async def targets():
+        loop = asyncio.get_running_loop()
+        queue:asyncio.Queue = asyncio.Queue()
+
+        def receive():
+            try:
+                while inbox.poll():
+                    queue.put_nowait(inbox.recv())
+            except EOFError:
+                loop.remove_reader(inbox.fileno())
+                queue.put_nowait(("end",))
+
+        loop.add_reader(inbox.fileno(), receive)
+        try:
+            while (msg := await queue.get())[0] != "end":
+                _, ip, host, j, spans = msg
+                if spans > 1:
+                    limiter.share_ip(ip, spans)
+                yield ip, host, None if spans == 1 else ports[j::spans]
+        finally:
+            loop.remove_reader(inbox.fileno())
+
+    out = asyncio.run(pipeline.run_targets(targets()))
+    out["progress"] = pipeline.progress()
+    return out
+
+def _shard_main(conn, *args):
+    try:
+        conn.send(("done", _run_shard(*args, conn=conn)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+def merge_tcp_metrics(parts:list[dict])->dict:
+    out:dict = {}
+    for m in parts:
+        for k, v in m.items():
+            if k == "elapsed":
+                out[k] = max(out.get(k, 0), v)
+            else:
+                out[k] = round(out.get(k, 0) + v, 2)
+    return out
+
+def merge_results(host_ips:dict, cnames:dict, parts:list[dict], ports:list[int])->dict:
+    """Fold per-shard pipeline results back into the ``scan_domain`` shape."""
+    out = {"host_ips": host_ips, "cnames": cnames, "open_ports": [], "fingerprints": {}, "tls": {}, "ssh": {}}
+    for r in parts:
+        out["open_ports"].extend(r["open_ports"])
+        for k in ("fingerprints", "tls", "ssh"):
+            out[k].update(r[k])
+    # From the parent's view: an IP split across shards is still one IP.
+    pairs = sum(len(set(v)) for v in host_ips.values())
+    ips = len({ip for v in host_ips.values() for ip in v})
+    out["metrics"] = {
+        "tcp": merge_tcp_metrics([r["metrics"]["tcp"] for r in parts]),
+        "dedupe": {"host_ip_pairs": pairs, "unique_ips": ips, "connects_saved": (pairs - ips) * len(ports)},
+        "shards": [r["metrics"]["tcp"] for r in parts],
+    }
+    return out
+
+async def _pairs(ip_hosts:dict[str,list[str]]):
+    for ip, hosts in ip_hosts.items():
+        for host in hosts:
+            yield ip, host
+
+async def scan_targets(targets:dict[str,list[str]]|AsyncIterable[tuple[str,str]], ports:list[int], shards:int,
+                       limiter_kwargs:dict|None=None, on_progress:Callable[[dict], None]|None=None,
+                       on_open:Callable[[str,int], None]|None=None)->list[dict]:
+    """Probe targets across ``shards`` processes; returns the per-shard results.
+
+    ``targets`` maps IP -> hosts, or streams ``(ip, host)`` pairs: the shards
+    start on the first one and probe while the rest still resolve. Each IP's
+    ports are placed by ``shard_slices``. ``on_progress`` gets the shards'
+    summed progress and ``on_open`` each open port as the shards report them.
+    Cancelling the call terminates the shard processes rather than waiting
+    for them to finish.
+    """
+    if isinstance(targets, dict):
+        targets = _pairs(targets)
+    loop = asyncio.get_running_loop()
+    # spawn, not fork: the parent holds sqlite and resolver threads.
+    ctx = multiprocessing.get_context("spawn")
+    results:dict[int,dict] = {}
+    progress:list[dict] = [{} for _ in range(shards)]
+    finished = loop.create_future()
+    procs, conns, inboxes = [], [], []
+
+    def receive(i:int, conn):
+        try:
+            while conn.poll():
+                kind, *msg = conn.recv()
+                if kind == "open" and on_open is not None:
+                    on_open(*msg)
+                elif kind == "progress":
+                    progress[i] = msg[0]
+                    if on_progress is not None:
+                        on_progress(merge_progress(progress))
+                elif kind == "done":
+                    results[i] = msg[0]
+                    if len(results) == shards and not finished.done():
+                        finished.set_result(None)
+                elif kind == "error" and not finished.done():
+                    finished.set_exception(RuntimeError(f"shard {i} failed: {msg[0]}"))
+        except EOFError:
+            loop.remove_reader(conn.fileno())
+            if i not in results and not finished.done():
+                finished.set_exception(RuntimeError(f"shard {i} exited without a result"))
+
+    def start():
+        for i in range(shards):
+            r, w = ctx.Pipe(duplex=False)
+            inbox, send = ctx.Pipe(duplex=False)
+            conns.append(r)
+            inboxes.append(send)
+            procs.append(ctx.Process(target=_shard_main, args=(w, ports, shards, limiter_kwargs, inbox), daemon=True))
+            procs[-1].start()
+            w.close()
+            inbox.close()
+            loop.add_reader(r.fileno(), receive, i, r)
+
+    async def feed():
+        placed:dict[str,list[tuple[int,int,int]]] = {}
+        try:
+            async for ip, host in targets:
+                if not procs:
+                    start()
+                if ip not in placed:
+                    placed[ip] = shard_slices(ip, len(ports), shards)
+                # Later hosts of a known IP go to the same slices, for their service probes.
+                for shard, j, spans in placed[ip]:
+                    inboxes[shard].send(("target", ip, host, j, spans))
+            for inbox in inboxes:
+                inbox.send(("end",))
+            if not procs and not finished.done():
+                finished.set_result(None)
+        except Exception as e:
+            if not finished.done():
+                finished.set_exception(e)
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        await finished
+        return [results[i] for i in sorted(results)]
+    finally:
+        feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+        for conn in conns:
+            loop.remove_reader(conn.fileno())
+            conn.close()
+        for inbox in inboxes:
+            inbox.close()
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        await asyncio.to_thread(lambda: [p.join() for p in procs])
+
+def merge_progress(parts:list[dict])->dict:
+    """Sum per-shard ``progress()`` dicts."""
+    out:dict = {}
+    for p in parts:
+        for k, v in p.items():
+            out[k] = out.get(k, 0) + v
+    return out
+
+async def sharded_scan(domain:str, ports:list[int], shards:int=SCAN_SHARDS,
+                       resolver:AsyncResolver|None=None, resolve_workers:int=100,
+                       on_progress:Callable[[dict], None]|None=None,
+                       on_open:Callable[[str,int], None]|None=None)->dict:
+    """Discover and resolve in this process, probing across ``shards`` processes.
+
+    Each resolved IP goes to the shards as soon as it is known, so probing
+    overlaps discovery and DNS. Progress and open ports reported by the
+    shards are forwarded to ``on_progress`` and ``on_open`` as they arrive.
+    """
+    resolver = resolver or resolver_from_env()
+    host_ips:dict[str,list[str]] = {}
+    cnames:dict[str,list[str]] = {}
+    ip_hosts:dict[str,list[str]] = {}
+    seen:set[str] = set()
+
+    async def names():
+        # Resolution starts while crt.sh is still streaming.
+        async for h in scanner.iter_crtsh_subdomains(domain):
+            if h not in seen:
+                seen.add(h)
+                yield h
+
+    async def resolved():
+        async for _, host, (ips, cn) in scanner.bounded_imap(resolver.resolve, names(), resolve_workers):
+            host_ips[host] = ips
+            if cn:
+                cnames[host] = cn
+            for ip in dict.fromkeys(ips):
+                ip_hosts.setdefault(ip, []).append(host)
+                yield ip, host
+
+    def counts()->dict:
+        # Shards only see their own slices; host and IP totals come from this process.
+        return {"hosts_total": len(seen), "hosts_resolved": len(host_ips), "ips_total": len(ip_hosts)}
+
+    parts = await scan_targets(resolved(), ports, shards,
+                               on_progress=None if on_progress is None else lambda p: on_progress({**p, **counts()}),
+                               on_open=on_open)
+    if on_progress is not None:
+        on_progress({**merge_progress([r["progress"] for r in parts]), **counts()})
+    return merge_results({h: host_ips.get(h, []) for h in sorted(seen)}, cnames, parts, ports)
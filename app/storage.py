@@ -0,0 +1,84 @@
+import os
+from . import db
+
+class Storage:
+    """Persistence API shared by the web app and scanners.
+
+    ``SQLiteStorage`` is the single-node default; ``PostgresStorage``
+    (``app.pg_storage``) lets several API/scanner processes share state.
+    """
+
+    async def init(self): raise NotImplementedError
+    async def close(self): raise NotImplementedError
+    async def create_scan(self, domain:str)->int: raise NotImplementedError
+    async def finish_scan(self, scan_id:int, status:str, stats:dict, progress:dict|None=None):
+        raise NotImplementedError
+    async def enqueue_scan(self, domain:str, profile:str='default', time_limit:float|None=None)->int:
+        raise NotImplementedError
+    async def lease_scan(self, worker:str, lease:float)->dict|None: raise NotImplementedError
+    async def heartbeat_scan(self, scan_id:int, worker:str, lease:float, progress:dict|None=None)->bool:
+        raise NotImplementedError
+    async def cancel_scan(self, scan_id:int)->dict|None: raise NotImplementedError
+    async def list_active_scans(self)->list[dict]: raise NotImplementedError
+    async def clear_scan_results(self, scan_id:int): raise NotImplementedError
+    async def get_scan(self, scan_id:int)->dict|None: raise NotImplementedError
+    async def list_scans(self)->list[dict]: raise NotImplementedError
+    async def add_events(self, events:list[dict]): raise NotImplementedError
+    async def list_events(self, after_id:int, limit:int=100)->list[tuple[int,list[dict]]]: raise NotImplementedError
+    async def last_event_id(self)->int: raise NotImplementedError
+    async def upsert_asset(self, scan_id:int, host:str, ip:str|None, *, owner_email:str|None=None,
+                           criticality:int|None=None, data_class:str|None=None): raise NotImplementedError
+    async def list_assets(self, scan_id:int)->list[dict]: raise NotImplementedError
+    async def add_finding(self, scan_id:int, host:str, ip:str|None, port:int|None, proto:str|None,
+                          severity:str, title:str, description:str, evidence:dict,
+                          risk_score:float=0, controls:dict|None=None): raise NotImplementedError
+    async def list_findings(self, scan_id:int)->list[dict]: raise NotImplementedError
+    async def list_findings_page(self, scan_id:int, sort:str='risk_score', desc:bool=True, after:tuple|None=None,
+                                 limit:int=100, severity:list[str]|None=None, host:str|None=None,
+                                 port:int|None=None)->list[dict]: raise NotImplementedError
+    def scan_writer(self, scan_id:int)->db.ScanWriter: raise NotImplementedError
+    async def compute_state_transitions(self, scan_id:int)->dict[str,set[str]]: raise NotImplementedError
+    async def add_connector_aws(self, role_arn:str, external_id:str): raise NotImplementedError
+    async def get_connectors(self, kind:str='aws')->list[dict]: raise NotImplementedError
+    async def add_scope(self, org:str, kind:str, value:str): raise NotImplementedError
+    async def list_scope(self, org:str='default')->list[dict]: raise NotImplementedError
+    async def domain_in_scope(self, domain:str, org:str='default')->bool: raise NotImplementedError
+
+class SQLiteStorage(Storage):
+    """The pooled SQLite database in ``app.db`` (``db.DB_PATH``)."""
+
+    init = staticmethod(db.init_db)
+    close = staticmethod(db.close_pool)
+    create_scan = staticmethod(db.create_scan)
+    finish_scan = staticmethod(db.finish_scan)
+    enqueue_scan = staticmethod(db.enqueue_scan)
+    lease_scan = staticmethod(db.lease_scan)
+    heartbeat_scan = staticmethod(db.heartbeat_scan)
+    cancel_scan = staticmethod(db.cancel_scan)
+    list_active_scans = staticmethod(db.list_active_scans)
+    clear_scan_results = staticmethod(db.clear_scan_results)
+    get_scan = staticmethod(db.get_scan)
+    list_scans = staticmethod(db.list_scans)
+    add_events = staticmethod(db.add_events)
+    list_events = staticmethod(db.list_events)
+    last_event_id = staticmethod(db.last_event_id)
+    upsert_asset = staticmethod(db.upsert_asset)
+    list_assets = staticmethod(db.list_assets)
+    add_finding = staticmethod(db.add_finding)
+    list_findings = staticmethod(db.list_findings)
+    list_findings_page = staticmethod(db.list_findings_page)
+    scan_writer = staticmethod(db.ScanWriter)
+    compute_state_transitions = staticmethod(db.compute_state_transitions)
+    add_connector_aws = staticmethod(db.add_connector_aws)
+    get_connectors = staticmethod(db.get_connectors)
+    add_scope = staticmethod(db.add_scope)
+    list_scope = staticmethod(db.list_scope)
+    domain_in_scope = staticmethod(db.domain_in_scope)
+
+def storage_from_env()->Storage:
+    """``SMBSEC_DATABASE_URL=postgresql://...`` selects Postgres; otherwise SQLite."""
+    url = os.environ.get("SMBSEC_DATABASE_URL", "")
+    if url.startswith(("postgres://", "postgresql://")):
+        from .pg_storage import PostgresStorage
+        return PostgresStorage(url)
+    return SQLiteStorage()
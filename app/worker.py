@@ -0,0 +1,290 @@
+import argparse, asyncio, multiprocessing, os, signal, socket, time, uuid
+from . import scanner
+from .dns_cache import DNS_CACHE, persist_enabled as dns_cache_persist_enabled
+from .events import BUS
+from .notifications import send_digest
+from .risk_model import AssetContext, RiskModel
+from .storage import Storage, storage_from_env
+
+SCAN_CONCURRENCY = int(os.environ.get("SMBSEC_WORKER_CONCURRENCY", 4))
+LEASE_SECONDS = float(os.environ.get("SMBSEC_SCAN_LEASE", 60))
+POLL_INTERVAL = float(os.environ.get("SMBSEC_WORKER_POLL", 1.0))
+PROGRESS_INTERVAL = float(os.environ.get("SMBSEC_PROGRESS_INTERVAL", 2.0))
+SCAN_TIME_LIMIT = float(os.environ.get("SMBSEC_SCAN_TIME_LIMIT", 0))  # seconds per attempt; 0 = none
+RISKY = scanner.RISKY_PORTS
+
+def has_https(open_ports, host, ip):
+    return any(h == host and i == ip and p in (443, 8443) for (h, i, p) in open_ports)
+
+async def finish(store:Storage, scan_id:int, status:str, stats:dict, progress:dict|None=None):
+    await store.finish_scan(scan_id, status, stats, progress)
+    BUS.publish("scan", scan_id, status=status, score=stats.get("score"), error=stats.get("error"))
+
+async def run_scan(store:Storage, scan_id:int, domain:str, profile:str=scanner.DEFAULT_PROFILE,
+                   progress:dict|None=None):
+    stats = {"hosts":0,"open":0,"score":100,"penalties":[],"bonuses":[]}
+    progress = {} if progress is None else progress
+
+    def on_progress(p:dict):
+        progress.update(p)
+        BUS.publish("progress", scan_id, **p)
+
+    try:
+        out = await scanner.scan_domain(domain, profile=profile, on_progress=on_progress,
+                                        on_open=lambda ip, port: BUS.publish("port_open", scan_id, ip=ip, port=port))
+        if "metrics" in out:
+            stats["metrics"] = out["metrics"]
+        asset_ctxs: dict[str, AssetContext] = {}
+        # Findings are queued in order and risk-scored in one batch before they are written.
+        rows: list[tuple] = []
+        scored: list[tuple[int, dict, bool]] = []
+
+        def add(*args, finding:dict|None=None, sibling_https:bool=True):
+            if finding is not None:
+                scored.append((len(rows), finding, sibling_https))
+            rows.append(args)
+
+        async with store.scan_writer(scan_id) as w:
+            for host, ips in out["host_ips"].items():
+                asset_ctxs[host] = AssetContext()
+                if not ips:
+                    await w.upsert_asset(host, None)
+                for ip in ips:
+                    await w.upsert_asset(host, ip)
+                    stats["hosts"] += 1
+            for (host, ip, port) in out["open_ports"]:
+                if port in RISKY:
+                    add(
+                        host,
+                        ip,
+                        port,
+                        "tcp",
+                        "high",
+                        f"Internet-exposed service on {port}",
+                        "Restrict exposure or require VPN; verify auth; move behind WAF/bastion.",
+                        {},
+                    )
+                    stats["score"] -= 10
+                    stats["penalties"].append(f"Risky port {port} exposed")
+            fp_map = out.get("fingerprints", {})
+            for (host, ip, port) in out["open_ports"]:
+                if port not in (80, 8080, 443, 8443):
+                    continue
+                key = f"{host}|{ip}|{port}"
+                fp = fp_map.get(key, {})
+                https_ok = has_https(out["open_ports"], host, ip)
+                if port in (80, 8080) and (not https_ok or not fp.get("hsts")):
+                    sev = "medium" if https_ok else "high"
+                    reason = "No HSTS" if https_ok else "No HTTPS available"
+                    add(
+                        host,
+                        ip,
+                        port,
+                        "http",
+                        sev,
+                        f"Plain HTTP exposed ({reason})",
+                        "Enable HTTPS and Strict-Transport-Security or redirect all HTTP to HTTPS.",
+                        fp,
+                    )
+                    if not https_ok:
+                        stats["score"] -= 5
+                        stats["penalties"].append("HTTP without HTTPS")
+                title = f"Open TCP {port}"
+                desc = "Service reachable from Internet"
+                sev = "medium"
+                finding = {"type": "tcp", "host": host, "ip": ip, "port": port,
+                           "severity": sev, "title": title, "description": desc,
+                           "evidence_json": {}}
+                add(host, ip, port, "tcp", sev, title, desc, {}, finding=finding)
+                stats["open"] += 1
+                if port in (3389, 5432, 6379, 3306):
+                    stats["score"] -= 10
+                    stats["penalties"].append(f"Risky port {port} exposed")
+            for key, fp in out["fingerprints"].items():
+                h, ip, p = key.split("|")
+                p = int(p)
+                sibling_https = True
+                if p in (80, 8080):
+                    sibling_https = any(x for x in out["open_ports"] if x[0]==h and x[1]==ip and x[2] in (443,8443))
+                    if not sibling_https:
+                        stats["score"] -= 5
+                        stats["penalties"].append("HTTP exposed without HTTPS")
+                if "status" in fp:
+                    title = f"HTTP {fp['status']} on port {p}"
+                    server = fp.get("server","")
+                    detail = f"Server: {server} Title: {fp.get('title','')}"
+                    finding = {"type": "http", "host": h, "ip": ip, "port": p,
+                               "severity": "low", "title": title, "description": detail,
+                               "evidence_json": fp}
+                    add(h, ip, p, "http", "low", title, detail, fp, finding=finding, sibling_https=sibling_https)
+            for key, info in out.get("tls", {}).items():
+                h, ip, p = key.split("|"); p = int(p)
+                if info:
+                    days = info.get("days_to_expiry")
+                    proto = info.get("protocol","")
+                    if isinstance(days, int):
+                        if days < 0:
+                            title = "Expired TLS certificate"
+                            desc = "Certificate notAfter date is in the past"
+                            finding = {"type": "tls", "host": h, "ip": ip, "port": p,
+                                       "severity": "high", "title": title, "description": desc,
+                                       "evidence_json": info}
+                            add(h, ip, p, "tls", "high", title, desc, info, finding=finding)
+                            stats["score"] -= 15
+                            stats["penalties"].append("Expired TLS cert")
+                        elif days < 14:
+                            title = "TLS certificate expiring soon"
+                            desc = f"Cert expires in {days} days"
+                            finding = {"type": "tls", "host": h, "ip": ip, "port": p,
+                                       "severity": "medium", "title": title, "description": desc,
+                                       "evidence_json": info}
+                            add(h, ip, p, "tls", "medium", title, desc, info, finding=finding)
+                    if proto and proto.startswith("TLSv1.3"):
+                        stats["score"] += 2
+                        stats["bonuses"].append("TLS 1.3 detected")
+            for key, banner in out.get("ssh", {}).items():
+                if banner:
+                    h, ip, p = key.split("|"); p = int(p)
+                    title = "SSH service banner"
+                    finding = {"type": "ssh", "host": h, "ip": ip, "port": p,
+                               "severity": "info", "title": title, "description": banner,
+                               "evidence_json": {"banner": banner}}
+                    add(h, ip, p, "ssh", "info", title, banner, {"banner": banner}, finding=finding)
+            findings = [f for _, f, _ in scored]
+            scores, _, controls = RiskModel.score_batch(
+                [f["type"] for f in findings], [f["port"] for f in findings], [f["severity"] for f in findings],
+                [f["title"] for f in findings], [asset_ctxs.get(f["host"], AssetContext()) for f in findings],
+                sibling_https_open=[sib for _, _, sib in scored], descriptions=[f["description"] for f in findings],
+                evidence=[f["evidence_json"] for f in findings])
+            for (i, _, _), score, ctl in zip(scored, scores, controls):
+                rows[i] += (float(score), ctl)
+            for args in rows:
+                await w.add_finding(*args)
+        trans = await store.compute_state_transitions(scan_id)
+        BUS.publish("transitions", scan_id, **{k: len(v) for k, v in trans.items()})
+        await send_digest(scan_id, trans)
+        if dns_cache_persist_enabled():
+            await DNS_CACHE.save()
+    except Exception as e:
+        await finish(store, scan_id, "error", {"error": str(e)}, progress)
+        return
+    await finish(store, scan_id, "done", stats, progress)
+
+class Worker:
+    """Leases queued scans from storage and runs up to ``concurrency`` at once.
+
+    Each running scan renews its lease every third of ``lease`` seconds. If
+    the worker dies, the lease runs out and another worker (in any process,
+    on any host sharing the database) retries the scan from scratch.
+
+    The heartbeat also stores the scan's progress and is where a requested
+    cancel or an exceeded time limit stops the scan. Scanner stages only bump
+    counters in ``progress``; nothing is written from their hot loops.
+    """
+
+    def __init__(self, store:Storage, concurrency:int=SCAN_CONCURRENCY, lease:float=LEASE_SECONDS,
+                 poll:float=POLL_INTERVAL, worker_id:str|None=None, progress_interval:float=PROGRESS_INTERVAL,
+                 time_limit:float=SCAN_TIME_LIMIT):
+        self.store = store
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll = poll
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.progress_interval = progress_interval
+        self.time_limit = time_limit
+        self.running:set[asyncio.Task] = set()
+        self.progress:dict[int,dict] = {}  # scan id -> live progress of the scans this worker runs
+
+    async def run_job(self, job:dict):
+        scan_id = job["id"]
+        if job["attempts"] > 1:
+            await self.store.clear_scan_results(scan_id)
+        progress = self.progress[scan_id] = {}
+        BUS.publish("scan", scan_id, status="running", domain=job["domain"], attempt=job["attempts"])
+        limit = job.get("time_limit") or self.time_limit
+        started = time.monotonic()
+        task = asyncio.create_task(run_scan(self.store, scan_id, job["domain"], job["profile"], progress))
+        stopped = None
+        try:
+            while not task.done():
+                tick = min(self.lease / 3, self.progress_interval)
+                if limit:
+                    tick = max(0, min(tick, started + limit - time.monotonic()))
+                await asyncio.wait([task], timeout=tick)
+                if task.done():
+                    break
+                elapsed = time.monotonic() - started
+                if limit and elapsed >= limit:
+                    stopped = ("error", {"error": f"time limit of {limit:g}s exceeded"})
+                    break
+                if not await self.store.heartbeat_scan(scan_id, self.worker_id, self.lease,
+                                                       {**progress, "elapsed": round(elapsed, 1)}):
+                    s = await self.store.get_scan(scan_id)
+                    if s and s["cancel_requested"] and s["lease_owner"] == self.worker_id:
+                        stopped = ("cancelled", {"error": "cancelled"})
+                    break  # otherwise the lease was lost; another worker owns the scan now
+        finally:
+            if not task.done():
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self.progress.pop(scan_id, None)
+        if stopped and task.cancelled():
+            status, stats = stopped
+            await finish(self.store, scan_id, status, stats, progress)
+
+    async def run(self, stop:asyncio.Event|None=None):
+        stop = stop or asyncio.Event()
+        try:
+            while not stop.is_set():
+                if len(self.running) < self.concurrency:
+                    job = await self.store.lease_scan(self.worker_id, self.lease)
+                    if job is not None:
+                        task = asyncio.create_task(self.run_job(job))
+                        self.running.add(task)
+                        task.add_done_callback(self.running.discard)
+                        continue
+                try:
+                    await asyncio.wait_for(stop.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Interrupted scans keep their lease until it expires and are then retried.
+            for task in self.running:
+                task.cancel()
+            await asyncio.gather(*self.running, return_exceptions=True)
+
+async def serve(concurrency:int=SCAN_CONCURRENCY):
+    store = storage_from_env()
+    await store.init()
+    if dns_cache_persist_enabled():
+        await DNS_CACHE.load()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    BUS.sinks.append(store.add_events)  # API processes relay these to /ws
+    BUS.start()
+    try:
+        await Worker(store, concurrency).run(stop)
+    finally:
+        await BUS.stop()
+        await store.close()
+
+def _serve(concurrency:int):
+    asyncio.run(serve(concurrency))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run queued scans.")
+    ap.add_argument("--concurrency", type=int, default=SCAN_CONCURRENCY, help="scans per process")
+    ap.add_argument("--processes", type=int, default=1)
+    args = ap.parse_args(argv)
+    if args.processes <= 1:
+        return _serve(args.concurrency)
+    procs = [multiprocessing.Process(target=_serve, args=(args.concurrency,)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Findings-per-second: connect-per-call vs the pooled db layer vs ScanWriter.
+
+    python -m benchmarks.bench_db [N]
+"""
+import asyncio, json, os, sys, tempfile, time
+import aiosqlite
+from app import db
+
+async def add_finding_connect_per_call(path:str, scan_id:int, host:str, port:int):
+    # The pre-pool add_finding: fresh connection, owner lookup, insert, commit.
+    async with aiosqlite.connect(path) as conn:
+        cur = await conn.execute(
+            "SELECT owner_email FROM assets WHERE scan_id=? AND host=? AND ifnull(ip,'')=ifnull(?, '')",
+            (scan_id, host, "1.1.1.1"))
+        await cur.fetchone()
+        await conn.execute("""INSERT INTO findings
+            (scan_id,host,ip,port,proto,severity,title,description,evidence_json,risk_score,controls_json,created_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""",
+            (scan_id, host, "1.1.1.1", port, "tcp", "low", "Open TCP", "bench", json.dumps({}), 0,
+             json.dumps({}), int(time.time())))
+        await conn.commit()
+
+async def bench(n:int)->dict:
+    out = {}
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_PATH = os.path.join(d, "bench.db")
+        await db.init_db()
+        scan_id = await db.create_scan("bench.example")
+        await db.close_pool()
+
+        t = time.perf_counter()
+        for i in range(n):
+            await add_finding_connect_per_call(db.DB_PATH, scan_id, f"h{i}", 80)
+        out["connect_per_call"] = n / (time.perf_counter() - t)
+
+        await db.open_pool()
+        t = time.perf_counter()
+        for i in range(n):
+            await db.add_finding(scan_id, f"h{i}", "1.1.1.1", 80, "tcp", "low", "Open TCP", "bench", {})
+        out["pooled"] = n / (time.perf_counter() - t)
+
+        t = time.perf_counter()
+        async with db.ScanWriter(scan_id) as w:
+            for i in range(n):
+                await w.add_finding(f"h{i}", "1.1.1.1", 80, "tcp", "low", "Open TCP", "bench", {})
+        out["scan_writer"] = n / (time.perf_counter() - t)
+        await db.close_pool()
+    return out
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    res = asyncio.run(bench(n))
+    for name, rate in res.items():
+        print(f"{name:>18}: {rate:9.0f} findings/s")
+    for name in ("pooled", "scan_writer"):
+        print(f"{name + ' speedup':>18}: {res[name] / res['connect_per_call']:9.1f}x")
@@ -0,0 +1,68 @@
+"""GET /report/{id} for a large scan: first render vs cached repeat views vs streaming.
+
+    python -m benchmarks.bench_report [FINDINGS]
+"""
+import asyncio, os, statistics, sys, tempfile, time
+from fastapi.testclient import TestClient
+from app import db, main as api
+from app.report_cache import ReportCache
+
+async def seed(n:int)->int:
+    await db.init_db()
+    scan_id = await db.create_scan("bench.example")
+    async with db.ScanWriter(scan_id) as w:
+        for i in range(n):
+            host = f"h{i % 1000}.bench.example"
+            if i < 1000:
+                await w.upsert_asset(host, "192.0.2.1")
+            await w.add_finding(host, "192.0.2.1", 1 + i // 1000, "tcp", "medium", f"Open TCP {i}",
+                                "Service reachable from Internet", {}, i % 100,
+                                {"iso27001": ["A.13.1.1"], "cis_controls": ["12.1"]})
+    await db.finish_scan(scan_id, "done", {"score": 50})
+    await db.close_pool()
+    return scan_id
+
+async def stream(scan_id:int)->tuple[float,float]:
+    t = time.perf_counter()
+    resp = await api.get_report(scan_id, None, stream=True)
+    first = None
+    async for _ in resp.body_iterator:
+        first = first or time.perf_counter() - t
+    total = time.perf_counter() - t
+    await db.close_pool()
+    return first, total
+
+def main(n:int):
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_PATH = os.path.join(d, "bench.db")
+        api.reports = ReportCache(os.path.join(d, "reports"))
+        scan_id = asyncio.run(seed(n))
+        with TestClient(api.app) as client:
+            t = time.perf_counter()
+            r = client.get(f"/report/{scan_id}")
+            cold = time.perf_counter() - t
+            etag = r.headers["etag"]
+            warm, revalidate = [], []
+            for _ in range(20):
+                t = time.perf_counter()
+                client.get(f"/report/{scan_id}")
+                warm.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                client.get(f"/report/{scan_id}", headers={"If-None-Match": etag})
+                revalidate.append(time.perf_counter() - t)
+            api.reports = ReportCache(os.path.join(d, "reports"))
+            t = time.perf_counter()
+            client.get(f"/report/{scan_id}")
+            disk = time.perf_counter() - t
+        # The test client buffers whole responses, so time the body iterator itself.
+        first_byte, streamed = asyncio.run(stream(scan_id))
+        size = len(api.reports.mem[scan_id].gz)
+    print(f"{n} findings, {size / 1e6:.1f} MB gzipped")
+    print(f"first render      {cold * 1000:9.1f} ms")
+    print(f"disk hit          {disk * 1000:9.1f} ms")
+    print(f"memory hit        {statistics.median(warm) * 1000:9.1f} ms (median)")
+    print(f"304 revalidation  {statistics.median(revalidate) * 1000:9.1f} ms (median)")
+    print(f"stream            {first_byte * 1000:9.1f} ms to first chunk, {streamed * 1000:.1f} ms total")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
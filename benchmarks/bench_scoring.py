@@ -0,0 +1,56 @@
+"""RiskModel.score per finding vs RiskModel.score_batch on synthetic findings.
+
+    python -m benchmarks.bench_scoring [FINDINGS]
+"""
+import random, sys, time
+from app import risk_model
+from app.risk_model import AssetContext, RiskModel
+
+KINDS = [("tcp", 3389, "Open TCP 3389"), ("tcp", 443, "Open TCP 443"), ("tcp", 5432, "Open TCP 5432"),
+         ("http", 80, "Plain HTTP exposed (No HTTPS available)"), ("http", 443, "HTTP 200 on port 443"),
+         ("tls", 443, "Expired TLS certificate"), ("tls", 443, "TLS certificate expiring soon"),
+         ("ssh", 22, "SSH service banner")]
+SEVERITIES = ["info", "low", "medium", "high"]
+
+def synth(n:int, hosts:int=1000)->tuple[dict,list[AssetContext]]:
+    rnd = random.Random(1)
+    ctxs = [AssetContext(criticality=rnd.randint(1, 5), data_class=rnd.choice(["P0", "P1", "P2", "P3"]))
+            for _ in range(hosts)]
+    kinds = [rnd.choice(KINDS) for _ in range(n)]
+    cols = {"types": [k[0] for k in kinds], "ports": [k[1] for k in kinds], "titles": [k[2] for k in kinds],
+            "severities": [rnd.choice(SEVERITIES) for _ in range(n)],
+            "ctx_index": [rnd.randrange(hosts) for _ in range(n)],
+            "sibling_https_open": [rnd.random() < 0.5 for _ in range(n)],
+            "evidence": [{"days_to_expiry": -1 if k[2].startswith("Expired") else 5} if k[0] == "tls" else {} for k in kinds]}
+    return cols, ctxs
+
+def per_finding(cols:dict, ctxs:list[AssetContext])->list[float]:
+    out = []
+    for t, port, title, sev, ci, sib, ev in zip(cols["types"], cols["ports"], cols["titles"], cols["severities"],
+                                                 cols["ctx_index"], cols["sibling_https_open"], cols["evidence"]):
+        finding = {"type": t, "port": port, "severity": sev, "title": title, "evidence_json": ev}
+        out.append(RiskModel.score(finding, ctxs[ci], sibling_https_open=sib)[0])
+    return out
+
+def timed(fn, *args):
+    t = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t
+
+def main(n:int):
+    cols, ctxs = synth(n)
+    print(f"{n} findings, {len(ctxs)} assets")
+    expected, t = timed(per_finding, cols, ctxs)
+    print(f"score() per finding   {t:7.2f} s  {n / t / 1e6:6.2f} M/s")
+    batch = lambda: RiskModel.score_batch(contexts=ctxs, **cols)
+    for label, np in [("score_batch numpy", risk_model.np), ("score_batch python", None)]:
+        if label.endswith("numpy") and np is None:
+            print(f"{label:20}  skipped (numpy not installed)")
+            continue
+        risk_model.np = np
+        (scores, _, _), t = timed(batch)
+        assert list(scores) == expected
+        print(f"{label:20}  {t:7.2f} s  {n / t / 1e6:6.2f} M/s")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,92 @@
+"""Sharded scan scaling on a synthetic local target set.
+
+Every 127.0.x.y address reaches local HTTP (8080) and TLS (8443) servers, so
+each target costs real connects, TLS handshakes and HTTP parsing without
+touching the network. Targets are probed with 1..N shards.
+
+    python -m benchmarks.bench_shards [IPS] [MAX_SHARDS]
+"""
+import asyncio, datetime, multiprocessing, os, socket, ssl, sys, tempfile, time
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from app import sharding
+
+HTTP_PORT, TLS_PORT = 8080, 8443
+CLOSED_PORTS = list(range(20000, 20020))
+PAGE = b"HTTP/1.1 200 OK\r\nServer: bench\r\nContent-Type: text/html\r\nContent-Length: 27\r\n\r\n<title>bench</title>hello\r\n"
+
+def _write_cert(d:str)->tuple[str,str]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench.test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = os.path.join(d, "cert.pem"), os.path.join(d, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+async def _handle(reader, writer):
+    try:
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(PAGE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+        pass
+    finally:
+        writer.close()
+
+def _serve(cert_path:str, key_path:str):
+    async def main():
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ctx.load_cert_chain(cert_path, key_path)
+        await asyncio.start_server(_handle, "0.0.0.0", HTTP_PORT, reuse_port=True, backlog=4096)
+        await asyncio.start_server(_handle, "0.0.0.0", TLS_PORT, ssl=ctx, reuse_port=True, backlog=4096)
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+def _wait_for(port:int):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on {port} did not start")
+
+def main():
+    ips = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_shards = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    ip_hosts = {f"127.0.{i // 250}.{i % 250 + 1}": [f"h{i}.bench.test"] for i in range(ips)}
+    ports = [HTTP_PORT, TLS_PORT] + CLOSED_PORTS
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as d:
+        cert_path, key_path = _write_cert(d)
+        servers = [ctx.Process(target=_serve, args=(cert_path, key_path), daemon=True)
+                   for _ in range(max(1, (os.cpu_count() or 1) // 2))]
+        for p in servers:
+            p.start()
+        _wait_for(HTTP_PORT)
+        _wait_for(TLS_PORT)
+        shard_counts = sorted({1, *[n for n in (2, 4, 8, 16, 32) if n <= max_shards], max_shards})
+        base = None
+        print(f"{ips} IPs x {len(ports)} ports, {os.cpu_count()} CPUs")
+        for n in shard_counts:
+            t = time.perf_counter()
+            parts = asyncio.run(sharding.scan_targets(ip_hosts, ports, n, limiter_kwargs={"pps": 0}))
+            elapsed = time.perf_counter() - t
+            fps = sum(len(p["fingerprints"]) for p in parts)
+            base = base or elapsed
+            print(f"shards={n:>2}  {elapsed:7.2f}s  {ips * len(ports) / elapsed:9.0f} probes/s  "
+                  f"{fps} fingerprints  speedup {base / elapsed:4.1f}x")
+        for p in servers:
+            p.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,123 @@
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import datetime
+import ipaddress
+import socket
+import threading
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+
+class StubDNS:
+    """Tiny authoritative UDP DNS server answering from a dict of records.
+
+    ``records`` maps ``(name, rdtype)`` to ``(ttl, [values])``; unknown names get
+    NXDOMAIN and known names without the type get an empty NOERROR, both with an
+    SOA whose minimum is ``neg_ttl``.
+    """
+
+    def __init__(self, records, neg_ttl=60):
+        self.records = {(n.lower().rstrip("."), t): v for (n, t), v in records.items()}
+        self.neg_ttl = neg_ttl
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self._stop = False
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def _soa(self):
+        return dns.rrset.from_text("test.", self.neg_ttl, "IN", "SOA",
+                                   f"ns.test. host.test. 1 3600 600 86400 {self.neg_ttl}")
+
+    def _answer(self, data):
+        q = dns.message.from_wire(data)
+        resp = dns.message.make_response(q)
+        qname = q.question[0].name
+        rdtype = dns.rdatatype.to_text(q.question[0].rdtype)
+        name = qname.to_text().rstrip(".").lower()
+        self.queries.append((name, rdtype))
+        known = {n for n, _ in self.records}
+        if name not in known:
+            resp.set_rcode(dns.rcode.NXDOMAIN)
+            resp.authority.append(self._soa())
+            return resp
+        owner = qname
+        while rdtype != "CNAME" and (name, "CNAME") in self.records:
+            ttl, values = self.records[(name, "CNAME")]
+            resp.answer.append(dns.rrset.from_text(owner, ttl, "IN", "CNAME", *values))
+            owner = dns.name.from_text(values[0])
+            name = values[0].rstrip(".").lower()
+        if (name, rdtype) in self.records:
+            ttl, values = self.records[(name, rdtype)]
+            resp.answer.append(dns.rrset.from_text(owner, ttl, "IN", rdtype, *values))
+        elif not resp.answer:
+            resp.authority.append(self._soa())
+        return resp
+
+    def _serve(self):
+        self.sock.settimeout(0.2)
+        while not self._stop:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.sock.sendto(self._answer(data).to_wire(), addr)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self._thread.join()
+        self.sock.close()
+
+
+@pytest.fixture
+def dns_stub():
+    servers = []
+
+    def make(records, **kw):
+        srv = StubDNS(records, **kw).start()
+        servers.append(srv)
+        return srv
+
+    yield make
+    for srv in servers:
+        srv.stop()
+
+
+@pytest.fixture
+def tls_cert(tmp_path):
+    """Self-signed RSA-2048 cert for www.example.com valid for 30 days."""
+    days = 30
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "www.example.com")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=days))
+            .add_extension(x509.SubjectAlternativeName([
+                x509.DNSName("www.example.com"), x509.DNSName("example.com"),
+                x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = tmp_path / "cert.pem", tmp_path / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM,
+                                           serialization.PrivateFormat.TraditionalOpenSSL,
+                                           serialization.NoEncryption()))
+    return cert_path, key_path
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import pytest
+from app import ctlog, scanner
+from app.ctlog import CTCache, iter_json_array
+
+
+async def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _collect(data, size):
+    async def run():
+        return [o async for o in iter_json_array(_chunks(data, size))]
+    return asyncio.run(run())
+
+
+def test_iter_json_array_any_chunking():
+    rows = [{"id": i, "name_value": f"h{i}.example.com\nünï{i}.example.com"} for i in range(50)]
+    data = json.dumps(rows, indent=1).encode()
+    for size in (1, 3, 7, 64, 4096):
+        assert _collect(data, size) == rows
+    assert _collect(b"[]", 1) == []
+
+
+def test_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        _collect(b'[{"id": 1}, {"id"', 4)
+    with pytest.raises(ValueError):
+        _collect(b'[{"id": 1}, ', 4)
+
+
+class FakeCrtSh:
+    """Serves crt.sh-style JSON over chunked HTTP, optionally pausing mid-body."""
+
+    def __init__(self, rows, gate=None, fail=False, truncate=None):
+        self.rows = rows
+        self.gate = gate
+        self.fail = fail
+        self.truncate = truncate  # only send this many rows, then end the body mid-array
+        self.requests = []
+
+    async def handle(self, reader, writer):
+        head = (await reader.readuntil(b"\r\n\r\n")).decode()
+        self.requests.append(head.split("\r\n")[0])
+        if self.fail:
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        body = json.dumps(self.rows).encode()
+        if self.truncate is not None:
+            body = json.dumps(self.rows[:self.truncate]).encode()[:-1] + b", "
+        half = len(body) // 2
+        for i, part in enumerate((body[:half], body[half:])):
+            writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+            await writer.drain()
+            if i == 0 and self.gate is not None:
+                await self.gate.wait()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+
+def _rows(ids):
+    return [{"id": i, "name_value": f"h{i}.example.com\n*.example.com"} for i in ids]
+
+
+def test_streams_caches_and_only_adds_newer(tmp_path, monkeypatch):
+    cache = CTCache(str(tmp_path / "ct.db"))
+
+    async def run(ids):
+        async with FakeCrtSh(_rows(ids)) as srv:
+            monkeypatch.setattr(ctlog, "CRTSH_URL", srv.url)
+            return [n async for n in scanner.iter_crtsh_subdomains("example.com", cache=cache)], srv
+
+    first, srv = asyncio.run(run([1, 2, 3]))
+    assert first[0] == "example.com"
+    assert set(first) == {"example.com", "h1.example.com", "h2.example.com", "h3.example.com",
+                          "*.example.com"}
+    assert "q=%25.example.com" in srv.requests[0]
+    assert asyncio.run(cache.last_id("example.com")) == 3
+    second, _ = asyncio.run(run([1, 2, 3, 4]))
+    assert set(second) == set(first) | {"h4.example.com"}
+    assert asyncio.run(cache.last_id("example.com")) == 4
+    assert len(asyncio.run(cache.name_values("example.com"))) == 4
+
+
+def test_names_arrive_before_response_finishes(tmp_path, monkeypatch):
+    cache = CTCache(str(tmp_path / "ct.db"))
+
+    async def run():
+        gate = asyncio.Event()
+        async with FakeCrtSh(_rows(range(1, 200)), gate=gate) as srv:
+            monkeypatch.setattr(ctlog, "CRTSH_URL", srv.url)
+            got = []
+            async for name in scanner.iter_crtsh_subdomains("example.com", cache=cache):
+                got.append(name)
+                if name == "h1.example.com":
+                    gate.set()
+            return got
+
+    assert len(asyncio.run(run())) == 201
+
+
+def test_crtsh_failure_falls_back_to_cache(tmp_path, monkeypatch):
+    cache = CTCache(str(tmp_path / "ct.db"))
+    asyncio.run(cache.add("example.com", [(7, "old.example.com")]))
+
+    async def run():
+        async with FakeCrtSh([], fail=True) as srv:
+            monkeypatch.setattr(ctlog, "CRTSH_URL", srv.url)
+            return {n async for n in scanner.iter_crtsh_subdomains("example.com", cache=cache)}
+
+    assert asyncio.run(run()) == {"example.com", "old.example.com"}
+
+
+def test_truncated_fetch_does_not_advance_the_watermark(tmp_path, monkeypatch):
+    cache = CTCache(str(tmp_path / "ct.db"))
+    newest_first = _rows(range(11, 0, -1))
+
+    async def run(**kw):
+        async with FakeCrtSh(newest_first, **kw) as srv:
+            monkeypatch.setattr(ctlog, "CRTSH_URL", srv.url)
+            return {n async for n in scanner.iter_crtsh_subdomains("example.com", cache=cache)}
+
+    cut = asyncio.run(run(truncate=3))
+    assert cut == {"example.com", "*.example.com", "h11.example.com", "h10.example.com", "h9.example.com"}
+    assert asyncio.run(cache.last_id("example.com")) == 0
+    full = asyncio.run(run())
+    assert full == {"example.com", "*.example.com"} | {f"h{i}.example.com" for i in range(1, 12)}
+    assert asyncio.run(cache.last_id("example.com")) == 11
+    assert len(asyncio.run(cache.name_values("example.com"))) == 11
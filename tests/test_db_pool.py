@@ -0,0 +1,56 @@
+import asyncio
+import sqlite3
+import pytest
+from app import db
+
+
+def test_pool_pragmas_and_readonly_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "pool.db"))
+
+    async def run():
+        await db.init_db()
+        async with db.writer() as conn:
+            cur = await conn.execute("PRAGMA journal_mode")
+            assert (await cur.fetchone())[0] == "wal"
+            cur = await conn.execute("PRAGMA synchronous")
+            assert (await cur.fetchone())[0] == 1  # NORMAL
+            cur = await conn.execute("PRAGMA busy_timeout")
+            assert (await cur.fetchone())[0] == db.BUSY_TIMEOUT_MS
+        async with db.reader() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                await conn.execute("DELETE FROM scans")
+        await db.close_pool()
+
+    asyncio.run(run())
+
+
+def test_concurrent_writes_share_one_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "pool.db"))
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        await asyncio.gather(*[
+            db.add_finding(scan_id, f"h{i}", "1.1.1.1", 80, "tcp", "low", "t", "d", {})
+            for i in range(200)])
+        findings, scans = await asyncio.gather(db.list_findings(scan_id), db.list_scans())
+        await db.close_pool()
+        return findings, scans
+
+    findings, scans = asyncio.run(run())
+    assert len(findings) == 200
+    assert scans[0]["domain"] == "example.com"
+
+
+def test_pool_follows_db_path_and_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "a.db"))
+    asyncio.run(db.init_db())
+    asyncio.run(db.create_scan("a.example"))
+    # A fresh event loop reuses the open connections.
+    assert [s["domain"] for s in asyncio.run(db.list_scans())] == ["a.example"]
+
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "b.db"))
+    asyncio.run(db.init_db())
+    assert asyncio.run(db.list_scans()) == []
+    assert db.POOL.path == str(tmp_path / "b.db")
+    asyncio.run(db.close_pool())
@@ -0,0 +1,72 @@
+import asyncio
+from app.dns_cache import DNSCache
+from app.resolver import AsyncResolver
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry_and_counters():
+    clock = Clock()
+    c = DNSCache(clock=clock)
+    assert c.get("a.example.com", "A") is None
+    c.put("A.example.com.", "a", ["192.0.2.1"], 30)
+    assert c.get("a.example.com", "A") == ["192.0.2.1"]
+    clock.now += 31
+    assert c.get("a.example.com", "A") is None
+    assert c.stats()["hits"] == 1 and c.stats()["misses"] == 2
+
+
+def test_lru_eviction():
+    c = DNSCache(maxsize=2)
+    c.put("a", "A", ["1"], 60)
+    c.put("b", "A", ["2"], 60)
+    assert c.get("a", "A") == ["1"]
+    c.put("c", "A", ["3"], 60)
+    assert c.get("b", "A") is None
+    assert c.get("a", "A") == ["1"]
+    assert c.stats()["evictions"] == 1
+
+
+def test_resolver_caches_positive_and_negative(dns_stub):
+    srv = dns_stub({("www.example.com", "A"): (300, ["192.0.2.10"])}, neg_ttl=120)
+    cache = DNSCache()
+    r = AsyncResolver(nameservers=[("127.0.0.1", srv.port)], timeout=1.0, cache=cache)
+
+    async def run():
+        for _ in range(3):
+            assert await r.query("www.example.com", "A") == ["192.0.2.10"]
+            assert await r.query("nope.example.com", "A") == []
+            assert await r.query("www.example.com", "AAAA") == []
+
+    asyncio.run(run())
+    assert len(srv.queries) == 3
+    exp, values = cache.entries[("nope.example.com", "A")]
+    assert values == () and exp - cache.clock() <= 120
+
+
+def test_cname_chain_cached_with_min_ttl(dns_stub):
+    srv = dns_stub({("cdn.example.com", "CNAME"): (30, ["www.example.com."]),
+                    ("www.example.com", "A"): (300, ["192.0.2.10"])})
+    cache = DNSCache()
+    r = AsyncResolver(nameservers=[("127.0.0.1", srv.port)], timeout=1.0, cache=cache)
+    assert asyncio.run(r.query("cdn.example.com", "A")) == ["192.0.2.10"]
+    exp, _ = cache.entries[("cdn.example.com", "A")]
+    assert exp - cache.clock() <= 30
+
+
+def test_persist_round_trip(tmp_path):
+    path = str(tmp_path / "dns_cache.db")
+    c = DNSCache()
+    c.put("a.example.com", "A", ["192.0.2.1", "192.0.2.2"], 300)
+    c.put("gone.example.com", "A", [], 300)
+    asyncio.run(c.save(path))
+    warm = DNSCache()
+    asyncio.run(warm.load(path))
+    assert warm.get("a.example.com", "A") == ["192.0.2.1", "192.0.2.2"]
+    assert warm.get("gone.example.com", "A") == []
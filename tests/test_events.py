@@ -0,0 +1,80 @@
+import asyncio, json
+from fastapi.testclient import TestClient
+from app import db, events, main
+from app.events import EventBus
+from app.storage import SQLiteStorage
+
+
+def test_tick_coalesces_and_shares_one_frame():
+    async def run():
+        bus = EventBus(max_events=2)
+        a, b = bus.subscribe(), bus.subscribe(maxlen=2)
+        for i in range(3):
+            bus.publish("progress", 1, ports_probed=i)
+            bus.publish("port_open", 1, ip="192.0.2.1", port=80 + i)
+        await bus.flush()
+        assert a.frames[0] is b.frames[0]  # serialized once for every client
+        frame = json.loads((await a.get())[0])
+        for _ in range(2):
+            bus.publish("port_open", 1, ip="192.0.2.1", port=22)
+            await bus.flush()
+        await bus.flush()  # nothing pending: no frame
+        return frame, bus, b
+
+    frame, bus, slow = asyncio.run(run())
+    assert [(e["type"], e.get("ports_probed"), e.get("port")) for e in frame["events"]] == [
+        ("progress", 2, None), ("port_open", None, 81), ("port_open", None, 82)]
+    assert frame["dropped"] == bus.dropped == 1
+    # The slow client kept only its newest two frames.
+    assert (len(slow.frames), slow.dropped, json.loads(slow.frames[-1])["tick"]) == (2, 1, 3)
+
+
+def test_worker_events_reach_the_api_bus_through_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "events.db"))
+    monkeypatch.setattr(db, "EVENTS_RETAIN", 2)
+
+    async def run():
+        await db.init_db()
+        store = SQLiteStorage()
+        worker_bus, api_bus = EventBus(), EventBus()
+        monkeypatch.setattr(db, "BUS", worker_bus)
+        worker_bus.sinks.append(store.add_events)
+        sub = api_bus.subscribe()
+        task = asyncio.create_task(events.relay(store, api_bus, poll=0.01))
+        await asyncio.sleep(0.05)
+        async with db.ScanWriter(7) as w:
+            await w.add_finding("h", "192.0.2.1", 3389, "tcp", "high", "RDP", "d", {})
+            await w.add_finding("h", "192.0.2.1", 80, "tcp", "low", "HTTP", "d", {})
+        worker_bus.publish("port_open", 7, ip="192.0.2.1", port=3389)
+        await worker_bus.flush()
+        while not api_bus.latest and not api_bus.pending:
+            await asyncio.sleep(0.01)
+        await api_bus.flush()
+        frame = json.loads((await sub.get())[0])
+        for _ in range(3):
+            await store.add_events([{"type": "x", "scan_id": None}])
+        rows = await store.list_events(0)
+        task.cancel()
+        await db.close_pool()
+        return frame, rows
+
+    frame, rows = asyncio.run(run())
+    by_type = {e["type"]: e for e in frame["events"]}
+    assert by_type["findings"]["total"] == 2 and by_type["findings"]["by_severity"] == {"high": 1, "low": 1}
+    assert by_type["port_open"]["port"] == 3389
+    assert len(rows) == 2  # older batches pruned
+
+
+def test_ws_streams_bus_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "ws.db"))
+    monkeypatch.setattr(events.BUS, "tick", 0.02)
+    with TestClient(main.app) as client:
+        client.post("/org/scope", json={"kind": "domain", "value": "example.com"})
+        scan_id = client.post("/scan", json={"domain": "example.com"}).json()["scan_id"]
+        with client.websocket_connect("/ws") as ws:
+            snapshot = ws.receive_json()
+            events.BUS.publish("port_open", scan_id, ip="192.0.2.1", port=443)
+            frame = ws.receive_json()
+    assert {"type": "scan", "scan_id": scan_id, "status": "queued", "domain": "example.com"} in snapshot["events"]
+    assert [(e["type"], e["port"]) for e in frame["events"]] == [("port_open", 443)]
+    assert not events.BUS.subscribers
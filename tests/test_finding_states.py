@@ -33,3 +33,35 @@ def test_compute_state_transitions(tmp_path):
         assert t3['regressed'] == {'h|1.1.1.1|80|tcp|A'}
 
     asyncio.run(run())
+
+
+def test_out_of_order_completion_and_retried_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'states.db'))
+    A = 'h|1.1.1.1|80|tcp|A'
+
+    async def finish(scan_id, titles):
+        for t in titles:
+            await db.add_finding(scan_id, 'h', '1.1.1.1', 80, 'tcp', 'low', t, '', {})
+        return await db.compute_state_transitions(scan_id)
+
+    async def run():
+        await db.init_db()
+        s1, s2, s3, s4 = [await db.create_scan('example.com') for _ in range(4)]
+        await finish(s1, ['A'])
+        assert (await finish(s2, []))['resolved'] == {A}
+        # s4 finishes before s3: both see A come back after s2 resolved it.
+        assert (await finish(s4, ['A']))['regressed'] == {A}
+        assert (await finish(s3, ['A']))['regressed'] == {A}
+        # s4 is retried from scratch: its earlier attempt must not count as history.
+        await db.clear_scan_results(s4)
+        async with db.reader() as conn:
+            cur = await conn.execute('SELECT scan_id, state FROM finding_latest')
+            latest = [tuple(r) for r in await cur.fetchall()]
+        await db.add_finding(s4, 'h', '1.1.1.1', 80, 'tcp', 'low', 'B', '', {})
+        retried = await db.compute_state_transitions(s4)
+        await db.close_pool()
+        return (s3, latest, retried)
+
+    s3, latest, retried = asyncio.run(run())
+    assert latest == [(s3, 'open')]
+    assert retried == {'new': {'h|1.1.1.1|80|tcp|B'}, 'resolved': {A}, 'regressed': set()}
@@ -0,0 +1,99 @@
+import asyncio, sqlite3
+from fastapi.testclient import TestClient
+from app import db, main, report
+from app.report_cache import ReportCache
+
+SEVERITIES = ["info", "low", "medium", "high", "critical"]
+RANK = {s: i for i, s in enumerate(SEVERITIES)}
+
+
+def _seed(tmp_path, monkeypatch, n=25):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "f.db"))
+    monkeypatch.setattr(main, "reports", ReportCache(str(tmp_path / "reports")))
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        async with db.ScanWriter(scan_id) as w:
+            for i in range(n):
+                await w.add_finding(f"h{i % 4}", "192.0.2.1", None if i % 5 == 0 else 1000 - i % 7, "tcp",
+                                    SEVERITIES[i % 5], f"t{i}", "d", {}, float(i % 3))
+        await db.finish_scan(scan_id, "done", {})
+        rows = await db.list_findings(scan_id)
+        await db.close_pool()
+        return scan_id, rows
+
+    return asyncio.run(run())
+
+
+def _pages(client, scan_id, **params):
+    out, cursor, pages = [], None, 0
+    while True:
+        r = client.get(f"/scans/{scan_id}/findings", params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        out += r["findings"]
+        pages += 1
+        if not (cursor := r["next_cursor"]):
+            return out, pages
+
+
+def test_keyset_pages_cover_every_sort(tmp_path, monkeypatch):
+    scan_id, rows = _seed(tmp_path, monkeypatch)
+    keys = {"risk_score": lambda f: f["risk_score"], "severity": lambda f: RANK[f["severity"]],
+            "host": lambda f: f["host"], "port": lambda f: -1 if f["port"] is None else f["port"]}
+    with TestClient(main.app) as client:
+        for sort, key in keys.items():
+            for order in ("asc", "desc"):
+                got, pages = _pages(client, scan_id, sort=sort, order=order, limit=7)
+                expected = sorted(rows, key=lambda f: (key(f), f["id"]), reverse=order == "desc")
+                assert [f["id"] for f in got] == [f["id"] for f in expected], (sort, order)
+                assert pages == 4
+        filtered, _ = _pages(client, scan_id, severity="high,critical", host="h3", limit=2)
+        first = client.get(f"/scans/{scan_id}", params={"limit": 3}).json()
+        cursor = client.get(f"/scans/{scan_id}/findings", params={"limit": 3}).json()["next_cursor"]
+        wrong_sort = client.get(f"/scans/{scan_id}/findings", params={"sort": "host", "cursor": cursor})
+        garbage = client.get(f"/scans/{scan_id}/findings", params={"cursor": "nope"})
+        unknown = client.get(f"/scans/{scan_id}/findings", params={"sort": "title"})
+    assert {(f["severity"], f["host"]) for f in filtered} <= {("high", "h3"), ("critical", "h3")}
+    assert len(filtered) == sum(1 for f in rows if f["host"] == "h3" and f["severity"] in ("high", "critical"))
+    assert len(first["findings"]) == 3 and first["next_cursor"] and first["scan"]["id"] == scan_id
+    assert "sort_key" not in first["findings"][0]
+    assert (wrong_sort.status_code, garbage.status_code, unknown.status_code) == (400, 400, 400)
+
+
+def test_pages_are_served_from_indexes(tmp_path, monkeypatch):
+    _seed(tmp_path, monkeypatch, n=1)
+    conn = sqlite3.connect(db.DB_PATH)
+    for sort, index in [("risk_score", "idx_findings_scan_risk"), ("severity", "idx_findings_scan_sev"),
+                        ("host", "idx_findings_scan_host"), ("port", "idx_findings_scan_port")]:
+        for desc in (True, False):
+            sql, params = db.findings_page_query(1, sort, desc, after=(1, 10), limit=100)
+            plan = " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            assert f"USING INDEX {index}" in plan and "TEMP B-TREE" not in plan, (sort, plan)
+
+
+def test_streamed_report_matches_and_pulls_lazily(tmp_path, monkeypatch):
+    scan_id, _ = _seed(tmp_path, monkeypatch, n=300)
+    with TestClient(main.app) as client:
+        cached = client.get(f"/report/{scan_id}").text
+        streamed = client.get(f"/report/{scan_id}", params={"stream": 1})
+    assert streamed.status_code == 200 and "etag" not in streamed.headers
+    assert streamed.text == cached
+
+    monkeypatch.setattr(report, "CHUNK_SIZE", 1024)
+    pulled = []
+
+    async def findings():
+        for i in range(1000):
+            pulled.append(i)
+            yield {"severity": "low", "host": "h", "ip": None, "port": i, "title": "t", "description": "d"}
+
+    async def run():
+        chunks = report.stream_report(1, "example.com", 0, [], findings(), {}, [])
+        first = await chunks.__anext__()
+        at_first = len(pulled)
+        rest = [c async for c in chunks]
+        return first, at_first, rest
+
+    first, at_first, rest = asyncio.run(run())
+    assert at_first < 1000 and len(rest) > 10
+    assert all(len(c) >= 1024 for c in [first, *rest[:-1]])
@@ -0,0 +1,148 @@
+import asyncio
+import socket, ssl
+import httpx, pytest
+from app.fingerprint import Fingerprinter
+
+
+async def _http_server(body: bytes, stats: dict):
+    async def handle(reader, writer):
+        stats["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                stats["requests"] += 1
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nServer: stub\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(body))
+                for i in range(0, len(body), 65536):
+                    writer.write(body[i:i + 65536])
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_connections_equal_unique_endpoints():
+    stats = {"connections": 0, "requests": 0}
+    body = b"<html><head><title>Stub</title></head><body>ok</body></html>"
+
+    async def run():
+        s1, p1 = await _http_server(body, stats)
+        s2, p2 = await _http_server(body, stats)
+        async with s1, s2, Fingerprinter() as fp:
+            out = []
+            for _ in range(5):
+                for port in (p1, p2):
+                    out.append(await fp.fingerprint("127.0.0.1", "127.0.0.1", "http", port))
+            return out
+
+    results = asyncio.run(run())
+    assert all(r["title"] == "Stub" and r["server"] == "stub" for r in results)
+    assert stats["requests"] == 10
+    assert stats["connections"] == 2
+
+
+def test_large_body_reads_only_the_head():
+    stats = {"connections": 0, "requests": 0}
+    body = b"<html><title>Big</title>" + b"x" * (20 * 1024 * 1024)
+
+    async def run():
+        server, port = await _http_server(body, stats)
+        async with server, Fingerprinter(max_body=4096) as fp:
+            return await fp.fingerprint("127.0.0.1", "127.0.0.1", "http", port)
+
+    fp = asyncio.run(run())
+    assert fp["status"] == 200 and fp["title"] == "Big"
+
+
+def test_title_beyond_max_body_is_not_seen():
+    stats = {"connections": 0, "requests": 0}
+    body = b"<html>" + b" " * 10000 + b"<title>Late</title>"
+
+    async def run():
+        server, port = await _http_server(body, stats)
+        async with server, Fingerprinter(max_body=1024) as fp:
+            return await fp.fingerprint("127.0.0.1", "127.0.0.1", "http", port)
+
+    assert asyncio.run(run())["title"] == ""
+
+
+async def _echo_server(host="127.0.0.1", ssl=None, seen=None):
+    async def handle(reader, writer):
+        local_ip = writer.get_extra_info("sockname")[0]
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode()
+                host_hdr = [l.split(":", 1)[1].strip() for l in head.split("\r\n")
+                            if l.lower().startswith("host:")][0]
+                if seen is not None:
+                    seen.append((local_ip, host_hdr))
+                body = f"<title>{local_ip} {host_hdr}</title>".encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, 0, ssl=ssl)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_pinned_to_each_ip_of_multi_a_host():
+    seen = []
+
+    async def run():
+        server, port = await _echo_server("0.0.0.0", seen=seen)
+        async with server, Fingerprinter() as fp:
+            return await asyncio.gather(
+                fp.fingerprint("www.example.invalid", "127.0.0.1", "http", port),
+                fp.fingerprint("www.example.invalid", "127.0.0.2", "http", port),
+                fp.fingerprint("api.example.invalid", "127.0.0.1", "http", port))
+
+    a, b, c = asyncio.run(run())
+    assert a["title"].startswith("127.0.0.1 www.example.invalid:")
+    assert b["title"].startswith("127.0.0.2 www.example.invalid:")
+    assert c["title"].startswith("127.0.0.1 api.example.invalid:")
+    assert len(seen) == 3
+
+
+def test_https_sends_sni_and_verifies_against_host(tls_cert):
+    cert_path, key_path = tls_cert
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(cert_path, key_path)
+    sni = []
+    ctx.sni_callback = lambda sock, name, c: sni.append(name)
+
+    async def run():
+        server, port = await _echo_server(ssl=ctx)
+        async with server, Fingerprinter(verify=str(cert_path)) as fp:
+            ok = await fp.fingerprint("www.example.com", "127.0.0.1", "https", port)
+            bad = await fp.fingerprint("other.example.org", "127.0.0.1", "https", port)
+            return ok, bad
+
+    ok, bad = asyncio.run(run())
+    assert ok["status"] == 200
+    assert ok["title"].startswith("127.0.0.1 www.example.com:")
+    assert "error" in bad
+    assert sni == ["www.example.com", "other.example.org"]
+
+
+def test_transport_raises_httpx_errors():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    async def run():
+        async with Fingerprinter() as fp:
+            with pytest.raises(httpx.ConnectError):
+                await fp.unverified.get(f"http://127.0.0.1:{port}/")
+            return await fp.fingerprint("www.example.invalid", "127.0.0.1", "http", port)
+
+    assert "error" in asyncio.run(run())
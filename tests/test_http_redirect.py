@@ -1,5 +1,5 @@
 import asyncio
-from app import main
+from app import worker
 
 
 class DummyDB:
@@ -25,7 +25,7 @@ async def _run_test():
     stats = {"score": 100, "penalties": []}
     scan_id = 1
     for (host, ip, port) in out["open_ports"]:
-        if port in main.RISKY:
+        if port in worker.RISKY:
             await db.add_finding(
                 scan_id,
                 host,
@@ -45,7 +45,7 @@ async def _run_test():
             continue
         key = f"{host}|{ip}|{port}"
         fp = fp_map.get(key, {})
-        https_ok = main.has_https(out["open_ports"], host, ip)
+        https_ok = worker.has_https(out["open_ports"], host, ip)
         if port in (80, 8080) and (not https_ok or not fp.get("hsts")):
             sev = "medium" if https_ok else "high"
             reason = "No HSTS" if https_ok else "No HTTPS available"
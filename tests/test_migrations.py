@@ -0,0 +1,106 @@
+import asyncio, multiprocessing
+import sqlite3
+from app import db
+
+
+def _plan(conn, sql, params):
+    return " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_fresh_database_is_at_latest_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "m.db"))
+    asyncio.run(db.init_db())
+    asyncio.run(db.close_pool())
+    conn = sqlite3.connect(db.DB_PATH)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+    # Re-running is a no-op.
+    asyncio.run(db.init_db())
+    asyncio.run(db.close_pool())
+
+
+def _init_process(path):
+    db.DB_PATH = path
+    asyncio.run(db.init_db())
+    asyncio.run(db.close_pool())
+
+
+def test_processes_starting_together_migrate_once(tmp_path):
+    path = str(tmp_path / "m.db")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_init_process, args=(path,)) for _ in range(6)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+    assert [p.exitcode for p in procs] == [0] * 6
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+
+
+def test_legacy_database_is_migrated_and_backfilled(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(db.SCHEMA)
+    conn.executemany("INSERT INTO finding_states(scan_id,dedupe_key,state) VALUES(?,?,?)",
+                     [(1, "a", "open"), (2, "a", "resolved"), (1, "b", "open")])
+    conn.execute("""INSERT INTO findings(scan_id,host,ip,port,proto,severity,title,description,created_at)
+                    VALUES(1,'h',NULL,443,'tls','high','Expired','d',0)""")
+    conn.execute("INSERT INTO scans(id,domain,started_at,status) VALUES(7,'example.com',0,'running')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    asyncio.run(db.init_db())
+    asyncio.run(db.close_pool())
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+    latest = conn.execute("SELECT fingerprint, dedupe_key, scan_id, state FROM finding_latest ORDER BY dedupe_key").fetchall()
+    assert latest == [(db.fingerprint("a"), "a", 2, "resolved"), (db.fingerprint("b"), "b", 1, "open")]
+    key = "h||443|tls|Expired"
+    assert conn.execute("SELECT dedupe_key, fingerprint FROM findings").fetchall() == [(key, db.fingerprint(key))]
+    assert conn.execute("SELECT count(*) FROM finding_states WHERE fingerprint IS NULL").fetchone()[0] == 0
+    # scans was rebuilt for the 'cancelled' status; rows and AUTOINCREMENT survive.
+    assert conn.execute("SELECT id, status, lease_expires, progress_json FROM scans").fetchall() == [(7, "running", 0, "{}")]
+    conn.execute("UPDATE scans SET status='cancelled'")
+    assert conn.execute("INSERT INTO scans(domain,started_at) VALUES('x',0) RETURNING id").fetchone()[0] == 8
+
+
+def test_hot_queries_use_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "m.db"))
+    asyncio.run(db.init_db())
+    asyncio.run(db.close_pool())
+    conn = sqlite3.connect(db.DB_PATH)
+    assert "COVERING INDEX idx_findings_scan_fp" in _plan(
+        conn, "SELECT 1 FROM findings f WHERE f.scan_id=? AND f.fingerprint=?", (1, 2))
+    assert "COVERING INDEX idx_findings_scan_key" in _plan(
+        conn, "SELECT host, ip, port, proto, title FROM findings WHERE scan_id=?", (1,))
+    assert "USING INDEX idx_assets_owner" in _plan(
+        conn, "SELECT owner_email FROM assets WHERE scan_id=? AND host=? AND ifnull(ip,'')=ifnull(?, '')",
+        (1, "h", None))
+    assert "COVERING INDEX idx_scans_domain" in _plan(
+        conn, "SELECT id FROM scans WHERE domain=? AND id<? ORDER BY id DESC LIMIT 1", ("d", 5))
+    assert "COVERING INDEX idx_finding_states_scan_fp" in _plan(
+        conn, "SELECT fingerprint FROM finding_states WHERE scan_id=? AND state='open'", (1,))
+    assert "COVERING INDEX idx_finding_states_fp" in _plan(
+        conn, "SELECT scan_id FROM finding_states WHERE fingerprint=?", (1,))
+    assert "finding_latest USING INTEGER PRIMARY KEY" in _plan(
+        conn, "SELECT state FROM finding_latest WHERE fingerprint=? AND scan_id<?", (1, 2))
+
+
+def test_findings_store_key_and_fingerprint_at_insert(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "m.db"))
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        await db.add_finding(scan_id, "h", "1.1.1.1", 80, "tcp", "low", "A", "", {})
+        async with db.ScanWriter(scan_id) as w:
+            await w.add_finding("h", None, None, "aws", "low", "B", "", {})
+        rows = await db.list_findings(scan_id)
+        await db.close_pool()
+        return rows
+
+    rows = asyncio.run(run())
+    assert [(r["dedupe_key"], r["fingerprint"]) for r in sorted(rows, key=lambda r: r["id"])] == [
+        ("h|1.1.1.1|80|tcp|A", db.fingerprint("h|1.1.1.1|80|tcp|A")),
+        ("h|||aws|B", db.fingerprint("h|||aws|B")),
+    ]
@@ -0,0 +1,150 @@
+import asyncio, time
+import httpx
+from app import db, main
+from app.pdf import PdfRenderer
+from app.report_cache import ReportCache
+
+# Stands in for wkhtmltopdf: logs each run, takes a while, writes "%PDF" plus the input size.
+STUB = """#!/bin/sh
+for a; do src=$out; out=$a; done
+echo run >> "$0.log"
+sleep {delay}
+{fail}
+printf '%%PDF-stub %s' "$(wc -c < "$src")" > "$out"
+"""
+
+
+def _setup(tmp_path, monkeypatch, scans=1, delay=0.5, fail=False, **kw):
+    binary = tmp_path / "wkhtmltopdf"
+    fail = "echo broken >&2; exit 1" if fail is True else fail or ""
+    binary.write_text(STUB.format(delay=delay, fail=fail))
+    binary.chmod(0o755)
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "p.db"))
+    monkeypatch.setattr(main, "reports", ReportCache(str(tmp_path / "reports")))
+    monkeypatch.setattr(main, "pdfs", PdfRenderer(str(tmp_path / "reports"), binary=str(binary), **kw))
+
+    async def seed():
+        await db.init_db()
+        ids = []
+        for _ in range(scans):
+            ids.append(await db.create_scan("example.com"))
+            async with db.ScanWriter(ids[-1]) as w:
+                await w.add_finding("h", "192.0.2.1", 22, "tcp", "low", "SSH", "d", {})
+            await db.finish_scan(ids[-1], "done", {})
+        await db.close_pool()
+        return ids
+
+    return asyncio.run(seed()), tmp_path / "wkhtmltopdf.log"
+
+
+async def _client(requests):
+    await main.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://t") as c:
+            return await requests(c)
+    finally:
+        await main.shutdown()
+
+
+def _etag(scan_id):
+    async def run():
+        s = await db.get_scan(scan_id)
+        await db.close_pool()
+        return s
+    return main.report_etag(asyncio.run(run()))
+
+
+def test_concurrent_downloads_share_one_render_off_the_loop(tmp_path, monkeypatch):
+    (scan_id,), log = _setup(tmp_path, monkeypatch)
+
+    async def requests(c):
+        downloads = [asyncio.create_task(c.get(f"/report/{scan_id}/pdf")) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        t = time.perf_counter()
+        other = await c.get("/scan/profiles")  # answered while wkhtmltopdf runs
+        latency = time.perf_counter() - t
+        rs = await asyncio.gather(*downloads)
+        again = await c.get(f"/report/{scan_id}/pdf")
+        return rs, other, latency, again
+
+    rs, other, latency, again = asyncio.run(_client(requests))
+    assert other.status_code == 200 and latency < 0.3
+    assert all(r.status_code == 200 and r.content.startswith(b"%PDF") for r in [*rs, again])
+    assert rs[0].headers["content-type"] == "application/pdf"
+    assert log.read_text().count("run") == 1
+    assert main.pdfs.stats == {"cached": 1, "joined": 4, "render": 1}
+    assert [p.name for p in (tmp_path / "reports").glob("*.pdf*")] == [
+        f"scan_{scan_id}.{_etag(scan_id)}.pdf"]
+
+
+def test_job_endpoint_and_queue_bound(tmp_path, monkeypatch):
+    (a, b), log = _setup(tmp_path, monkeypatch, scans=2, delay=0.3, max_pending=1)
+
+    async def requests(c):
+        job = (await c.post(f"/report/{a}/pdf/jobs")).json()
+        full = await c.get(f"/report/{b}/pdf")
+        polled = []
+        while not polled or polled[-1]["status"] == "pending":
+            polled.append((await c.get(f"/report/{a}/pdf/jobs/{job['job_id']}")).json())
+            await asyncio.sleep(0.05)
+        pdf = await c.get(job["url"])
+        repeat = await c.post(f"/report/{a}/pdf/jobs")
+        unknown = await c.get(f"/report/{a}/pdf/jobs/nope")
+        return job, full, polled, pdf, repeat, unknown
+
+    job, full, polled, pdf, repeat, unknown = asyncio.run(_client(requests))
+    assert job["status"] == "pending" and job["url"] == f"/report/{a}/pdf"
+    assert full.status_code == 503 and full.headers["retry-after"]
+    assert polled[0]["status"] == "pending" and polled[-1]["status"] == "done"
+    assert pdf.content.startswith(b"%PDF") and log.read_text().count("run") == 1
+    assert repeat.json()["status"] == "done" and unknown.status_code == 404
+
+
+def test_failed_render_is_reported_and_retried(tmp_path, monkeypatch):
+    (scan_id,), log = _setup(tmp_path, monkeypatch, delay=0, fail=True)
+
+    async def requests(c):
+        direct = await c.get(f"/report/{scan_id}/pdf")
+        job = (await c.post(f"/report/{scan_id}/pdf/jobs")).json()
+        while (status := (await c.get(f"/report/{scan_id}/pdf/jobs/{job['job_id']}")).json())["status"] == "pending":
+            await asyncio.sleep(0.05)
+        return direct, status
+
+    direct, status = asyncio.run(_client(requests))
+    assert direct.status_code == 502 and "broken" in direct.json()["detail"]
+    assert status["status"] == "error" and "broken" in status["error"]
+    assert log.read_text().count("run") == 2
+    assert not list((tmp_path / "reports").glob("*.pdf*"))
+
+
+def test_dead_worker_gives_502_and_the_pool_is_replaced(tmp_path, monkeypatch):
+    # The first run kills the pool worker that started it, breaking the pool.
+    crash = 'if [ "$(wc -l < "$0.log")" -eq 1 ]; then kill -9 $PPID; sleep 5; fi'
+    (scan_id,), log = _setup(tmp_path, monkeypatch, delay=0, fail=crash)
+
+    async def requests(c):
+        broken = await c.get(f"/report/{scan_id}/pdf")
+        return broken, await c.get(f"/report/{scan_id}/pdf")
+
+    broken, retried = asyncio.run(_client(requests))
+    assert broken.status_code == 502 and "PDF rendering failed" in broken.json()["detail"]
+    assert retried.status_code == 200 and retried.content.startswith(b"%PDF")
+    assert log.read_text().count("run") == 2
+
+
+def test_failed_renders_expire_and_are_capped(tmp_path):
+    pdfs = PdfRenderer(str(tmp_path / "reports"), error_ttl=0.2, max_errors=2)
+
+    async def broken():
+        raise RuntimeError("no template")
+
+    async def run():
+        for scan_id in (1, 2, 3):
+            await asyncio.gather(pdfs.submit(scan_id, "e", broken), return_exceptions=True)
+        capped = [pdfs.status(scan_id, "e") for scan_id in (1, 2, 3)]
+        await asyncio.sleep(0.3)
+        return capped, pdfs.status(3, "e")
+
+    capped, expired = asyncio.run(run())
+    assert capped == [None, {"status": "error", "error": "no template"}, {"status": "error", "error": "no template"}]
+    assert expired is None and not pdfs.errors
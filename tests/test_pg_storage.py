@@ -0,0 +1,150 @@
+import asyncio
+import os
+import pytest
+from app import fix_queue
+
+asyncpg = pytest.importorskip("asyncpg")
+from app.pg_storage import PostgresStorage
+
+# e.g. SMBSEC_TEST_PG_URL=postgresql://postgres@localhost/smbsec_test (a throwaway database)
+PG_URL = os.environ.get("SMBSEC_TEST_PG_URL")
+pytestmark = pytest.mark.skipif(not PG_URL, reason="SMBSEC_TEST_PG_URL not set")
+
+
+async def _store():
+    conn = await asyncpg.connect(PG_URL)
+    await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    await conn.close()
+    store = PostgresStorage(PG_URL, max_size=4)
+    await store.init()
+    return store
+
+
+def test_scan_lifecycle_and_scope():
+    async def run():
+        store = await _store()
+        await store.init()  # migrations are idempotent
+        await store.add_scope("default", "domain", "Example.com")
+        assert await store.domain_in_scope("www.example.com")
+        assert not await store.domain_in_scope("badexample.com")
+        scan_id = await store.create_scan("example.com")
+        await store.upsert_asset(scan_id, "h", None)
+        await store.upsert_asset(scan_id, "h", None, owner_email="o@example.com")
+        await store.finish_scan(scan_id, "done", {"hosts": 1})
+        scan, assets = await store.get_scan(scan_id), await store.list_assets(scan_id)
+        after = await store.last_event_id()
+        await store.add_events([{"type": "scan", "scan_id": scan_id, "status": "done"}])
+        events = await store.list_events(after)
+        await store.close()
+        return scan, assets, events
+
+    scan, assets, events = asyncio.run(run())
+    assert scan["status"] == "done" and scan["stats_json"] == '{"hosts": 1}'
+    assert [(a["host"], a["owner_email"]) for a in assets] == [("h", "o@example.com")]
+    assert [e["status"] for _, batch in events for e in batch] == ["done"]
+
+
+def test_copy_writer_and_state_transitions(monkeypatch):
+    fix_queue.FIX_QUEUE.clear()
+    monkeypatch.setattr(fix_queue, "open_jira_ticket", lambda *a: None)
+
+    async def scan(store, titles):
+        scan_id = await store.create_scan("example.com")
+        async with store.scan_writer(scan_id) as w:
+            await w.upsert_asset("h", "1.1.1.1", owner_email="o@example.com")
+            for t in titles:
+                await w.add_finding("h", "1.1.1.1", 80, "tcp", "high", t, "d", {}, 1)
+        return await store.compute_state_transitions(scan_id)
+
+    async def run():
+        store = await _store()
+        t1 = await scan(store, ["A", "B"])
+        t2 = await scan(store, ["B", "C"])
+        t3 = await scan(store, ["A", "C"])
+        await store.close()
+        return t1, t2, t3
+
+    t1, t2, t3 = asyncio.run(run())
+    key = lambda t: f"h|1.1.1.1|80|tcp|{t}"
+    assert t1["new"] == {key("A"), key("B")}
+    assert t2["new"] == {key("C")} and t2["resolved"] == {key("A")}
+    assert t3["regressed"] == {key("A")} and t3["resolved"] == {key("B")}
+    assert len(fix_queue.FIX_QUEUE) == 6
+    assert {e["owner_email"] for e in fix_queue.FIX_QUEUE} == {"o@example.com"}
+
+
+def test_out_of_order_completion_and_retried_scan():
+    A = "h|1.1.1.1|80|tcp|A"
+
+    async def finish(store, scan_id, titles):
+        for t in titles:
+            await store.add_finding(scan_id, "h", "1.1.1.1", 80, "tcp", "low", t, "", {})
+        return await store.compute_state_transitions(scan_id)
+
+    async def run():
+        store = await _store()
+        s1, s2, s3, s4 = [await store.create_scan("example.com") for _ in range(4)]
+        await finish(store, s1, ["A"])
+        resolved = (await finish(store, s2, []))["resolved"]
+        out_of_order = [(await finish(store, s, ["A"]))["regressed"] for s in (s4, s3)]
+        await store.clear_scan_results(s4)
+        latest = [tuple(r) for r in await store.pool.fetch("SELECT scan_id, state FROM finding_latest")]
+        retried = await finish(store, s4, ["B"])
+        await store.close()
+        return s3, resolved, out_of_order, latest, retried
+
+    s3, resolved, out_of_order, latest, retried = asyncio.run(run())
+    assert resolved == {A} and out_of_order == [{A}, {A}]
+    assert latest == [(s3, "open")]
+    assert retried == {"new": {"h|1.1.1.1|80|tcp|B"}, "resolved": {A}, "regressed": set()}
+
+
+def test_concurrent_leases_never_share_a_scan():
+    async def run():
+        store = await _store()
+        ids = {await store.enqueue_scan("example.com") for _ in range(5)}
+        jobs = await asyncio.gather(*[store.lease_scan(f"w{i}", 60) for i in range(8)])
+        leased = [j["id"] for j in jobs if j]
+        first = next(j for j in jobs if j)
+        assert await store.heartbeat_scan(first["id"], first["lease_owner"], 60)
+        assert not await store.heartbeat_scan(first["id"], "someone-else", 60)
+        assert await store.heartbeat_scan(first["id"], first["lease_owner"], 60, {"ports_probed": 1})
+        assert (await store.cancel_scan(first["id"]))["cancel_requested"] == 1
+        assert not await store.heartbeat_scan(first["id"], first["lease_owner"], 60)
+        queued = await store.enqueue_scan("example.com", time_limit=5)
+        assert (await store.cancel_scan(queued))["status"] == "cancelled"
+        direct = await store.create_scan("aws")  # no lease: nothing would ever stop it
+        assert (await store.cancel_scan(direct))["status"] == "cancelled"
+        await store.finish_scan(direct, "done", {})
+        assert (await store.get_scan(direct))["status"] == "cancelled"
+        active = await store.list_active_scans()
+        await store.close()
+        return ids, leased, first["id"], active
+
+    ids, leased, first, active = asyncio.run(run())
+    assert sorted(leased) == sorted(ids)
+    assert [a["id"] for a in active] == sorted(ids)
+    assert next(a for a in active if a["id"] == first)["progress_json"] == '{"ports_probed": 1}'
+
+
+def test_keyset_pages_match_sqlite_sql():
+    async def run():
+        store = await _store()
+        scan_id = await store.create_scan("example.com")
+        async with store.scan_writer(scan_id) as w:
+            for i in range(10):
+                await w.add_finding("h", None, None if i % 3 == 0 else i, "tcp", ["low", "high"][i % 2], f"t{i}",
+                                    "d", {}, float(i % 4))
+        pages, after = [], None
+        while rows := await store.list_findings_page(scan_id, "port", after=after, limit=3):
+            pages.append([r["id"] for r in rows])
+            after = (rows[-1]["sort_key"], rows[-1]["id"])
+        high = await store.list_findings_page(scan_id, "severity", desc=False, severity=["high"], limit=100)
+        everything = await store.list_findings(scan_id)
+        await store.close()
+        return pages, high, everything
+
+    pages, high, everything = asyncio.run(run())
+    expected = sorted(everything, key=lambda f: (-1 if f["port"] is None else f["port"], f["id"]), reverse=True)
+    assert [i for p in pages for i in p] == [f["id"] for f in expected] and len(pages) == 4
+    assert {f["severity"] for f in high} == {"high"} and high[0]["severity_rank"] == 3
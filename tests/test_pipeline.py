@@ -0,0 +1,98 @@
+import asyncio
+import time
+from app import scanner
+from app.pipeline import ScanPipeline
+
+
+class FakeResolver:
+    def __init__(self, table, delays):
+        self.table = table
+        self.delays = delays
+        self.done = {}
+
+    async def resolve(self, host):
+        await asyncio.sleep(self.delays.get(host, 0))
+        self.done[host] = time.monotonic()
+        return self.table.get(host, []), []
+
+
+def _patch(monkeypatch, subs, open_ports, probed):
+    async def fake_subs(domain):
+        for h in subs:
+            yield h
+
+    async def fake_probe(ip, port, timeout=1.0):
+        probed.append((ip, port, time.monotonic()))
+        return ("open" if (ip, port) in open_ports else "closed"), 0.001
+
+    async def fake_fp(host, ip, scheme, port=None, fingerprinter=None):
+        return {"status": 200, "scheme": scheme}
+
+    async def fake_banner(ip, port=22, timeout=2.0):
+        return "SSH-2.0-OpenSSH_9.6"
+
+    monkeypatch.setattr(scanner, "iter_crtsh_subdomains", fake_subs)
+    monkeypatch.setattr(scanner, "tcp_probe", fake_probe)
+    monkeypatch.setattr(scanner, "http_fingerprint", fake_fp)
+    monkeypatch.setattr(scanner, "get_ssh_banner", fake_banner)
+    async def fake_tls(host, ip, port=443, timeout=3.0):
+        return {"protocol": "TLSv1.3", "ip": ip}
+
+    monkeypatch.setattr(scanner, "get_tls_info", fake_tls)
+
+
+def test_fast_host_is_probed_before_slow_host_resolves(monkeypatch):
+    probed = []
+    _patch(monkeypatch, ["fast.example.com", "slow.example.com"], set(), probed)
+    r = FakeResolver({"fast.example.com": ["192.0.2.1"], "slow.example.com": ["192.0.2.2"]},
+                     {"slow.example.com": 0.3})
+    asyncio.run(ScanPipeline(resolver=r, ports=[80, 443]).run("example.com"))
+    fast = [t for ip, _, t in probed if ip == "192.0.2.1"]
+    assert len(fast) == 2 and max(fast) < r.done["slow.example.com"]
+
+
+def test_result_shape_matches_scan_domain(monkeypatch):
+    probed = []
+    opened = {("192.0.2.1", 80), ("192.0.2.1", 443), ("192.0.2.1", 22)}
+    _patch(monkeypatch, ["a.example.com", "b.example.com"], opened, probed)
+    r = FakeResolver({"a.example.com": ["192.0.2.1"]}, {})
+    out = asyncio.run(ScanPipeline(resolver=r, ports=[22, 80, 443, 3306],
+                                   queue_size=1, probe_workers=2).run("example.com"))
+    assert out["host_ips"] == {"a.example.com": ["192.0.2.1"], "b.example.com": []}
+    assert sorted(out["open_ports"]) == [("a.example.com", "192.0.2.1", p) for p in (22, 80, 443)]
+    assert out["fingerprints"]["a.example.com|192.0.2.1|80"]["scheme"] == "http"
+    assert out["fingerprints"]["a.example.com|192.0.2.1|443"]["scheme"] == "https"
+    assert out["tls"]["a.example.com|192.0.2.1|443"] == {"protocol": "TLSv1.3", "ip": "192.0.2.1"}
+    assert out["ssh"] == {"a.example.com|192.0.2.1|22": "SSH-2.0-OpenSSH_9.6"}
+    assert len(probed) == 4
+
+
+def test_shared_ip_probed_once_and_fanned_out(monkeypatch):
+    probed = []
+    fps = []
+    banners = []
+    opened = {("203.0.113.5", 443), ("203.0.113.5", 22)}
+    hosts = [f"h{i}.example.com" for i in range(50)]
+    _patch(monkeypatch, hosts, opened, probed)
+
+    async def fake_fp(host, ip, scheme, port=None, fingerprinter=None):
+        fps.append((host, ip, port))
+        return {"status": 200}
+
+    async def fake_banner(ip, port=22, timeout=2.0):
+        banners.append(ip)
+        return "SSH-2.0-x"
+
+    monkeypatch.setattr(scanner, "http_fingerprint", fake_fp)
+    monkeypatch.setattr(scanner, "get_ssh_banner", fake_banner)
+    # h0 resolves late, after the shared IP's ports were already probed.
+    r = FakeResolver({h: ["203.0.113.5"] for h in hosts}, {"h0.example.com": 0.2})
+    out = asyncio.run(ScanPipeline(resolver=r, ports=[22, 80, 443]).run("example.com"))
+    assert len(probed) == 3
+    assert banners == ["203.0.113.5"]
+    assert sorted(fps) == sorted((h, "203.0.113.5", 443) for h in hosts)
+    assert len(out["open_ports"]) == 100
+    assert ("h0.example.com", "203.0.113.5", 443) in out["open_ports"]
+    assert out["ssh"]["h0.example.com|203.0.113.5|22"] == "SSH-2.0-x"
+    assert len(out["tls"]) == 50
+    assert out["metrics"]["dedupe"] == {"host_ip_pairs": 50, "unique_ips": 1, "connects_saved": 147}
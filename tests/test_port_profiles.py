@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from app import scanner
+from app.pipeline import PortScheduler, ScanPipeline
+from app.ratelimit import AdaptiveLimiter
+from app.scanner import PORT_PROFILES, load_port_profiles, parse_ports
+
+
+def test_parse_ports_ranges_and_dedupe():
+    assert parse_ports("22, 80,79-81,0,70000") == [22, 80, 79, 81]
+
+
+def test_builtin_profiles():
+    assert PORT_PROFILES["default"] == scanner.DEFAULT_PORTS
+    assert len(PORT_PROFILES["default"]) == 16
+    assert len(PORT_PROFILES["top-1000"]) == len(set(PORT_PROFILES["top-1000"])) == 1000
+    assert PORT_PROFILES["top-1000"][:3] == [80, 23, 443]
+    assert PORT_PROFILES["quick"] == PORT_PROFILES["top-1000"][:20]
+    assert set(PORT_PROFILES["default"]) | scanner.RISKY_PORTS <= set(PORT_PROFILES["top-1000"])
+    assert len(PORT_PROFILES["full"]) == 65535
+    assert {3389, 6379, 27017} <= scanner.RISKY_PORTS
+
+
+def test_top_n_takes_the_ranking_prefix(tmp_path):
+    path = tmp_path / "p.json"
+    path.write_text('{"ranked": "443,80,22", "profiles": {"t2": {"top": 2}}, "risky": "3389"}')
+    profiles, risky = load_port_profiles(path)
+    assert profiles["t2"] == [443, 80]
+    assert risky == {3389}
+
+
+def test_top_n_longer_than_ranking_is_rejected(tmp_path):
+    path = tmp_path / "p.json"
+    path.write_text('{"ranked": "443,80", "profiles": {"t5": {"top": 5}}}')
+    with pytest.raises(ValueError, match="top 5 ports, ranking has 2"):
+        load_port_profiles(path)
+
+
+def test_scheduler_round_robins_ips_lazily():
+    async def run():
+        s = PortScheduler(list(range(1, 65536)))
+        await s.add("192.0.2.1")
+        await s.add("192.0.2.2")
+        first = [await s.get() for _ in range(4)]
+        await s.close()
+        return s, first
+
+    s, first = asyncio.run(run())
+    assert first == [("192.0.2.1", 1), ("192.0.2.2", 1), ("192.0.2.1", 2), ("192.0.2.2", 2)]
+    assert s.total == 2 * 65535 and s.handed_out == 4
+
+
+def test_full_sweep_with_progress(monkeypatch):
+    seen = []
+    updates = []
+
+    async def fake_subs(domain):
+        yield "a.example.com"
+        yield "b.example.com"
+
+    class R:
+        async def resolve(self, host):
+            return ["192.0.2.1" if host.startswith("a") else "192.0.2.2"], []
+
+    async def fake_probe(ip, port, timeout=1.0):
+        seen.append((ip, port))
+        return "closed", 0.0
+
+    monkeypatch.setattr(scanner, "iter_crtsh_subdomains", fake_subs)
+    monkeypatch.setattr(scanner, "tcp_probe", fake_probe)
+    ports = PORT_PROFILES["full"][:5000]
+    out = asyncio.run(ScanPipeline(resolver=R(), ports=ports, limiter=AdaptiveLimiter(pps=0),
+                                   on_progress=updates.append,
+                                   progress_interval=0.05).run("example.com"))
+    assert len(seen) == 10000 and out["open_ports"] == []
+    assert updates[-1]["ports_probed"] == updates[-1]["ports_total"] == 10000
+    assert updates[-1]["fingerprints_done"] == updates[-1]["fingerprints_total"] == 0
+    assert out["metrics"]["tcp"]["attempts"] == 10000
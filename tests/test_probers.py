@@ -0,0 +1,57 @@
+import asyncio
+import hashlib
+import ssl
+from app.probers import decode_cert, get_tls_info
+
+
+def test_get_tls_info_against_local_server(tls_cert):
+    cert_path, key_path = tls_cert
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(cert_path, key_path)
+    seen_sni = []
+    ctx.sni_callback = lambda sock, name, c: seen_sni.append(name)
+
+    async def run():
+        async def handle(reader, writer):
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=ctx)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(*[get_tls_info("www.example.com", "127.0.0.1", port)
+                                          for _ in range(5)])
+
+    infos = asyncio.run(run())
+    info = infos[0]
+    assert seen_sni == ["www.example.com"] * 5
+    assert info["protocol"].startswith("TLSv1")
+    assert info["cipher"]
+    assert info["subject"] == "commonName=www.example.com"
+    assert info["days_to_expiry"] in (29, 30)
+    assert info["sans"] == ["www.example.com", "example.com", "127.0.0.1"]
+    assert info["key_type"] == "RSA" and info["key_size"] == 2048
+    assert info["chain"] and info["chain"][0]["sha256"] == info["sha256"]
+
+
+def test_get_tls_info_closed_port_raises():
+    async def run():
+        server = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        try:
+            await get_tls_info("x", "127.0.0.1", port, timeout=1.0)
+        except OSError:
+            return True
+        return False
+
+    assert asyncio.run(run())
+
+
+def test_malformed_certificate_is_reported_without_losing_the_others(tls_cert):
+    good = ssl.PEM_cert_to_DER_cert(tls_cert[0].read_text())
+    bad = good[:-40]
+    chain = [decode_cert(der) for der in (good, bad, b"\x30\x03\x02\x01\x00")]
+    assert chain[0]["subject"] == "commonName=www.example.com" and "error" not in chain[0]
+    for der, info in zip((bad, b"\x30\x03\x02\x01\x00"), chain[1:]):
+        assert set(info) == {"sha256", "error"}
+        assert info["sha256"] == hashlib.sha256(der).hexdigest() and info["error"]
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from app.ratelimit import AdaptiveLimiter, RTTEstimator, TokenBucket
+
+
+def test_token_bucket_caps_rate():
+    async def run():
+        bucket = TokenBucket(rate=200, burst=1)
+        start = time.monotonic()
+        for _ in range(41):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_rtt_scales_timeouts():
+    rtt = RTTEstimator(initial=1.0, min_timeout=0.05, max_timeout=5.0)
+    assert rtt.timeout("new") == 1.0
+    for _ in range(10):
+        rtt.sample("fast", 0.01)
+        rtt.sample("slow", 0.4)
+    assert rtt.timeout("fast") < 0.1
+    assert 0.4 < rtt.timeout("slow") <= 5.0
+
+
+def test_aimd_increase_and_decrease():
+    async def run():
+        lim = AdaptiveLimiter(initial=20, min_limit=5, max_limit=40, pps=0, cooldown=0)
+        for _ in range(100):
+            await lim.probe("192.0.2.1", lambda t: asyncio.sleep(0, ("open", 0.01)))
+        grown = lim.limit
+        await lim.probe("192.0.2.2", lambda t: asyncio.sleep(0, ("error", 0.0)))
+        return grown, lim
+
+    grown, lim = asyncio.run(run())
+    assert grown > 20
+    assert lim.limit == grown / 2 / 2  # error is retried once, two decreases
+    m = lim.metrics()
+    assert m["open"] == 100 and m["errors"] == 1 and m["decreases"] == 2
+
+
+def test_filtered_ports_do_not_shrink_window():
+    async def run():
+        lim = AdaptiveLimiter(initial=50, pps=0, cooldown=0)
+        for _ in range(20):
+            await lim.probe("192.0.2.9", lambda t: asyncio.sleep(0, ("timeout", t)))
+        return lim
+
+    lim = asyncio.run(run())
+    assert lim.limit == 50
+    assert lim.metrics()["filtered"] == 20 and lim.metrics()["retries"] == 0
+
+
+def test_unreachable_and_cancelled_probes_do_not_shrink_window():
+    async def run():
+        lim = AdaptiveLimiter(initial=50, pps=0, cooldown=0)
+        await lim.probe("192.0.2.1", lambda t: asyncio.sleep(0, ("open", 0.01)))  # responsive
+        grown = lim.limit
+        for ip in ("192.0.2.1", "2001:db8::1"):
+            await lim.probe(ip, lambda t: asyncio.sleep(0, ("filtered", 0.0)))
+        task = asyncio.create_task(lim.probe("192.0.2.1", lambda t: asyncio.sleep(10, ("open", 0.01))))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return grown, lim
+
+    grown, lim = asyncio.run(run())
+    m = lim.metrics()
+    assert lim.limit == grown and m["decreases"] == 0
+    assert m["filtered"] == 2 and m["errors"] == 0 and m["retries"] == 0
+    assert lim.in_flight == 0 and not lim.ip_in_flight
+
+
+def test_tcp_probe_classifies_connect_errors(monkeypatch):
+    import errno
+    from app import scanner
+
+    def failing(code):
+        async def open_connection(ip, port):
+            raise OSError(code, "stub")
+        return open_connection
+
+    states = {}
+    for code in (errno.ENETUNREACH, errno.EHOSTUNREACH, errno.EACCES, errno.EADDRNOTAVAIL, errno.EMFILE):
+        monkeypatch.setattr(asyncio, "open_connection", failing(code))
+        states[code] = asyncio.run(scanner.tcp_probe("192.0.2.1", 80))[0]
+    assert states == {errno.ENETUNREACH: "filtered", errno.EHOSTUNREACH: "filtered", errno.EACCES: "filtered",
+                      errno.EADDRNOTAVAIL: "error", errno.EMFILE: "error"}
+
+
+def test_shared_ip_gets_its_part_of_the_per_ip_cap():
+    peak = {"n": 0, "max": 0}
+
+    async def attempt(timeout):
+        peak["n"] += 1
+        peak["max"] = max(peak["max"], peak["n"])
+        await asyncio.sleep(0.01)
+        peak["n"] -= 1
+        return "closed", 0.01
+
+    async def run():
+        lim = AdaptiveLimiter(pps=0, per_ip=16)
+        lim.share_ip("192.0.2.1", 4)
+        await asyncio.gather(*[lim.probe("192.0.2.1", attempt) for _ in range(40)])
+
+    asyncio.run(run())
+    assert peak["max"] == 4
+
+
+def test_retry_recovers_timeout_from_responsive_host():
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        return ("open", 0.02) if len(calls) != 2 else ("timeout", timeout)
+
+    async def run():
+        lim = AdaptiveLimiter(pps=0)
+        await lim.probe("192.0.2.1", attempt)
+        return lim, await lim.probe("192.0.2.1", attempt)
+
+    lim, state = asyncio.run(run())
+    assert state == "open"
+    assert lim.metrics()["recovered"] == 1
+    assert len(calls) == 3 and calls[2] == 2 * calls[1]
+
+
+def test_per_ip_fairness_and_window():
+    alive = {}
+    peak = {}
+
+    async def run():
+        lim = AdaptiveLimiter(initial=6, min_limit=1, max_limit=6, per_ip=2, pps=0)
+
+        async def one(ip):
+            async def attempt(timeout):
+                alive[ip] = alive.get(ip, 0) + 1
+                peak[ip] = max(peak.get(ip, 0), alive[ip])
+                peak["total"] = max(peak.get("total", 0), sum(v for k, v in alive.items()))
+                await asyncio.sleep(0.005)
+                alive[ip] -= 1
+                return "closed", 0.005
+            await lim.probe(ip, attempt)
+
+        await asyncio.gather(*[one(ip) for ip in ("a", "b", "c", "d") for _ in range(10)])
+
+    asyncio.run(run())
+    assert all(peak[ip] <= 2 for ip in "abcd")
+    assert peak["total"] <= 6
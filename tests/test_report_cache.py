@@ -0,0 +1,98 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app import db, main
+from app.report_cache import ReportCache
+
+
+def _seed(tmp_path, monkeypatch, findings=3):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "r.db"))
+    monkeypatch.setattr(main, "reports", ReportCache(str(tmp_path / "reports")))
+    renders = []
+    real = main.render_report
+
+    def counting(*args):
+        renders.append(args[0])
+        return real(*args)
+
+    monkeypatch.setattr(main, "render_report", counting)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        async with db.ScanWriter(scan_id) as w:
+            await w.upsert_asset("h", "192.0.2.1")
+            for i in range(findings):
+                await w.add_finding("h", "192.0.2.1", i, "tcp", "low", f"t{i}", "d", {}, i)
+        await db.finish_scan(scan_id, "done", {"score": 90})
+        await db.close_pool()
+        return scan_id
+
+    return asyncio.run(run()), renders
+
+
+def test_repeat_views_are_cached_and_revalidated(tmp_path, monkeypatch):
+    scan_id, renders = _seed(tmp_path, monkeypatch)
+    with TestClient(main.app) as client:
+        first = client.get(f"/report/{scan_id}")
+        etag = first.headers["etag"]
+        again = client.get(f"/report/{scan_id}")
+        not_modified = client.get(f"/report/{scan_id}", headers={"If-None-Match": etag})
+        plain = client.get(f"/report/{scan_id}", headers={"Accept-Encoding": "identity"})
+        # Changing an asset invalidates the report.
+        client.post("/org/scope", json={"scan_id": scan_id, "host": "h", "ip": "192.0.2.1",
+                                        "owner_email": "o@example.com"})
+        changed = client.get(f"/report/{scan_id}", headers={"If-None-Match": etag})
+    assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+    assert "t2" in first.text and again.text == first.text and again.headers["etag"] == etag
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert "content-encoding" not in plain.headers and plain.text == first.text
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert renders == [scan_id, scan_id]
+    assert main.reports.stats == {"memory": 3, "disk": 0, "render": 2}
+    # One compressed copy per scan on disk, replaced on re-render.
+    assert [p.name for p in (tmp_path / "reports").glob("*.gz")] == [f"scan_{scan_id}.{changed.headers['etag'].strip(chr(34))}.html.gz"]
+
+
+def test_disk_copy_survives_a_restart(tmp_path, monkeypatch):
+    scan_id, renders = _seed(tmp_path, monkeypatch)
+    with TestClient(main.app) as client:
+        etag = client.get(f"/report/{scan_id}").headers["etag"]
+        main.reports = ReportCache(str(tmp_path / "reports"))
+        again = client.get(f"/report/{scan_id}")
+    assert again.headers["etag"] == etag and renders == [scan_id]
+    assert main.reports.stats["disk"] == 1
+
+
+def test_running_scans_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "r.db"))
+    monkeypatch.setattr(main, "reports", ReportCache(str(tmp_path / "reports")))
+    with TestClient(main.app) as client:
+        client.post("/org/scope", json={"kind": "domain", "value": "example.com"})
+        scan_id = client.post("/scan", json={"domain": "example.com"}).json()["scan_id"]
+        r = client.get(f"/report/{scan_id}")
+    assert "still running" in r.text and "etag" not in r.headers
+    assert not (tmp_path / "reports").exists()
+
+
+
+def test_render_locks_are_dropped_when_unused(tmp_path):
+    cache = ReportCache(str(tmp_path / "reports"))
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await asyncio.sleep(0.05)
+        return "<html>ok</html>"
+
+    async def run():
+        scans = [{"id": i, "revision": 1, "status": "done", "domain": "example.com", "finished_at": 1,
+                  "stats_json": "{}"} for i in range(50)]
+        views = [cache.get(s, render) for s in scans for _ in range(3)]
+        first = asyncio.gather(*views)
+        await asyncio.sleep(0.01)
+        waiting = len(cache.locks)
+        await first
+        return waiting
+
+    assert asyncio.run(run()) == 50
+    assert len(renders) == 50 and len(cache.locks) == 0
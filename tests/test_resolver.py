@@ -0,0 +1,68 @@
+import asyncio
+import socket
+import time
+from app import scanner
+from app.resolver import AsyncResolver, parse_nameservers
+
+RECORDS = {
+    ("www.example.com", "A"): (300, ["192.0.2.10", "192.0.2.11"]),
+    ("www.example.com", "AAAA"): (300, ["2001:db8::10"]),
+    ("cdn.example.com", "CNAME"): (300, ["www.example.com."]),
+    ("mail.example.com", "A"): (300, ["192.0.2.25"]),
+}
+
+
+def test_parse_nameservers():
+    assert parse_nameservers("1.1.1.1, 8.8.8.8:5353,[::1]:53") == [
+        ("1.1.1.1", 53), ("8.8.8.8", 5353), ("::1", 53)]
+    assert parse_nameservers(None) == []
+
+
+def test_resolve_a_aaaa_cname(dns_stub):
+    srv = dns_stub(RECORDS)
+    r = AsyncResolver(nameservers=[("127.0.0.1", srv.port)], timeout=1.0)
+
+    async def run():
+        return await asyncio.gather(r.resolve("www.example.com"), r.resolve("cdn.example.com"),
+                                    r.resolve("missing.example.com"))
+
+    (ips, cn), (cdn_ips, cdn_cn), (none_ips, none_cn) = asyncio.run(run())
+    assert sorted(ips) == ["192.0.2.10", "192.0.2.11", "2001:db8::10"]
+    assert cn == []
+    assert "192.0.2.10" in cdn_ips
+    assert cdn_cn == ["www.example.com"]
+    assert none_ips == [] and none_cn == []
+
+
+def test_query_timeout_on_silent_nameserver():
+    silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    silent.bind(("127.0.0.1", 0))
+    try:
+        r = AsyncResolver(nameservers=[("127.0.0.1", silent.getsockname()[1])], timeout=0.3)
+        start = time.monotonic()
+        assert asyncio.run(r.resolve("www.example.com")) == ([], [])
+        assert time.monotonic() - start < 2.0
+    finally:
+        silent.close()
+
+
+def test_scan_domain_uses_async_resolver(dns_stub, monkeypatch):
+    srv = dns_stub(RECORDS)
+    probed = []
+
+    async def fake_subs(domain):
+        for h in ("www.example.com", "mail.example.com", "missing.example.com"):
+            yield h
+
+    async def fake_probe(ip, port, timeout=1.0):
+        probed.append((ip, port))
+        return "closed", 0.001
+
+    monkeypatch.setattr(scanner, "iter_crtsh_subdomains", fake_subs)
+    monkeypatch.setattr(scanner, "tcp_probe", fake_probe)
+    r = AsyncResolver(nameservers=[("127.0.0.1", srv.port)], timeout=1.0)
+    out = asyncio.run(scanner.scan_domain("example.com", resolver=r))
+    assert list(out["host_ips"]) == ["mail.example.com", "missing.example.com", "www.example.com"]
+    assert out["host_ips"]["missing.example.com"] == []
+    assert ("192.0.2.25", 22) in probed
+    assert len(probed) == 4 * len(scanner.DEFAULT_PORTS)
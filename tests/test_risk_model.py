@@ -1,3 +1,6 @@
+import json
+import pytest
+from app import risk_model
 from app.risk_model import RiskModel, AssetContext
 
 def test_categorize_and_controls_rdp():
@@ -22,3 +25,53 @@ def test_tls_expired_is_high():
     score, det = RiskModel.score(f, ctx)
     assert det["finding_type"] == "tls_expired"
     assert score >= 7
+
+def _mixed_findings():
+    ctxs = [AssetContext(criticality=c, data_class=d, internet_exposed=e)
+            for c in range(1, 6) for d in ("P0", "P1", "P2", "P3", "PX") for e in (True, False)]
+    kinds = [("tcp", 3389, "Open TCP 3389", None), ("tcp", 22, "Open TCP 22", None),
+             ("http", 80, "Plain HTTP exposed (No HTTPS available)", None), ("http", 80, "HTTP 404 on port 80", None),
+             ("tls", 443, "Expired TLS certificate", -1), ("tls", 443, "TLS certificate expiring soon", 3),
+             ("ssh", 22, "SSH service banner", None), ("aws", None, "Public S3 bucket", None), ("dns", None, "x", None)]
+    rows = [(t, port, sev, title, days, ci, sib)
+            for t, port, title, days in kinds
+            for sev in (None, "info", "low", "Medium", "high", "critical", "odd")
+            for ci in range(len(ctxs)) for sib in (True, False)]
+    return ctxs, rows
+
+def _batch(ctxs, rows):
+    t, port, sev, title, days, ci, sib = zip(*rows)
+    return RiskModel.score_batch(t, port, sev, title, ctxs, ci, sib, evidence=[{"days_to_expiry": d} for d in days])
+
+def test_score_batch_matches_score():
+    ctxs, rows = _mixed_findings()
+    scores, types, controls = _batch(ctxs, rows)
+    for (t, port, sev, title, days, ci, sib), s, ft, c in zip(rows, scores, types, controls):
+        expected, det = RiskModel.score({"type": t, "port": port, "severity": sev, "title": title,
+                                         "evidence_json": {"days_to_expiry": days}}, ctxs[ci], sibling_https_open=sib)
+        assert (s, ft) == (expected, det["finding_type"])
+        assert c is det["controls"]  # one shared object per finding type
+    assert controls[0]["iso27001"] and len({id(c) for c in controls}) == len(set(types))
+
+def test_score_batch_without_numpy(monkeypatch):
+    ctxs, rows = _mixed_findings()
+    with_numpy = _batch(ctxs, rows)
+    monkeypatch.setattr(risk_model, "np", None)
+    plain = _batch(ctxs, rows)
+    assert plain[0] == list(with_numpy[0]) and plain[1:] == with_numpy[1:]
+
+def test_score_batch_accepts_unhashable_evidence():
+    evidence = [{"days_to_expiry": [3]}, {"days_to_expiry": {"days": 3}}, {"days_to_expiry": -1}, None]
+    n = len(evidence)
+    scores, types, _ = RiskModel.score_batch(["tls"] * n, [443] * n, ["low"] * n, ["Expired TLS certificate"] * n,
+                                             [AssetContext()], [0] * n, evidence=evidence)
+    assert list(scores) == [RiskModel.score({"type": "tls", "port": 443, "severity": "low", "evidence_json": ev,
+                                             "title": "Expired TLS certificate"}, AssetContext())[0] for ev in evidence]
+    assert types[2] == "tls_expired" and types[0] == types[1] == types[3]
+
+def test_controls_are_read_only():
+    controls = RiskModel.map_controls("open_port_rdp")
+    with pytest.raises(TypeError):
+        controls["iso27001"] = []
+    assert json.loads(json.dumps(controls))["cis_controls"] == list(controls["cis_controls"])
+    assert RiskModel.map_controls("unmapped") == {"iso27001": (), "cis_controls": ()}
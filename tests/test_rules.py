@@ -0,0 +1,62 @@
+import json, os
+from app import risk_model
+from app.risk_model import AssetContext, RiskModel
+from app.rules import RuleEngine, RuleSet
+
+
+def _write(path, mappings, stamp):
+    path.write_text(json.dumps({"mappings": mappings}))
+    os.utime(path, ns=(stamp, stamp))  # distinct mtimes even within one clock tick
+
+
+def test_shipped_rules_keep_categorization():
+    cases = [({"type": "tcp", "port": 3306}, "open_port_db_mysql"), ({"type": "tcp", "port": 22}, ""),
+             ({"type": "http", "title": "HTTP 404 on port 80"}, "http_no_tls"),
+             ({"type": "http", "title": "HTTP 404 on port 443"}, ""),
+             ({"type": "tls", "evidence_json": {"days_to_expiry": 3}}, ""),
+             ({"type": "tls", "evidence_json": {"days_to_expiry": "soon"}}, ""),
+             ({"type": "ssh"}, "ssh_banner_leak"),
+             ({"type": "aws", "title": "IAM user with AdministratorAccess"}, "iam_user_admin_access"),
+             ({"type": "aws", "title": "Open security group", "description": "ingress 0.0.0.0/0"}, "sg_all_open_0_0_0_0"),
+             ({"type": "aws", "title": "Public bucket logs", "description": "0.0.0.0/0"}, "s3_public_bucket")]
+    assert [RiskModel.categorize(f) for f, _ in cases] == [c for _, c in cases]
+
+
+def test_rules_reload_without_restart(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    _write(path, {"telnet": {"match": {"type": "tcp", "port": [23, 2323]}, "default_severity": "high",
+                             "iso27001": ["A.8.20"]}}, 1_000_000_000)
+    engine = RuleEngine(str(path), reload=0)
+    monkeypatch.setattr(risk_model, "RULES", engine)
+    f = {"type": "tcp", "port": 2323, "severity": "low"}
+    before = engine.current()
+    score, det = RiskModel.score(f, AssetContext())
+    assert det["finding_type"] == "telnet" and det["controls"]["iso27001"] == ("A.8.20",)
+
+    _write(path, {"telnet": {"match": {"type": "tcp", "port": 23}, "default_severity": "critical"},
+                  "http_login": {"match": {"type": "http", "title_all": ["login", "http "]},
+                                 "default_severity": "medium", "penalties": {"no_https_sibling": 3.0}}}, 2_000_000_000)
+    assert RiskModel.categorize(f) == "" and RiskModel.categorize({**f, "port": 23}) == "telnet"
+    login = {"type": "http", "port": 80, "severity": "low", "title": "HTTP 200 on port 80 (Login)"}
+    assert RiskModel.score(login, AssetContext(), sibling_https_open=False)[1]["tls_penalty"] == 3.0
+    assert before.match(f).name == "telnet"  # a batch holding the old rules finishes with them
+    assert engine.version == 2 and engine.error is None
+
+    _write(path, {"broken": {"match": {"type": "tcp", "prot": 23}}}, 3_000_000_000)
+    assert RiskModel.categorize({**f, "port": 23}) == "telnet"
+    assert "bad match block" in engine.error and engine.version == 2
+    scores, types, _ = RiskModel.score_batch(["tcp", "http"], [23, 80], ["low", "low"], [None, login["title"]],
+                                             [AssetContext()], [0, 0], [True, False])
+    assert list(types) == ["telnet", "http_login"] and scores[1] == RiskModel.score(login, AssetContext(), False)[0]
+
+
+def test_dispatch_index_stays_flat_as_rules_grow():
+    mappings = {f"port_{p}": {"match": {"type": "tcp", "port": p}} for p in range(1000, 1500)}
+    mappings.update({f"banner_{i}": {"match": {"type": "ssh", "title_any": [f"v{i}."]}} for i in range(100)})
+    mappings["any_tcp"] = {"match": {"type": "tcp", "title_any": ["exposed"]}}
+    rules = RuleSet({"mappings": mappings})
+    assert [m.rule.name for m in rules.candidates("tcp", 1234)] == ["port_1234", "any_tcp"]
+    assert [m.rule.name for m in rules.candidates("tcp", 22)] == ["any_tcp"]
+    assert not rules.candidates("udp", 1234)
+    assert rules.lookup("tcp", 22, "Service exposed", None, None).name == "any_tcp"
+    assert rules.lookup("ssh", 22, "OpenSSH v42.1", None, None).name == "banner_42"
@@ -0,0 +1,92 @@
+import asyncio
+from app import db, fix_queue
+
+
+def _setup(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "writer.db"))
+    fix_queue.FIX_QUEUE.clear()
+    jira = []
+    monkeypatch.setattr(fix_queue, "open_jira_ticket", lambda *a: jira.append(a))
+    return jira
+
+
+def test_buffer_flushes_in_batches_and_on_exit(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        async with db.ScanWriter(scan_id, max_rows=100, max_delay=60) as w:
+            for i in range(250):
+                await w.add_finding(f"h{i}", "1.1.1.1", 80, "tcp", "low", "t", "d", {"i": i})
+            assert w.flushes == 2
+            assert len(await db.list_findings(scan_id)) == 200
+        assert w.flushes == 3
+        rows = await db.list_findings(scan_id)
+        await db.close_pool()
+        return rows
+
+    rows = asyncio.run(run())
+    assert len(rows) == 250
+
+
+def test_timed_flush(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        async with db.ScanWriter(scan_id, max_rows=1000, max_delay=0.05) as w:
+            await w.upsert_asset("h1", "1.1.1.1")
+            await asyncio.sleep(0.2)
+            assert w.flushes == 1
+            async with db.reader() as conn:
+                cur = await conn.execute("SELECT count(*) FROM assets")
+                assert (await cur.fetchone())[0] == 1
+        await db.close_pool()
+
+    asyncio.run(run())
+
+
+def test_owner_joined_and_side_effects_after_commit(tmp_path, monkeypatch):
+    jira = _setup(tmp_path, monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("example.com")
+        await db.upsert_asset(scan_id, "h1", "1.1.1.1", owner_email="owner@example.com")
+        async with db.ScanWriter(scan_id, max_rows=1000, max_delay=60) as w:
+            await w.upsert_asset("h2", None, owner_email="two@example.com")
+            await w.add_finding("h1", "1.1.1.1", 3389, "tcp", "high", "rdp", "d", {})
+            await w.add_finding("h2", None, None, "tcp", "critical", "bad", "d", {})
+            await w.add_finding("h1", "1.1.1.1", 80, "tcp", "low", "http", "d", {})
+            assert fix_queue.FIX_QUEUE == []
+        await db.close_pool()
+
+    asyncio.run(run())
+    assert [(e["title"], e["owner_email"]) for e in fix_queue.FIX_QUEUE] == [
+        ("rdp", "owner@example.com"), ("bad", "two@example.com")]
+    assert [a[1] for a in jira] == ["rdp", "bad"]
+
+
+def test_concurrent_scans_report_only_their_own_urgent_findings(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def write(scan_id, n):
+        async with db.ScanWriter(scan_id, max_rows=3, max_delay=60) as w:
+            for i in range(n):
+                await w.add_finding(f"h{i}", "1.1.1.1", 3389, "tcp", "high", f"s{scan_id}-{i}", "d", {})
+                await asyncio.sleep(0)
+
+    async def run():
+        await db.init_db()
+        a, b = await db.create_scan("a.example.com"), await db.create_scan("b.example.com")
+        await asyncio.gather(write(a, 10), write(b, 10))
+        await db.close_pool()
+        return a, b
+
+    a, b = asyncio.run(run())
+    titles = [e["title"] for e in fix_queue.FIX_QUEUE]
+    assert sorted(titles) == sorted([f"s{a}-{i}" for i in range(10)] + [f"s{b}-{i}" for i in range(10)])
+    ids = [e["finding_id"] for e in fix_queue.FIX_QUEUE]
+    assert len(ids) == len(set(ids))
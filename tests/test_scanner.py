@@ -1,4 +1,5 @@
 import asyncio
+from contextlib import asynccontextmanager
 import httpx
 from app.scanner import http_fingerprint
 
@@ -8,8 +9,11 @@ def test_http_fingerprint_parses_uppercase_title(monkeypatch):
             return self
         async def __aexit__(self, exc_type, exc, tb):
             pass
-        async def get(self, url, headers):
-            return httpx.Response(200, text="<HTML><TITLE>HELLO</TITLE></HTML>")
+        async def aclose(self):
+            pass
+        @asynccontextmanager
+        async def stream(self, method, url, headers, **kwargs):
+            yield httpx.Response(200, text="<HTML><TITLE>HELLO</TITLE></HTML>")
     monkeypatch.setattr(httpx, "AsyncClient", lambda *args, **kwargs: DummyClient())
     fp = asyncio.run(http_fingerprint("example.com", "1.2.3.4", "http"))
     assert fp["title"] == "HELLO"
@@ -20,8 +24,74 @@ def test_http_fingerprint_detects_hsts(monkeypatch):
             return self
         async def __aexit__(self, exc_type, exc, tb):
             pass
-        async def get(self, url, headers):
-            return httpx.Response(200, text="<html></html>", headers={"Strict-Transport-Security": "max-age=0"})
+        async def aclose(self):
+            pass
+        @asynccontextmanager
+        async def stream(self, method, url, headers, **kwargs):
+            yield httpx.Response(200, text="<html></html>", headers={"Strict-Transport-Security": "max-age=0"})
     monkeypatch.setattr(httpx, "AsyncClient", lambda *args, **kwargs: DummyClient())
     fp = asyncio.run(http_fingerprint("example.com", "1.2.3.4", "https"))
     assert fp["hsts"] is True
+
+
+def test_bounded_imap_is_lazy_and_bounded():
+    from app.scanner import bounded_imap
+    pulled = []
+    alive = {"now": 0, "max": 0}
+
+    def targets():
+        for i in range(1000):
+            pulled.append(i)
+            yield i
+
+    async def work(i):
+        alive["now"] += 1
+        alive["max"] = max(alive["max"], alive["now"])
+        await asyncio.sleep(0.001 * (i % 3))
+        alive["now"] -= 1
+        return i * 2
+
+    async def run():
+        seen = {}
+        gen = bounded_imap(work, targets(), limit=10)
+        async for idx, item, res in gen:
+            assert len(pulled) <= len(seen) + 11
+            seen[idx] = (item, res)
+        return seen
+
+    seen = asyncio.run(run())
+    assert alive["max"] == 10
+    assert all(seen[i] == (i, i * 2) for i in range(1000))
+
+
+def test_bounded_imap_cancels_pending_on_close():
+    from app.scanner import bounded_imap
+    cancelled = []
+
+    async def work(i):
+        try:
+            await asyncio.sleep(0 if i == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+        return i
+
+    async def run():
+        gen = bounded_imap(work, range(100), limit=5)
+        async for _ in gen:
+            break
+        await gen.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert sorted(cancelled) == [1, 2, 3, 4]
+
+
+def test_bounded_gather_keeps_order_with_generator_input():
+    from app.scanner import bounded_gather
+
+    async def work(i):
+        await asyncio.sleep(0.001 * (5 - i))
+        return i
+
+    assert asyncio.run(bounded_gather((work(i) for i in range(5)), limit=2)) == [0, 1, 2, 3, 4]
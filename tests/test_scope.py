@@ -1,7 +1,7 @@
 import asyncio
 from fastapi.testclient import TestClient
 from app.main import app
-from app import db, scanner
+from app import db
 
 
 def test_scope_registration(tmp_path, monkeypatch):
@@ -19,9 +19,7 @@ def test_start_scan_enforces_scope(tmp_path, monkeypatch):
         r = client.post("/scan", json={"domain": "example.com"})
         assert r.status_code == 400
         client.post("/org/scope", json={"kind": "domain", "value": "example.com"})
-        async def fake_scan(domain):
-            return {"host_ips": {}, "open_ports": [], "fingerprints": {}}
-        monkeypatch.setattr(scanner, "scan_domain", fake_scan)
         r2 = client.post("/scan", json={"domain": "example.com"})
-        assert r2.status_code == 200
-        assert "scan_id" in r2.json()
+        assert r2.status_code == 200 and r2.json()["status"] == "queued"
+        scan = client.get(f"/scans/{r2.json()['scan_id']}").json()["scan"]
+        assert (scan["domain"], scan["status"], scan["profile"]) == ("example.com", "queued", "default")
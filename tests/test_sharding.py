@@ -0,0 +1,147 @@
+import asyncio, multiprocessing, time
+import socket
+from app import scanner, sharding
+from app.pipeline import ScanPipeline
+
+
+class FakeResolver:
+    def __init__(self, table):
+        self.table = table
+
+    async def resolve(self, host):
+        return self.table.get(host, []), []
+
+
+def _listener():
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(("0.0.0.0", 0))
+    s.listen(128)
+    return s
+
+
+def _closed_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def test_small_port_lists_keep_ips_whole_and_large_ones_are_split():
+    placed = {f"10.0.0.{i}": sharding.shard_slices(f"10.0.0.{i}", 1000, 4) for i in range(100)}
+    assert all(len(v) == 1 and v[0][1:] == (0, 1) for v in placed.values())
+    assert len({v[0][0] for v in placed.values()}) == 4
+    assert placed["10.0.0.1"] == sharding.shard_slices("10.0.0.1", 1000, 4)
+    full = sharding.shard_slices("10.0.0.1", 65535, 4)
+    assert sorted(shard for shard, _, _ in full) == [0, 1, 2, 3]
+    ports = list(range(1, 65536))
+    assert sorted(p for _, j, spans in full for p in ports[j::spans]) == ports
+
+
+def test_full_sweep_of_one_ip_uses_every_shard(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_CHUNK", 100)
+    ports = list(range(40000, 40400))
+    parts = asyncio.run(sharding.scan_targets({"127.0.0.1": ["h.example.com"]}, ports, 4,
+                                              limiter_kwargs={"pps": 0}))
+    assert [r["metrics"]["tcp"]["attempts"] for r in parts] == [100] * 4
+    assert sum(r["progress"]["ports_total"] for r in parts) == 400
+
+
+def test_sharded_probe_matches_single_process():
+    srv = _listener()
+    try:
+        open_port, closed = srv.getsockname()[1], _closed_port()
+        ip_hosts = {f"127.0.0.{i}": [f"h{i}.example.com"] for i in range(1, 9)}
+        ports = [open_port, closed]
+        parts = asyncio.run(sharding.scan_targets(ip_hosts, ports, 3, limiter_kwargs={"pps": 0}))
+        single = asyncio.run(ScanPipeline(ports=ports, limiter=sharding.AdaptiveLimiter(pps=0))
+                             .run_targets(ip_hosts))
+    finally:
+        srv.close()
+    host_ips = {h: [ip] for ip, hs in ip_hosts.items() for h in hs}
+    out = sharding.merge_results(host_ips, {}, parts, ports)
+    assert len(parts) == 3
+    assert sorted(out["open_ports"]) == sorted(single["open_ports"]) == sorted(
+        (hs[0], ip, open_port) for ip, hs in ip_hosts.items())
+    assert out["metrics"]["tcp"]["attempts"] == single["metrics"]["tcp"]["attempts"] == 16
+    assert len(out["metrics"]["shards"]) == 3
+
+
+def test_scan_domain_sharded_mode(monkeypatch):
+    async def fake_subs(domain):
+        for h in ["a.example.com", "b.example.com", "c.example.com"]:
+            yield h
+
+    monkeypatch.setattr(scanner, "iter_crtsh_subdomains", fake_subs)
+    monkeypatch.setitem(scanner.PORT_PROFILES, "test", [_closed_port()])
+    r = FakeResolver({"a.example.com": ["127.0.0.1"], "b.example.com": ["127.0.0.1"],
+                      "c.example.com": ["127.0.0.2"]})
+    out = asyncio.run(scanner.scan_domain("example.com", resolver=r, profile="test", shards=2))
+    assert out["host_ips"] == {"a.example.com": ["127.0.0.1"], "b.example.com": ["127.0.0.1"],
+                               "c.example.com": ["127.0.0.2"]}
+    assert out["open_ports"] == []
+    assert out["metrics"]["dedupe"] == {"host_ip_pairs": 3, "unique_ips": 2, "connects_saved": 1}
+
+
+def test_cancel_terminates_shards_without_blocking_the_loop():
+    ip_hosts = {f"127.0.0.{i}": [f"h{i}.example.com"] for i in range(1, 5)}
+    ports = [_closed_port()] * 200  # at 5 connects/s per shard this would run for ~80 s
+
+    async def run():
+        task = asyncio.create_task(sharding.scan_targets(ip_hosts, ports, 2, limiter_kwargs={"pps": 5}))
+        await asyncio.sleep(1.0)  # shards spawned and probing
+        t = time.monotonic()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return time.monotonic() - t
+
+    before = {p.pid for p in multiprocessing.active_children()}
+    assert asyncio.run(run()) < 1.0  # not waiting for the shards to finish their ports
+    assert not [p for p in multiprocessing.active_children() if p.pid not in before]
+
+
+def test_sharded_scan_forwards_open_ports_and_progress():
+    srv = _listener()
+    opened, progress = [], []
+    try:
+        open_port = srv.getsockname()[1]
+        ip_hosts = {f"127.0.0.{i}": [f"h{i}.example.com"] for i in range(1, 9)}
+        parts = asyncio.run(sharding.scan_targets(ip_hosts, [open_port, _closed_port()], 3,
+                                                  limiter_kwargs={"pps": 0}, on_progress=progress.append,
+                                                  on_open=lambda ip, port: opened.append((ip, port))))
+    finally:
+        srv.close()
+    assert sorted(opened) == sorted((ip, open_port) for ip in ip_hosts)
+    assert sum(len(r["open_ports"]) for r in parts) == 8
+    assert progress and progress[-1]["ports_total"] == 16 and progress[-1]["ports_probed"] == 16
+
+
+def test_probing_starts_before_resolution_finishes(monkeypatch):
+    srv = _listener()
+    events = []
+
+    class SlowResolver:
+        async def resolve(self, host):
+            if host.startswith("slow"):
+                await asyncio.sleep(3)
+                events.append("slow resolved")
+                return ["127.0.0.2"], []
+            return ["127.0.0.1"], []
+
+    async def fake_subs(domain):
+        for h in ["fast.example.com", "slow.example.com"]:
+            yield h
+
+    try:
+        monkeypatch.setattr(scanner, "iter_crtsh_subdomains", fake_subs)
+        monkeypatch.setitem(scanner.PORT_PROFILES, "test", [srv.getsockname()[1]])
+        out = asyncio.run(scanner.scan_domain("example.com", resolver=SlowResolver(), profile="test", shards=2,
+                                              on_open=lambda ip, port: events.append(ip)))
+    finally:
+        srv.close()
+    assert events.index("127.0.0.1") < events.index("slow resolved") < events.index("127.0.0.2")
+    assert len(out["open_ports"]) == 2
@@ -0,0 +1,240 @@
+import asyncio, multiprocessing
+from fastapi.testclient import TestClient
+from app import db, main, scanner, worker
+from app.storage import SQLiteStorage
+
+OUT = {"host_ips": {"www.example.com": ["1.1.1.1"]},
+       "open_ports": [("www.example.com", "1.1.1.1", 3389)], "fingerprints": {}}
+
+
+def _setup(tmp_path, monkeypatch, scan=None):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "queue.db"))
+    calls = []
+
+    async def fake_scan(domain, **kwargs):
+        calls.append((domain, kwargs.get("profile")))
+        return await scan() if scan else OUT
+
+    monkeypatch.setattr(scanner, "scan_domain", fake_scan)
+    return calls
+
+
+def test_api_only_enqueues(tmp_path, monkeypatch):
+    calls = _setup(tmp_path, monkeypatch)
+    with TestClient(main.app) as client:
+        client.post("/org/scope", json={"kind": "domain", "value": "example.com"})
+        r = client.post("/scan", json={"domain": "example.com", "profile": "quick"})
+        assert r.json()["status"] == "queued"
+        scan = client.get(f"/scans/{r.json()['scan_id']}").json()["scan"]
+    assert calls == []
+    assert (scan["status"], scan["profile"], scan["attempts"]) == ("queued", "quick", 0)
+
+
+def _worker_process(path, worker_id):
+    # Runs in a spawned process: a separate SQLite connection and asyncio write lock.
+    db.DB_PATH = path
+    banners = {f"www.example.com|1.1.1.1|{p}": "SSH-2.0-OpenSSH_9.6" for p in range(2000, 2299)}
+
+    async def fake_scan(domain, **kwargs):
+        return {**OUT, "ssh": banners}
+
+    scanner.scan_domain = fake_scan
+
+    async def run():
+        w = worker.Worker(SQLiteStorage(), concurrency=2, poll=0.01, worker_id=worker_id)
+        stop = asyncio.Event()
+        task = asyncio.create_task(w.run(stop))
+        while await db.list_active_scans():
+            await asyncio.sleep(0.05)
+        stop.set()
+        await task
+        await db.close_pool()
+
+    asyncio.run(run())
+
+
+def test_worker_processes_share_the_database(tmp_path, monkeypatch):
+    path = str(tmp_path / "queue.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    monkeypatch.setenv("SMBSEC_DB_FLUSH_ROWS", "5")  # many small write transactions from both processes
+
+    async def enqueue():
+        await db.init_db()
+        ids = [await db.enqueue_scan("example.com", "quick") for _ in range(6)]
+        await db.close_pool()
+        return ids
+
+    ids = asyncio.run(enqueue())
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker_process, args=(path, f"w{i}")) for i in range(2)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+
+    async def results():
+        scans = [await db.get_scan(i) for i in ids]
+        counts = [len(await db.list_findings(i)) for i in ids]
+        await db.close_pool()
+        return scans, counts
+
+    scans, counts = asyncio.run(results())
+    assert [p.exitcode for p in procs] == [0, 0]
+    assert [s["status"] for s in scans] == ["done"] * 6, [s["stats_json"] for s in scans]
+    assert all(s["attempts"] == 1 and s["lease_owner"] is None for s in scans)
+    assert counts == [300] * 6  # the RDP finding plus one per banner
+
+
+def test_expired_lease_is_retried_from_scratch(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.enqueue_scan("example.com")
+        # A worker that died mid-scan: leased, wrote a partial finding, never heartbeat.
+        assert (await db.lease_scan("dead", lease=-1))["id"] == scan_id
+        await db.add_finding(scan_id, "stale", None, 1, "tcp", "low", "t", "d", {})
+        job = await db.lease_scan("alive", lease=60)
+        assert job["attempts"] == 2
+        assert not await db.heartbeat_scan(scan_id, "dead", 60)
+        await worker.Worker(SQLiteStorage(), worker_id="alive").run_job(job)
+        scan, findings = await db.get_scan(scan_id), await db.list_findings(scan_id)
+        await db.close_pool()
+        return scan, findings
+
+    scan, findings = asyncio.run(run())
+    assert scan["status"] == "done"
+    assert [f["host"] for f in findings] == ["www.example.com"]
+
+
+def test_scan_fails_after_max_attempts(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(db, "MAX_ATTEMPTS", 2)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.enqueue_scan("example.com")
+        assert await db.lease_scan("a", lease=-1)
+        assert await db.lease_scan("b", lease=-1)
+        assert await db.lease_scan("c", lease=60) is None
+        scan = await db.get_scan(scan_id)
+        await db.close_pool()
+        return scan
+
+    scan = asyncio.run(run())
+    assert scan["status"] == "error" and "worker lost" in scan["stats_json"]
+
+
+def test_lost_lease_cancels_the_scan(tmp_path, monkeypatch):
+
+    async def slow():
+        await asyncio.sleep(30)
+
+    _setup(tmp_path, monkeypatch, scan=slow)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.enqueue_scan("example.com")
+        job = await db.lease_scan("w", lease=0.05)
+        # Someone else took the scan over.
+        async with db.writer() as conn:
+            await conn.execute("UPDATE scans SET lease_owner='other' WHERE id=?", (scan_id,))
+        await asyncio.wait_for(worker.Worker(SQLiteStorage(), lease=0.05, worker_id="w").run_job(job), 5)
+        scan = await db.get_scan(scan_id)
+        await db.close_pool()
+        return scan
+
+    scan = asyncio.run(run())
+    assert scan["status"] == "running" and scan["lease_owner"] == "other"
+
+
+def _slow_scan(monkeypatch):
+    async def slow(domain, on_progress=None, **kwargs):
+        on_progress({"ports_total": 10, "ports_probed": 5})
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(scanner, "scan_domain", slow)
+
+
+def test_cancel_stops_a_running_scan_and_keeps_its_progress(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    _slow_scan(monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.enqueue_scan("example.com")
+        w = worker.Worker(SQLiteStorage(), worker_id="w", progress_interval=0.01)
+        job = asyncio.create_task(w.run_job(await db.lease_scan("w", lease=60)))
+        while '"ports_probed": 5' not in (await db.get_scan(scan_id))["progress_json"]:
+            await asyncio.sleep(0.01)
+        assert w.progress[scan_id]["ports_probed"] == 5
+        requested = await db.cancel_scan(scan_id)
+        await asyncio.wait_for(job, 5)
+        scan = await db.get_scan(scan_id)
+        await db.close_pool()
+        return requested, scan, w
+
+    requested, scan, w = asyncio.run(run())
+    assert (requested["status"], requested["cancel_requested"]) == ("running", 1)
+    assert scan["status"] == "cancelled" and scan["lease_owner"] is None
+    assert '"ports_probed": 5' in scan["progress_json"]
+    assert w.progress == {}
+
+
+def test_cancel_finishes_a_scan_run_without_a_worker(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.create_scan("aws")  # running in the request, no lease
+        cancelled = await db.cancel_scan(scan_id)
+        await db.finish_scan(scan_id, "done", {"count": 1})
+        scan = await db.get_scan(scan_id)
+        await db.close_pool()
+        return cancelled, scan
+
+    cancelled, scan = asyncio.run(run())
+    assert cancelled["status"] == "cancelled" and cancelled["finished_at"]
+    assert scan["status"] == "cancelled"
+
+
+def test_time_limit_fails_the_scan(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    _slow_scan(monkeypatch)
+
+    async def run():
+        await db.init_db()
+        scan_id = await db.enqueue_scan("example.com", time_limit=0.05)
+        job = await db.lease_scan("w", lease=60)
+        await asyncio.wait_for(worker.Worker(SQLiteStorage(), worker_id="w").run_job(job), 5)
+        scan = await db.get_scan(scan_id)
+        await db.close_pool()
+        return scan
+
+    scan = asyncio.run(run())
+    assert scan["status"] == "error" and "time limit" in scan["stats_json"]
+
+
+def test_api_cancel_and_progress(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    async def seed():
+        await db.init_db()
+        done = await db.enqueue_scan("example.com")
+        await db.finish_scan(done, "done", {}, {"ports_probed": 3})
+        await db.close_pool()
+        return done
+
+    done = asyncio.run(seed())
+    with TestClient(main.app) as client:
+        client.post("/org/scope", json={"kind": "domain", "value": "example.com"})
+        assert client.post("/scan", json={"domain": "example.com", "time_limit": 0}).status_code == 400
+        queued = client.post("/scan", json={"domain": "example.com", "time_limit": 30}).json()["scan_id"]
+        assert client.delete(f"/scans/{queued}").json() == {"scan_id": queued, "status": "cancelled"}
+        assert client.delete(f"/scans/{queued}").status_code == 200
+        assert client.delete(f"/scans/{done}").status_code == 409
+        assert client.delete("/scans/999").status_code == 404
+        progress = client.get(f"/scans/{done}/progress").json()
+        scan = client.get(f"/scans/{queued}").json()["scan"]
+    assert progress["status"] == "done" and progress["progress"] == {"ports_probed": 3}
+    assert (scan["status"], scan["time_limit"]) == ("cancelled", 30)